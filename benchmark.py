@@ -0,0 +1,268 @@
+##############################################################################
+# Benchmark of every analysis stage on synthetic RD53 chip data
+# Usage: python3 benchmark.py [-chips 4] [-repeat 5] [-stages config,classification,...] [-history results_bench/history.jsonl] [-check]
+# Synthetic chips (432 x 336) with realistic hits, threshold, noise, ToT, PixelAlive efficiencies and txt configs
+# (same missing bumps in every method) are generated in a temporary folder, then each stage is timed separately:
+#   extraction (root -> numpy; without PyROOT the uproot backend reads input/ instead), extraction_cached
+#   (map cache hits), config (txt parsing), classification, dispersion (threshold/noise gaussian fits), frbias,
+#   xtalk, overlap (comparison of the 3 methods), clusters (connected components of the missing bumps) and
+#   plotting (xray plots). startup times 'python3 xray.py --help' (imports only), and the modules of every
+#   script are imported once to check that ROOT, matplotlib and scipy stay unloaded.
+# Output: table with best/median time, chips/s and peak memory per stage, appended as one json line to the history file.
+# The last run with the same # of chips is the reference: stages slower by more than -tolerance are reported
+# as regressions (exit code 1 with -check).
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+##############################################################################
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import tempfile
+import glob
+import subprocess
+import tracemalloc
+import numpy as np
+
+num_rows = 336; num_cols = 432
+STAGES = ['startup', 'extraction', 'extraction_cached', 'config', 'classification', 'dispersion', 'frbias', 'xtalk', 'overlap', 'clusters', 'plotting']
+HISTORY = 'results_bench/history.jsonl'
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+# Heavy dependencies that must only be imported by the stages needing them, and the modules checked for it
+HEAVY_MODULES = ['ROOT', 'matplotlib', 'scipy', 'mplhep']
+MODULES = ['xray', 'xraybatch', 'pipeline', 'xtalk', 'frbias', 'thrsweep', 'gaussfit', 'histcomparison', 'resultstore', 'rootextract',
+           'mapcache', 'txtconfig', 'classify', 'xrayplots', 'instrument', 'pixeldb', 'report', 'watcher']
+
+# Synthetic maps of one chip, (rows, cols). The missing bumps are the same for xray, xtalk and frbias
+def SyntheticChip(rng,missing_frac=0.01,low_occ_frac=0.005,masked_frac=0.002,mean_hits=5000):
+    shape = (num_rows, num_cols)
+    missing = rng.random(shape) < missing_frac
+    low_occ = ~missing & (rng.random(shape) < low_occ_frac)
+    enable = (rng.random(shape) >= masked_frac).astype(np.uint8)
+    hits = rng.poisson(mean_hits, shape).astype(np.float32)
+    hits[low_occ] = rng.poisson(mean_hits/20, np.count_nonzero(low_occ))
+    hits[missing] = 0
+    thr = rng.normal(300, 20, shape).astype(np.float32)
+    noise = rng.normal(8, 1, shape).astype(np.float32)
+    # Reverse bias: threshold and noise change for the connected bumps only
+    rv_thr = thr + np.where(missing, rng.normal(0, 0.1, shape), rng.normal(15, 3, shape)).astype(np.float32)
+    rv_noise = noise + np.where(missing, rng.normal(0, 0.1, shape), rng.normal(2, 0.5, shape)).astype(np.float32)
+    pa1 = np.clip(rng.normal(0.99, 0.01, shape), 0, 1).astype(np.float32)
+    pa5 = np.where(missing, rng.uniform(0, 0.2, shape), rng.uniform(0.8, 1, shape)).astype(np.float32)
+    pa6 = np.where(missing, rng.uniform(0, 0.1, shape), rng.uniform(0.6, 1, shape)).astype(np.float32)
+    return {'Enable': enable, 'TDAC': rng.integers(0, 32, shape).astype(np.int8), 'Hits': hits,
+            'Threshold2D': thr, 'Noise2D': noise, 'ToT2D': rng.normal(6, 1, shape).astype(np.float32),
+            'Threshold2D_RV': rv_thr, 'Noise2D_RV': rv_noise, 'PA1': pa1, 'PA5': pa5, 'PA6': pa6}
+
+# Writes a chip configuration txt file with the Ph2_ACF pixel section layout (one COL section per column)
+def WriteSyntheticTxt(file_path,enable,tdac):
+    with open(file_path, 'w') as file:
+        file.write('PIXELCONFIGURATION\n\n')
+        for col in range(num_cols):
+            file.write('COL                  '+str(col).zfill(3)+'\n')
+            file.write('ENABLE '+','.join(map(str, enable[:,col]))+'\n')
+            file.write('HITBUS '+','.join(map(str, enable[:,col]))+'\n')
+            file.write('INJEN  '+','.join(['0']*num_rows)+'\n')
+            file.write('TDAC   '+','.join(map(str, tdac[:,col]))+'\n\n')
+
+# Writes the scans of several chips to a root file with the Ph2_ACF layout (one TCanvas per scan per chip)
+def WriteSyntheticRoot(file_path,chips,scans):
+    from rootextract import Root, NumpyToTH2, Ph2_ACFHistName, Ph2_ACFHistPath
+    ROOT = Root()
+    output_file = ROOT.TFile(file_path, "RECREATE")
+    for chipID,maps in chips.items():
+        for Scan_n,key in scans.items():
+            path = Ph2_ACFHistPath(Scan_n,chipID)
+            directory = output_file.GetDirectory(os.path.dirname(path)) or output_file.mkdir(os.path.dirname(path), "", True)
+            directory.cd()
+            hist = NumpyToTH2(maps[key], Ph2_ACFHistName(Scan_n,chipID))
+            canvas = ROOT.TCanvas(os.path.basename(path), os.path.basename(path))
+            hist.Draw("COLZ")
+            canvas.Write()
+            canvas.Close()
+    output_file.Close()
+
+# Runs fn once under tracemalloc (peak of the python/numpy allocations), then times it repeat times
+def TimeStage(fn,repeat):
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter()-start)
+    return {'best_s': min(times), 'median_s': float(np.median(times)), 'peak_mb': peak/1024/1024}
+
+# Heavy modules loaded by just importing the analysis modules (should be empty)
+def HeavyImports():
+    code = 'import sys\nimport '+', '.join(MODULES)+'\nprint(",".join(m for m in '+repr(HEAVY_MODULES)+' if m in sys.modules))'
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, cwd=SCRIPT_DIR)
+    if result.returncode != 0: return ['import failed: '+result.stderr.strip().splitlines()[-1]]
+    return [name for name in result.stdout.strip().split(',') if name]
+
+# Builds the function of every stage for the synthetic chips and the # of chips each stage processes.
+# Stages that cannot run here return the reason instead
+def StageFunctions(chips,workdir,plotset,dpi):
+    stages = {}; counts = {stage: len(chips) for stage in STAGES if stage != 'startup'}
+    stages['startup'] = lambda: subprocess.run([sys.executable, os.path.join(SCRIPT_DIR, 'xray.py'), '--help'], capture_output=True, check=True)
+    txt_files = {}
+    for chipID,maps in chips.items():
+        txt_files[chipID] = os.path.join(workdir, 'CMSIT_RD53_SYNTH_0_'+str(chipID)+'.txt')
+        WriteSyntheticTxt(txt_files[chipID], maps['Enable'], maps['TDAC'])
+
+    from rootextract import ExtractModuleMaps
+    try:
+        root_file = os.path.join(workdir, 'Run000000_SCurve.root')
+        WriteSyntheticRoot(root_file, chips, {'Threshold2D': 'Threshold2D', 'Noise2D': 'Noise2D', 'ToT2D': 'ToT2D'})
+        scans = {'Threshold2D':'2D','Noise2D':'2D','ToT2D':'2D'}
+    except ImportError:
+        # Without PyROOT the canvases cannot be written: the uproot backend reads the first PixelAlive file of input/ instead
+        inputs = sorted(glob.glob(os.path.join(SCRIPT_DIR, 'input', '*_PixelAlive.root')))
+        root_file = inputs[0] if inputs else None
+        scans = {'PixelAlive':'2D','ToT2D':'2D'}
+    if root_file:
+        extraction_chips = list(ExtractModuleMaps(root_file, {}, None, cache=False))
+        stages['extraction'] = lambda: ExtractModuleMaps(root_file, scans, extraction_chips, cache=False)
+        stages['extraction_cached'] = lambda: ExtractModuleMaps(root_file, scans, extraction_chips, cache=True)
+        counts['extraction'] = counts['extraction_cached'] = len(extraction_chips)
+    else:
+        stages['extraction'] = stages['extraction_cached'] = 'no ROOT to write the synthetic file and no input file'
+
+    from txtconfig import ParseChipConfig
+    stages['config'] = lambda: [ParseChipConfig(txt_file, use_cache=False) for txt_file in txt_files.values()]
+
+    from classify import ClassifyMissing, SummarizeStatus
+    stages['classification'] = lambda: [SummarizeStatus(ClassifyMissing(maps['Hits'], maps['Enable'], 1, 1000)) for maps in chips.values()]
+
+    from gaussfit import DispersionSummary
+    thr_maps = np.stack([maps['Threshold2D'] for maps in chips.values()]); noise_maps = np.stack([maps['Noise2D'] for maps in chips.values()])
+    stages['dispersion'] = lambda: DispersionSummary(thr_maps, noise_maps)
+
+    from frbias import FRBiasAnalysis
+    stages['frbias'] = lambda: [FRBiasAnalysis(maps['Threshold2D'], maps['Noise2D'], maps['Threshold2D_RV'], maps['Noise2D_RV'])
+                                for maps in chips.values()]
+
+    from xtalk import XTalkAnalysis
+    stages['xtalk'] = lambda: [XTalkAnalysis(maps['PA1'], maps['PA5'], maps['PA6']) for maps in chips.values()]
+
+    from histcomparison import compare_methods
+    from resultstore import MissingMask
+    from xtalk import CONFIRMED
+    missing_maps = {chipID: {'xray': MissingMask(ClassifyMissing(maps['Hits'], maps['Enable'], 1, 1000)),
+                             'xtalk': XTalkAnalysis(maps['PA1'], maps['PA5'], maps['PA6']) == CONFIRMED,
+                             'frbias': FRBiasAnalysis(maps['Threshold2D'], maps['Noise2D'], maps['Threshold2D_RV'], maps['Noise2D_RV'])[2]}
+                    for chipID,maps in chips.items()}
+    stages['overlap'] = lambda: [compare_methods(maps) for maps in missing_maps.values()]
+
+    from clusters import ClusterReport
+    status_maps = [ClassifyMissing(maps['Hits'], maps['Enable'], 1, 1000) for maps in chips.values()]
+    stages['clusters'] = lambda: [ClusterReport(status, include_low_occ=True) for status in status_maps]
+
+    try:
+        import matplotlib
+        from argparse import Namespace
+        from xrayplots import PlotBundle, RenderPlots
+        bundles = []
+        for chipID,maps in chips.items():
+            cfg = Namespace(Path=os.path.join(workdir,'plots',''), Sensor='SYNTH', Voltage_1='80', chipID=str(chipID), Thr=1, Thr_strange=1000, V_adc=800)
+            status = ClassifyMissing(maps['Hits'], maps['Enable'], 1, 1000)
+            summary = SummarizeStatus(status)
+            bundles.append(PlotBundle(cfg, maps['ToT2D'], maps['Noise2D'], maps['Threshold2D'], maps['Hits'], status, maps['ToT2D'],
+                                      summary['missing'], summary['low_occ'], summary['perc_missing'], summary['perc_low_occ'], summary['disabled'], 0))
+        stages['plotting'] = lambda: [RenderPlots(bundle, plotset, dpi) for bundle in bundles]
+    except ImportError as error:
+        stages['plotting'] = 'no matplotlib ('+str(error)+')'
+    return stages, counts
+
+def GitCommit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+                              cwd=SCRIPT_DIR).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+# Last run of the history with the same # of chips, plot set and root backend (None if there is none)
+def Reference(history_path,nchips,plotset,backend):
+    if not os.path.exists(history_path): return None
+    reference = None
+    with open(history_path) as file:
+        for line in file:
+            if not line.strip(): continue
+            record = json.loads(line)
+            if record['nchips'] == nchips and record.get('plotset') == plotset and record.get('backend') == backend: reference = record
+    return reference
+
+# Prints the results (+ change with respect to the reference) and returns the stages slower than tolerance
+def Report(record,reference,tolerance):
+    regressions = []
+    print('{:<20}{:>12}{:>12}{:>12}{:>12}{:>10}'.format('stage', 'best [ms]', 'median [ms]', 'chips/s', 'peak [MB]', 'change'))
+    for stage,result in record['stages'].items():
+        if 'skipped' in result:
+            print('{:<20}skipped: {}'.format(stage, result['skipped'])); continue
+        change = ''
+        ref = (reference or {}).get('stages', {}).get(stage, {})
+        if 'best_s' in ref:
+            ratio = result['best_s']/ref['best_s']-1
+            change = '{:+.0%}'.format(ratio)
+            if ratio > tolerance: regressions.append(stage); change += ' !'
+        chips_per_s = '{:.1f}'.format(result['chips_per_s']) if 'chips_per_s' in result else '-'
+        print('{:<20}{:>12.2f}{:>12.2f}{:>12}{:>12.1f}{:>10}'.format(stage, result['best_s']*1000, result['median_s']*1000,
+                                                                     chips_per_s, result['peak_mb'], change))
+    if record['heavy_imports']: print('Heavy modules loaded at import: '+', '.join(record['heavy_imports']))
+    if reference: print('Reference: '+reference['date']+' (commit '+str(reference.get('commit'))+')')
+    if regressions: print('Regressions (> {:.0%} slower): '.format(tolerance)+', '.join(regressions))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the analysis stages on synthetic chip data')
+    parser.add_argument('-chips','--chips', help = 'The number of synthetic chips (1 single, 2 dual, 4 quad module, ...)',  default = 4, type = int)
+    parser.add_argument('-repeat','--repeat', help = 'The number of timed runs of each stage',                             default = 5, type = int)
+    parser.add_argument('-stages','--stages', help = 'The stages to run, comma separated (default: all)',                  default = ','.join(STAGES), type = str)
+    parser.add_argument('-plots','--plots', help = 'The set of xray plots of the plotting stage',                          default = 'summary', choices = ['full','summary'])
+    parser.add_argument('-dpi','--dpi', help = 'The resolution of the png plots',                                          default = 100, type = int)
+    parser.add_argument('-backend','--backend', help = 'The root file backend (default: PIXELMAP_BACKEND or auto)',       default = None, choices = ['auto','root','uproot'])
+    parser.add_argument('-seed','--seed', help = 'The seed of the synthetic data',                                         default = 1, type = int)
+    parser.add_argument('-history','--history', help = 'The history file (json lines) the results are appended to',        default = HISTORY, type = str)
+    parser.add_argument('-nosave','--nosave', help = 'Do not append the results to the history file',                      action = 'store_true')
+    parser.add_argument('-tolerance','--tolerance', help = 'Slowdown (fraction) with respect to the last run reported as regression', default = 0.2, type = float)
+    parser.add_argument('-check','--check', help = 'Exit with code 1 if a stage regressed',                               action = 'store_true')
+    args = parser.parse_args()
+
+    selected = args.stages.split(',')
+    unknown = [stage for stage in selected if stage not in STAGES]
+    if unknown: parser.error('unknown stage(s) '+', '.join(unknown)+' (choose from '+', '.join(STAGES)+')')
+
+    workdir = tempfile.mkdtemp(prefix='pixelmap_bench_')
+    os.environ['PIXELMAP_CACHE'] = os.path.join(workdir, 'cache') # before mapcache/txtconfig are imported
+    from rootextract import Backend, SetBackend
+    try:
+        rng = np.random.default_rng(args.seed)
+        chips = {12+i: SyntheticChip(rng) for i in range(args.chips)}
+        if args.backend: SetBackend(args.backend)
+        stages, counts = StageFunctions(chips, workdir, args.plots, args.dpi)
+        record = {'date': time.strftime('%Y-%m-%d %H:%M:%S'), 'commit': GitCommit(), 'nchips': args.chips, 'repeat': args.repeat,
+                  'plotset': args.plots, 'python': platform.python_version(), 'numpy': np.__version__,
+                  'backend': Backend(), 'heavy_imports': HeavyImports(), 'stages': {}}
+        for stage in selected:
+            if isinstance(stages[stage], str):
+                record['stages'][stage] = {'skipped': stages[stage]}; continue
+            result = TimeStage(stages[stage], args.repeat)
+            if stage in counts: result['chips_per_s'] = counts[stage]/result['best_s']
+            record['stages'][stage] = result
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    regressions = Report(record, Reference(args.history, args.chips, args.plots, record['backend']), args.tolerance)
+    if not args.nosave:
+        if os.path.dirname(args.history): os.makedirs(os.path.dirname(args.history), exist_ok=True)
+        with open(args.history, 'a') as file: file.write(json.dumps(record)+'\n')
+        print('Results appended to '+args.history)
+    if args.check and regressions: sys.exit(1)
+
+if __name__ == "__main__":
+    main()
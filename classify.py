@@ -0,0 +1,65 @@
+##############################################################################
+# Missing bumps classification of the X-Ray occupancy maps
+# Usage: from classify import ClassifyMissing, CountStatus
+#        status = ClassifyMissing(Data, Enable, Thr, Thr_strange); counts = CountStatus(status)
+# The status map is one int8 per pixel with the same codes as the final matrix of xray.py:
+#   -1 = LOW OCC (STRANGE), 0 = MASKED, 1 = MISSING, 2 = ERRORS (masked but with hits), 3 = GOOD
+# Data/Enable can also be stacks of chips (nchips, rows, cols), CountStatus then counts each chip.
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+##############################################################################
+import numpy as np
+
+LOW_OCC = -1; MASKED = 0; MISSING = 1; ERRORS = 2; GOOD = 3
+STATUS_NAMES = {LOW_OCC: 'low_occ', MASKED: 'masked', MISSING: 'missing', ERRORS: 'errors', GOOD: 'good'}
+_OFFSET = -LOW_OCC; _NSTATUS = len(STATUS_NAMES)
+
+# Builds the status map in one vectorized pass: enabled + 2*(hits >= Thr), then the enabled pixels
+# with Thr <= hits < Thr_strange become LOW OCC. Data is the # of hits per pixel, Enable the mask from the txt file
+def ClassifyMissing(Data,Enable,Thr,Thr_strange,out=None):
+    enabled = Enable.astype(bool, copy=False)
+    hit = Data >= Thr
+    status = np.empty(Data.shape, dtype=np.int8) if out is None else out
+    np.add(enabled, hit, out=status, dtype=np.int8)
+    status += hit
+    low_occ = Data < Thr_strange
+    low_occ &= hit; low_occ &= enabled
+    status[low_occ] = LOW_OCC
+    return status
+
+# Counts the pixels of each category with a single bincount ({name: count}, or {name: array of counts per chip} for a stack)
+def CountStatus(status):
+    codes = status.reshape(-1, status.shape[-2]*status.shape[-1]) if status.ndim == 3 else status.reshape(1,-1)
+    index = codes.astype(np.intp) + _OFFSET
+    index += np.arange(codes.shape[0], dtype=np.intp)[:,None]*_NSTATUS
+    counts = np.bincount(index.ravel(), minlength=codes.shape[0]*_NSTATUS).reshape(-1,_NSTATUS)
+    if status.ndim != 3: return {name: int(counts[0,code+_OFFSET]) for code,name in STATUS_NAMES.items()}
+    return {name: counts[:,code+_OFFSET] for code,name in STATUS_NAMES.items()}
+
+# Summary numbers of xray.py: counts + % of missing and low occ bumps over the pixels enabled in the txt file
+def SummarizeStatus(status):
+    counts = CountStatus(status)
+    total = status.shape[-2]*status.shape[-1]
+    enabled = total - (counts['masked'] + counts['errors'])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        perc_missing = np.round(np.divide(counts['missing'], enabled, dtype=np.float64)*100, 4)
+        perc_low_occ = np.round(np.divide(counts['low_occ'], enabled, dtype=np.float64)*100, 4)
+    if status.ndim != 3: perc_missing = float(perc_missing); perc_low_occ = float(perc_low_occ)
+    counts['perc_missing'] = perc_missing; counts['perc_low_occ'] = perc_low_occ
+    counts['disabled'] = total - enabled
+    return counts
+
+# Missing/low occ counts for a whole range of thresholds from one sorted copy of the enabled pixels:
+# # of enabled pixels with hits < T is a searchsorted in the sorted hits, so every threshold costs O(log N).
+# Missing(T) = #(hits < T), LowOcc(T) = #(T <= hits < Thr_strange) = #(hits < Thr_strange) - #(hits < T)
+def SweepThresholds(Data,Enable,thresholds,Thr_strange):
+    hits = np.sort(Data[Enable.astype(bool, copy=False)], axis=None)
+    thresholds = np.asarray(thresholds)
+    below = np.searchsorted(hits, thresholds, side='left')
+    below_strange = np.searchsorted(hits, Thr_strange, side='left')
+    missing = below
+    low_occ = np.clip(below_strange - below, 0, None)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        perc_missing = np.round(np.divide(missing, hits.size, dtype=np.float64)*100, 4)
+        perc_low_occ = np.round(np.divide(low_occ, hits.size, dtype=np.float64)*100, 4)
+    return {'thr': thresholds, 'missing': missing, 'perc_missing': perc_missing, 'low_occ': low_occ, 'perc_low_occ': perc_low_occ}
@@ -0,0 +1,111 @@
+##############################################################################
+# Connected components (clusters) of the missing bumps of a status map
+# Usage: from clusters import ClusterReport, PrintClusterReport
+#        PrintClusterReport(ClusterReport(status, include_low_occ=True))
+#        python3 clusters.py -store results_store -module RH0026 -chip 12 [-method xray] [-low_occ] [-csv clusters.csv]
+# Missing (and optionally low occupancy) pixels touching each other (8 neighbours by default) form a cluster.
+# For every cluster: size, # of missing/low occ pixels, bounding box and centroid (rows, cols), all from
+# one labelling pass and bincounts. Per row, per column and per core (8x8 pixels) counts give the structure of the chip.
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+##############################################################################
+import csv
+import argparse
+import numpy as np
+
+MISSING = 1; LOW_OCC = -1 # codes of classify.py (MISSING is also CONFIRMED in xtalk.py)
+CORE_SIZE = 8 # RD53 cores are 8x8 pixels
+
+# Labels the connected components of a boolean map. Returns (labels, # of clusters)
+def LabelClusters(mask,connectivity=8):
+    from scipy import ndimage
+    structure = np.ones((3,3), dtype=bool) if connectivity == 8 else ndimage.generate_binary_structure(2,1)
+    return ndimage.label(mask, structure=structure)
+
+# Properties of every cluster as arrays (index i = cluster i+1): size, missing, low_occ, bounding box and centroid
+def ClusterTable(status,labels,nclusters):
+    from scipy import ndimage
+    flat = labels.ravel()
+    rows, cols = np.indices(labels.shape)
+    size = np.bincount(flat, minlength=nclusters+1)[1:]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        table = {'cluster': np.arange(1, nclusters+1), 'size': size,
+                 'missing': np.bincount(flat, weights=(status == MISSING).ravel(), minlength=nclusters+1)[1:].astype(np.int64),
+                 'low_occ': np.bincount(flat, weights=(status == LOW_OCC).ravel(), minlength=nclusters+1)[1:].astype(np.int64),
+                 'row_centroid': np.bincount(flat, weights=rows.ravel(), minlength=nclusters+1)[1:]/size,
+                 'col_centroid': np.bincount(flat, weights=cols.ravel(), minlength=nclusters+1)[1:]/size}
+    boxes = ndimage.find_objects(labels, nclusters)
+    table['row_min'] = np.array([box[0].start for box in boxes], dtype=np.int64); table['row_max'] = np.array([box[0].stop-1 for box in boxes], dtype=np.int64)
+    table['col_min'] = np.array([box[1].start for box in boxes], dtype=np.int64); table['col_max'] = np.array([box[1].stop-1 for box in boxes], dtype=np.int64)
+    return table
+
+# Number of flagged pixels in every core ((rows/8, cols/8) array)
+def CoreCounts(mask,core_size=CORE_SIZE):
+    num_rows, num_cols = mask.shape
+    return mask.reshape(num_rows//core_size, core_size, num_cols//core_size, core_size).sum(axis=(1,3))
+
+# Clusters + row/column/core summaries of the missing bumps of a status map
+def ClusterReport(status,include_low_occ=False,connectivity=8):
+    status = np.asarray(status)
+    mask = (status == MISSING) | (status == LOW_OCC) if include_low_occ else status == MISSING
+    labels, nclusters = LabelClusters(mask,connectivity)
+    table = ClusterTable(status,labels,nclusters)
+    return {'pixels': int(np.count_nonzero(mask)), 'clusters': nclusters, 'table': table, 'labels': labels,
+            'isolated': int(np.count_nonzero(table['size'] == 1)), 'largest': int(table['size'].max()) if nclusters else 0,
+            'size_counts': np.bincount(table['size']) if nclusters else np.zeros(1, dtype=np.int64),
+            'per_row': np.count_nonzero(mask, axis=1), 'per_col': np.count_nonzero(mask, axis=0), 'per_core': CoreCounts(mask)}
+
+# Index and value of the n largest entries of an array (cores as (core row, core col))
+def _Worst(counts,n):
+    order = np.argsort(counts, axis=None, kind='stable')[::-1][:n]
+    order = order[counts.ravel()[order] > 0]
+    index = order if counts.ndim == 1 else list(zip(*np.unravel_index(order, counts.shape)))
+    return [(i if counts.ndim == 1 else tuple(int(x) for x in i), int(counts.ravel()[o])) for i,o in zip(index, order)]
+
+# Compact text report: totals, size distribution, largest clusters and worst rows/columns/cores
+def PrintClusterReport(report,top=10,title='Missing bumps'):
+    table = report['table']
+    print(title+': '+str(report['pixels'])+' pixels in '+str(report['clusters'])+' clusters ('+str(report['isolated'])+' isolated, largest '+str(report['largest'])+')')
+    if not report['clusters']: return
+    sizes = report['size_counts']
+    print('  cluster size:\t'+'  '.join(str(size)+': '+str(int(count)) for size,count in enumerate(sizes) if count and size <= 5)
+          +('  >5: '+str(int(sizes[6:].sum())) if len(sizes) > 6 else ''))
+    largest = np.argsort(table['size'], kind='stable')[::-1][:top]
+    print('  largest clusters (size, missing, low occ, rows, cols, centroid):')
+    for i in largest:
+        if table['size'][i] < 2: break
+        print('    {:>6} {:>6} {:>6}   rows {:>3}-{:<3} cols {:>3}-{:<3} ({:.1f}, {:.1f})'.format(int(table['size'][i]), int(table['missing'][i]), int(table['low_occ'][i]),
+              int(table['row_min'][i]), int(table['row_max'][i]), int(table['col_min'][i]), int(table['col_max'][i]), table['row_centroid'][i], table['col_centroid'][i]))
+    print('  worst rows:\t'+', '.join(str(i)+': '+str(n) for i,n in _Worst(report['per_row'],top)))
+    print('  worst cols:\t'+', '.join(str(i)+': '+str(n) for i,n in _Worst(report['per_col'],top)))
+    print('  worst cores:\t'+', '.join(str(i)+': '+str(n) for i,n in _Worst(report['per_core'],top)))
+
+# Writes the cluster table (one line per cluster) to a csv file
+def WriteClusterTable(report,file_path):
+    table = report['table']
+    with open(file_path, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(list(table))
+        writer.writerows(zip(*[np.round(values, 2) if values.dtype.kind == 'f' else values for values in table.values()]))
+
+def main():
+    from resultstore import LoadResult, STORE_DIR
+    parser = argparse.ArgumentParser(description='Cluster the missing bumps of a stored status map')
+    parser.add_argument('-store','--store', help = 'The result store folder',                                        default = STORE_DIR, type = str)
+    parser.add_argument('-module','--module', help = 'The name of the module',                                       required = True, type = str)
+    parser.add_argument('-chip','--chip', help = 'The ROC ID',                                                       required = True, type = int)
+    parser.add_argument('-method','--method', help = 'The analysis method (xray, xtalk, frbias)',                    default = 'xray', type = str)
+    parser.add_argument('-run','--run', help = 'The run (default: newest result)',                                   default = None, type = str)
+    parser.add_argument('-low_occ','--low_occ', help = 'Cluster the low occupancy bumps too',                         action = 'store_true')
+    parser.add_argument('-connectivity','--connectivity', help = 'Pixel neighbourhood (4 or 8)',                      default = 8, type = int, choices = [4,8])
+    parser.add_argument('-top','--top', help = 'The # of clusters, rows, columns and cores listed',                    default = 10, type = int)
+    parser.add_argument('-csv','--csv', help = 'The csv file of the cluster table (not written if not given)',        default = None, type = str)
+    args = parser.parse_args()
+
+    status, meta = LoadResult(args.store, args.module, args.chip, args.method, args.run)
+    report = ClusterReport(status, args.low_occ, args.connectivity)
+    PrintClusterReport(report, args.top, meta['module']+' chip '+str(meta['chip'])+' '+meta['method']+' '+meta['run'])
+    if args.csv: WriteClusterTable(report, args.csv)
+
+if __name__ == "__main__":
+    main()
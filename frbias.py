@@ -1,74 +1,77 @@
-import ROOT
-ROOT.gROOT.SetBatch(True)
-import math
+##############################################################################
+# Forward/reverse bias comparison to find the missing bumps
+# Input: 2 SCurve root files of the same module, one taken with forward bias and one with reverse bias
+# Usage: python3 frbias.py -forward <forward SCurve> -reverse <reverse SCurve> [-chip <chip#>] -cut <distance cut>
+# Output: root file with delta_thr, delta_ns and missing_map per chip (outputroot/frbias/histograms_chip<chip>.root)
+#         + png of the missing map (results/frbias/)
+# A pixel is missing if its (delta threshold, delta noise) distance between forward and reverse bias is <= cut
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+##############################################################################
+import os
+import argparse
+import numpy as np
+from resultstore import SaveResult, RunName
 
-# CHIP ID, needs to be changed
-chip = "12"
-histdirectory = "Detector/Board_0/OpticalGroup_0/Hybrid_0/Chip_"
-histnameprefix = "/D_B(0)_O(0)_H(0)_"
+# Computes the forward - reverse deltas and the missing map of one chip (all maps are (rows, cols) numpy arrays)
+def FRBiasAnalysis(fw_thr,fw_ns,rv_thr,rv_ns,cut=0.5):
+    delta_thr = np.subtract(fw_thr, rv_thr, dtype=np.float64)
+    delta_ns = np.subtract(fw_ns, rv_ns, dtype=np.float64)
+    missing_map = np.hypot(delta_thr, delta_ns) <= cut
+    return delta_thr, delta_ns, missing_map
 
-forwardroot = ROOT.TFile("Run000044_SCurve_FW.root", "READ")
-reverseroot = ROOT.TFile("Run000043_SCurve.root", "READ")
+# Extracts the threshold and noise maps of all the requested chips from both files (each file is opened once)
+# and runs the analysis of each chip. Returns {chipID: (delta_thr, delta_ns, missing_map)}
+def FRBiasModule(forward_file,reverse_file,chips=None,cut=0.5):
+    from rootextract import ExtractModuleMaps
+    scans = {'Threshold2D':'2D','Noise2D':'2D'}
+    forward = ExtractModuleMaps(forward_file,scans,chips)
+    reverse = ExtractModuleMaps(reverse_file,scans,list(forward))
+    return {chip: FRBiasAnalysis(forward[chip]['Threshold2D'],forward[chip]['Noise2D'],reverse[chip]['Threshold2D'],reverse[chip]['Noise2D'],cut)
+            for chip in forward}
 
-forward_thr_canvas = forwardroot.Get(histdirectory+chip+histnameprefix+"Threshold2D_Chip("+chip+")")
-h_forward_thr = None
-primitives = forward_thr_canvas.GetListOfPrimitives()
-for primitive in primitives:
-    if isinstance(primitive, ROOT.TH2):
-        h_forward_thr = primitive
-        break
+def PlotMissingMap(missing_map,title,file_path):
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    fig = plt.figure()
+    ax = fig.add_subplot(111)
+    ax.imshow(missing_map, origin='lower', cmap='Greys', vmin=0, vmax=1)
+    ax.set_title(title)
+    ax.set_aspect(1)
+    fig.savefig(file_path, format='png', dpi=150)
+    plt.close(fig)
 
-reverse_thr_canvas = reverseroot.Get(histdirectory+chip+histnameprefix+"Threshold2D_Chip("+chip+")")
-h_reverse_thr = None
-primitives = reverse_thr_canvas.GetListOfPrimitives()
-for primitive in primitives:
-    if isinstance(primitive, ROOT.TH2):
-        h_reverse_thr = primitive
-        break
+def main():
+    parser = argparse.ArgumentParser(description='Do the forward/reverse bias analysis')
+    parser.add_argument('-forward','--forward', help = 'The SCurve root file taken with forward bias',               default = 'Run000044_SCurve_FW.root', type = str)
+    parser.add_argument('-reverse','--reverse', help = 'The SCurve root file taken with reverse bias',               default = 'Run000043_SCurve.root', type = str)
+    parser.add_argument('-chip','--chip', help = 'The ROC ID(s), comma separated (default: all chips in the file)',  default = None, type = str)
+    parser.add_argument('-cut','--cut', help = 'The cut on the (delta thr, delta noise) distance',                   default = 0.5, type = float)
+    parser.add_argument('-outroot','--outroot', help = 'The folder of the output root files',                        default = 'outputroot/frbias/', type = str)
+    parser.add_argument('-outpath','--outpath', help = 'The folder of the png plots',                                default = 'results/frbias/', type = str)
+    parser.add_argument('-store','--store', help = 'The result store folder (no store if not given)',                default = None, type = str)
+    parser.add_argument('-module','--module', help = 'The name of the module (for the result store)',                default = 'RH0026', type = str)
+    parser.add_argument('-noplots','--noplots', help = 'Do not produce the png plots',                               action = 'store_true')
+    args = parser.parse_args()
 
-forward_ns_canvas = forwardroot.Get(histdirectory+chip+histnameprefix+"Noise2D_Chip("+chip+")")
-h_forward_ns = None
-primitives = forward_ns_canvas.GetListOfPrimitives()
-for primitive in primitives:
-    if isinstance(primitive, ROOT.TH2):
-        h_forward_ns = primitive
-        break
+    chips = None if args.chip is None else [int(chip) for chip in args.chip.split(',')]
+    results = FRBiasModule(args.forward,args.reverse,chips,args.cut)
 
-reverse_ns_canvas = reverseroot.Get(histdirectory+chip+histnameprefix+"Noise2D_Chip("+chip+")")
-h_reverse_ns = None
-primitives = reverse_ns_canvas.GetListOfPrimitives()
-for primitive in primitives:
-    if isinstance(primitive, ROOT.TH2):
-        h_reverse_ns = primitive
-        break
+    from rootextract import WriteTH2s
+    for path in [args.outroot] + ([] if args.noplots else [args.outpath]):
+        if not os.path.exists(path): os.makedirs(path)
+    for chip,(delta_thr,delta_ns,missing_map) in results.items():
+        WriteTH2s(os.path.join(args.outroot,'histograms_chip'+str(chip)+'.root'),
+                  {'delta_thr': delta_thr, 'delta_ns': delta_ns, 'missing_map': missing_map})
+        if not args.noplots:
+            PlotMissingMap(missing_map,'chip_'+str(chip)+' missing map (cut '+str(args.cut)+')',
+                           os.path.join(args.outpath,'chip_'+str(chip)+'_cut'+str(args.cut)+'_missing_map.png'))
+        missing = int(np.count_nonzero(missing_map))
+        if args.store:
+            SaveResult(args.store, args.module, chip, 'frbias', RunName(args.forward)+'-'+RunName(args.reverse),
+                       missing_map, {'missing': missing}, {'cut': args.cut})
+        print('chip '+str(chip)+':\tmissing '+str(missing)+' (cut '+str(args.cut)+')')
 
-delta_thr = h_forward_thr.Clone("delta_thr")
-delta_ns = h_forward_ns.Clone("delta_ns")
-
-delta_thr.Add(h_reverse_thr, -1)
-delta_ns.Add(h_reverse_ns, -1)
-
-# Creating missing map
-missing_map = delta_thr.Clone("missing_map")
-for i in range(1, missing_map.GetNbinsX() + 1):
-    for j in range(1, missing_map.GetNbinsY() + 1):
-        missing_map.SetBinContent(i, j, 0)
-
-for i in range(1, missing_map.GetNbinsX() + 1):
-    for j in range(1, missing_map.GetNbinsY() + 1):
-        if (math.sqrt(((delta_thr.GetBinContent(i, j))**2) + ((delta_ns.GetBinContent(i, j))**2)) <= 0.5):
-            missing_map.SetBinContent(i, j, 1)
-
-c = ROOT.TCanvas("c", "Canvas", missing_map.GetNbinsX(), missing_map.GetNbinsY())
-c.Clear()
-missing_map.Draw("missing_map")
-c.SaveAs("results/thrhalfmissing_map.png")
-
-# CHIP ID, needs to be changed
-output_file = ROOT.TFile("outputroot/frbias/histograms_chip12.root", "RECREATE")
-delta_thr.Write()
-delta_ns.Write()
-missing_map.Write()
-output_file.Close()
-forwardroot.Close()
-reverseroot.Close()
+if __name__ == "__main__":
+    main()
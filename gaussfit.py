@@ -0,0 +1,152 @@
+##############################################################################
+# Gaussian fits of the threshold and noise dispersion, for one or many chips at once, without drawing
+# Usage: from gaussfit import FitGaussians, FitMaps, DispersionSummary
+#        params = FitMaps(ThrMaps, *THR_BINS)    # ThrMaps: (rows, cols) or (nchips, rows, cols)
+#        python3 gaussfit.py -scurve Run000081 [Run000082 ...] [-chip 12,13] [-refine] [-out dispersion.csv]
+# Every histogram gets moment seeds (amplitude = max, mean, sigma = sqrt(variance)) and a closed-form fit:
+# the log of a Gaussian is a parabola, so a weighted linear least squares on ln(y) (weights y^2, bins above
+# 10% of the maximum around the peak) gives amplitude, mean and sigma for all the histograms with one batched 3x3 solve.
+# refine=True polishes every fit with scipy curve_fit starting from the closed-form result.
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+##############################################################################
+import os
+import csv
+import argparse
+import numpy as np
+
+# Histogram ranges of the xray.py plots in VCal (lo, hi, step), converted to electrons with V_adc/162
+THR_BINS = (0, 600, 2); NOISE_BINS = (0, 65, 0.1)
+
+def gaus(X,A,X_mean,sigma): return A*np.exp(-(X-X_mean)**2/(2*sigma**2))
+
+# Bin centers of the (lo, hi, step) binning
+def BinCenters(lo,hi,step):
+    edges = np.arange(lo,hi,step)
+    return edges[:-1]+step/2
+
+# Histograms of many maps with a single bincount: maps (..., rows, cols) -> counts (..., nbins)
+def HistogramMaps(maps,lo,hi,step):
+    nbins = len(np.arange(lo,hi,step))-1
+    values = np.asarray(maps, dtype=np.float64)
+    values = values.reshape(-1, values.shape[-2]*values.shape[-1])
+    index = np.floor((values-lo)/step)
+    valid = np.isfinite(index) & (index >= 0) & (index < nbins)
+    index = np.where(valid, index, 0).astype(np.intp) + np.arange(values.shape[0], dtype=np.intp)[:,None]*nbins
+    counts = np.bincount(index[valid], minlength=values.shape[0]*nbins).reshape(-1,nbins)
+    return counts.reshape(np.shape(maps)[:-2]+(nbins,))
+
+# Moment seeds of binned Gaussians: y (..., nbins) over the bin centers x -> amplitude, mean, sigma (...)
+def MomentSeeds(x,y):
+    y = np.asarray(y, dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        total = y.sum(axis=-1)
+        mean = (y*x).sum(axis=-1)/total
+        sigma = np.sqrt((y*(x-mean[...,None])**2).sum(axis=-1)/total)
+    return y.max(axis=-1), mean, sigma
+
+# Bins of the peak: the contiguous bins above min_frac*max around the highest bin (spikes at 0 or in the
+# tails, e.g. failed fits of the SCurves, are left out)
+def PeakWindow(y,min_frac=0.1):
+    above = y > min_frac*y.max(axis=-1, keepdims=True)
+    index = np.arange(y.shape[-1])
+    peak = y.argmax(axis=-1)[...,None]
+    left = np.where(~above & (index < peak), index, -1).max(axis=-1, keepdims=True)
+    right = np.where(~above & (index > peak), index, y.shape[-1]).min(axis=-1, keepdims=True)
+    return above & (index > left) & (index < right)
+
+# Closed-form Gaussian fit of many histograms (log-parabola, Caruana/Guo): ln y = a + b*u + c*u^2 with u = (x-mean0)/sigma0
+# solved by weighted least squares (weights y^2) on the peak bins (mean0, sigma0: moments of the peak).
+# Returns {'amplitude', 'mean', 'sigma', 'valid'} (arrays of shape y.shape[:-1]); invalid fits keep the moment seeds,
+# histograms without entries in range or with a peak of less than 3 bins (e.g. all-zero maps) give NaN
+def LogParabolaFit(x,y,min_frac=0.1):
+    y = np.asarray(y, dtype=np.float64)
+    flat = y.reshape(-1, y.shape[-1])
+    used = PeakWindow(flat,min_frac)
+    amplitude0, mean0, sigma0 = MomentSeeds(x,np.where(used, flat, 0))
+    m0 = mean0.reshape(-1,1); s0 = np.where(sigma0 > 0, sigma0, 1).reshape(-1,1)
+    u = (x[None,:]-m0)/s0
+    w = np.where(used, flat**2, 0)
+    with np.errstate(divide='ignore'):
+        logy = np.where(used, np.log(flat), 0)
+    powers = [(w*u**k).sum(axis=-1) for k in range(5)]
+    matrix = np.stack([np.stack([powers[i+j] for j in range(3)], axis=-1) for i in range(3)], axis=-2)
+    rhs = np.stack([(w*u**k*logy).sum(axis=-1) for k in range(3)], axis=-1)
+    solvable = (used.sum(axis=-1) >= 3) & np.isfinite(m0[:,0]) & (sigma0 > 0)
+    matrix[~solvable] = np.eye(3)
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        try:
+            a, b, c = np.moveaxis(np.linalg.solve(matrix, rhs[...,None])[...,0], -1, 0)
+        except np.linalg.LinAlgError:
+            a, b, c = np.moveaxis(_SolveEach(matrix, rhs), -1, 0)
+        valid = solvable & (c < 0)
+        mean = np.where(valid, m0[:,0] - b/(2*c)*s0[:,0], m0[:,0])
+        sigma = np.where(valid, s0[:,0]*np.sqrt(-1/(2*c)), sigma0)
+        amplitude = np.where(valid, np.exp(a - b**2/(4*c)), amplitude0)
+    mean[~solvable] = np.nan; sigma[~solvable] = np.nan; amplitude[~solvable] = np.nan
+    shape = y.shape[:-1]
+    return {'amplitude': amplitude.reshape(shape), 'mean': mean.reshape(shape), 'sigma': sigma.reshape(shape), 'valid': valid.reshape(shape)}
+
+# Fallback for (nearly) singular systems: least squares solution of each system
+def _SolveEach(matrix,rhs):
+    return np.stack([np.linalg.lstsq(m, r, rcond=None)[0] for m,r in zip(matrix,rhs)])
+
+# Gaussian parameters of many histograms: closed-form fit, optionally refined with curve_fit (one call per histogram)
+def FitGaussians(x,y,refine=False,min_frac=0.1):
+    params = LogParabolaFit(x,y,min_frac)
+    if not refine: return params
+    from scipy.optimize import curve_fit
+    flat_y = np.asarray(y, dtype=np.float64).reshape(-1, np.shape(y)[-1])
+    flat = {key: np.array(value, dtype=value.dtype).reshape(-1) for key,value in params.items()}
+    for i in np.flatnonzero(flat['valid']):
+        try:
+            popt = curve_fit(gaus, x, flat_y[i], p0=[flat['amplitude'][i], flat['mean'][i], flat['sigma'][i]])[0]
+        except (RuntimeError, ValueError):
+            continue
+        flat['amplitude'][i], flat['mean'][i], flat['sigma'][i] = popt[0], popt[1], abs(popt[2])
+    shape = np.shape(y)[:-1]
+    return {key: value.reshape(shape) for key,value in flat.items()}
+
+# Histograms and fits maps (rows, cols) or stacks of maps (nchips, rows, cols) with the (lo, hi, step) binning
+def FitMaps(maps,lo,hi,step,refine=False):
+    return FitGaussians(BinCenters(lo,hi,step), HistogramMaps(maps,lo,hi,step), refine)
+
+# Mean and sigma (electrons) of the threshold and noise dispersions of one chip or of a stack of chips
+def DispersionSummary(ThrMap,NoiseMap,V_adc=800,refine=False):
+    el_conv = V_adc/162
+    thr = FitMaps(ThrMap,*THR_BINS,refine=refine); noise = FitMaps(NoiseMap,*NOISE_BINS,refine=refine)
+    summary = {'thr_mean': thr['mean']*el_conv, 'thr_sigma': thr['sigma']*el_conv,
+               'noise_mean': noise['mean']*el_conv, 'noise_sigma': noise['sigma']*el_conv}
+    if np.ndim(ThrMap) == 2: summary = {key: round(float(value), 2) for key,value in summary.items()}
+    return summary
+
+def main():
+    parser = argparse.ArgumentParser(description='Fit the threshold and noise dispersion of many chips')
+    parser.add_argument('-scurve','--scurve', help = 'The SCurve run(s) # or root file(s)',                          nargs = '+', default = ['Run000081'])
+    parser.add_argument('-input','--input', help = 'The folder with the root files',                                 default = 'input', type = str)
+    parser.add_argument('-chip','--chip', help = 'The ROC ID(s), comma separated (default: all chips in the files)', default = None, type = str)
+    parser.add_argument('-vref','--vref', help = 'The VRef_ADC [mV]',                                                default = 800, type = int)
+    parser.add_argument('-refine','--refine', help = 'Refine the closed-form fits with curve_fit',                  action = 'store_true')
+    parser.add_argument('-out','--out', help = 'The csv file of the fit results (not written if not given)',        default = None, type = str)
+    args = parser.parse_args()
+
+    from rootextract import ExtractModuleMaps, RunFile
+    chips = None if args.chip is None else [int(chip) for chip in args.chip.split(',')]
+    names = []; thr = []; noise = []
+    for run in args.scurve:
+        file_path = RunFile(run,'SCurve',args.input)
+        for chip,maps in ExtractModuleMaps(file_path,{'Threshold2D':'2D','Noise2D':'2D'},chips).items():
+            names.append((os.path.basename(file_path), chip)); thr.append(maps['Threshold2D']); noise.append(maps['Noise2D'])
+    summary = DispersionSummary(np.stack(thr), np.stack(noise), args.vref, args.refine)
+
+    rows = [dict(file=name, chip=chip, **{key: round(float(value[i]), 2) for key,value in summary.items()}) for i,(name,chip) in enumerate(names)]
+    print('{:<32}{:>6}{:>12}{:>12}{:>12}{:>12}'.format('file', 'chip', 'thr_mean', 'thr_sigma', 'noise_mean', 'noise_sigma'))
+    for row in rows:
+        print('{:<32}{:>6}{:>12}{:>12}{:>12}{:>12}'.format(row['file'], row['chip'], row['thr_mean'], row['thr_sigma'], row['noise_mean'], row['noise_sigma']))
+    if args.out:
+        with open(args.out, 'w', newline='') as file:
+            writer = csv.DictWriter(file, fieldnames=list(rows[0]))
+            writer.writeheader(); writer.writerows(rows)
+
+if __name__ == "__main__":
+    main()
@@ -1,132 +1,132 @@
-import ROOT
-ROOT.gROOT.SetBatch(True)
-from array import array
-
-def compare_xtalk_xray(xray_file_path, xtalk_file_path, frbias_file_path, output_file_path):
-    # Load the ROOT files
-    xray_file = ROOT.TFile(xray_file_path, "READ")
-    xtalk_file = ROOT.TFile(xtalk_file_path, "READ")
-    frbias_file = ROOT.TFile(frbias_file_path, "READ")
-    
-    # h_xray = xray_file.Get("MissingMap")
-    # h_xtalk = xtalk_file.Get("h_confirmed2D")
-    # h_frbias = frbias_file.Get("missing_map")
+import numpy as np
+from resultstore import LoadResult, MissingMask
 
-    # Toy histograms to test logic, delete when using real histograms
-    h_xray = xray_file.Get("hist1")
-    h_xtalk = xtalk_file.Get("hist2")
-    h_frbias = frbias_file.Get("hist3")
-
-    # Clone the X-ray histogram to create a result histogram
-    h_xray_exclusive = h_xray.Clone("h_xray_exclusive")
-    h_xtalk_exclusive = h_xray.Clone("h_xtalk_exclusive")
-    h_frbias_exclusive = h_xray.Clone("h_frbias_exclusive")
-    h_xray_xtalk = h_xray.Clone("h_xray_xtalk")
-    h_xray_frbias = h_xray.Clone("h_xray_frbias")
-    h_xtalk_frbias = h_xray.Clone("h_xtalk_frbias")
-    h_xray_xtalk_frbias = h_xray.Clone("h_xray_xtalk_frbias")
-
-    histograms = [h_xray_exclusive,
-                  h_xtalk_exclusive,
-                  h_frbias_exclusive,
-                  h_xray_xtalk,
-                  h_xray_frbias,
-                  h_xtalk_frbias,
-                  h_xray_xtalk_frbias
-                  ]
-
-    # Filling histograms with 0's
-    for histogram in histograms:
-        for i in range(1, histogram.GetNbinsX()+1):
-            for j in range(1, histogram.GetNbinsY()+1):
-                histogram.SetBinContent(i, j, 0)
-
-    # bin by bin comparison of histograms, then fill result histograms
-    for i in range(1, h_xray_exclusive.GetNbinsX() + 1):
-        for j in range(1, h_xray_exclusive.GetNbinsY() +1):
-            xraybin = h_xray.GetBinContent(i, j)
-            xtalkbin = h_xtalk.GetBinContent(i, j)
-            frbiasbin = h_frbias.GetBinContent(i, j)
-            # xray exclusive
-            if ((xraybin) and (not xtalkbin) and (not frbiasbin)):
-                h_xray_exclusive.SetBinContent(i, j, 1)
-            # xtalk exclusive
-            elif ((not xraybin) and (xtalkbin) and (not frbiasbin)):
-                h_xtalk_exclusive.SetBinContent(i, j, 1)
-            # frbias exclusive
-            elif ((not xraybin) and (not xtalkbin) and (frbiasbin)):
-                h_frbias_exclusive.SetBinContent(i, j, 1)
-            # xray and xtalk (ignore frbias)
-            if ((xraybin) and (xtalkbin)):
-                h_xray_xtalk.SetBinContent(i, j, 1)
-            # xray and frbias (ignore xtalk)
-            if ((xraybin) and (frbiasbin)):
-                h_xray_frbias.SetBinContent(i, j, 1)
-            # xtalk and frbias (ignore xray)
-            if ((xtalkbin) and (frbiasbin)):
-                h_xtalk_frbias.SetBinContent(i, j, 1)
-            # xray, xtalk, and frbias
-            if ((xraybin) and (xtalkbin) and (frbiasbin)):
-                h_xray_xtalk_frbias.SetBinContent(i, j, 1)
-
-    # Set custom color palettes
-    def set_palette(histogram, color_0, color_1):
-        ROOT.gStyle.SetNumberContours(2)
-        ROOT.gStyle.SetOptStat(0)
-        colors = array('i', [color_0, color_1])
-        ROOT.gStyle.SetPalette(len(colors), colors)
-        histogram.SetContour(2, array('d', [0.0, 1.0]))
-        histogram.SetMinimum(0)
-        histogram.SetMaximum(1)
-
-    # Define colors
+# The comparison works on numpy arrays: the histograms are read and written through rootextract (ROOT or uproot)
+# and the regions are drawn with matplotlib, so the script also runs without PyROOT
+
+# Packs the missing map of each method into one bit of a per-pixel code:
+# bit i is set if method i (in the order of maps) flags the pixel. Every region is then a condition on the code.
+def overlap_codes(maps):
+    names = list(maps)
+    dtype = np.uint8 if len(names) <= 8 else np.uint16 if len(names) <= 16 else np.uint32
+    codes = np.zeros(np.shape(maps[names[0]]), dtype=dtype)
+    for bit, name in enumerate(names):
+        codes |= (np.asarray(maps[name]) != 0).astype(dtype) << bit
+    return names, codes
+
+# Number of pixels for every code (index = code), from a single bincount
+def code_counts(codes, nmethods):
+    return np.bincount(codes.ravel(), minlength=1 << nmethods)
+
+# Regions of the comparison as (name, bit mask, exclusive): each method alone (exclusive),
+# then every intersection of two or more methods (ignoring the other methods)
+def overlap_regions(names):
+    regions = [("h_" + name + "_exclusive", 1 << bit, True) for bit, name in enumerate(names)]
+    for mask in range(1, 1 << len(names)):
+        members = [name for bit, name in enumerate(names) if mask >> bit & 1]
+        if len(members) > 1:
+            regions.append(("h_" + "_".join(members), mask, False))
+    return sorted(regions, key=lambda region: (not region[2], bin(region[1]).count("1"), region[1]))
+
+# Truth table of the regions: row r, column c is True if a pixel with code c belongs to region r
+def region_table(names):
+    all_codes = np.arange(1 << len(names))
+    return [(name, (all_codes == mask) if exclusive else ((all_codes & mask) == mask))
+            for name, mask, exclusive in overlap_regions(names)]
+
+# Number of pixels in every region, from the code counts (no pass over the maps)
+def region_counts(names, counts):
+    return {name: int(counts[table].sum()) for name, table in region_table(names)}
+
+# Boolean map of every region, looked up from the codes
+def region_maps(names, codes):
+    return {name: table[codes] for name, table in region_table(names)}
+
+# Compares the missing maps of any number of methods ({method name: (rows, cols) array})
+# Returns the region maps and the region counts
+def compare_methods(maps):
+    names, codes = overlap_codes(maps)
+    counts = code_counts(codes, len(names))
+    return region_maps(names, codes), region_counts(names, counts)
+
+# Define colors (white for 0, color for 1), regions not listed here get a color from the default list
+def region_color(name, index):
     color_sets = {
-        "h_xray_exclusive": (ROOT.TColor.GetColor("#FFFFFF"), ROOT.TColor.GetColor("#0000FF")),  # White for 0, Blue for 1
-        "h_xtalk_exclusive": (ROOT.TColor.GetColor("#FFFFFF"), ROOT.TColor.GetColor("#FF0000")),  # Red for 1
-        "h_frbias_exclusive": (ROOT.TColor.GetColor("#FFFFFF"), ROOT.TColor.GetColor("#00FF00")),   # Green for 1
-        "h_xray_xtalk": (ROOT.TColor.GetColor("#FFFFFF"), ROOT.TColor.GetColor("#FF00FF")),  # Magenta for 1
-        "h_xray_frbias": (ROOT.TColor.GetColor("#FFFFFF"), ROOT.TColor.GetColor("#00FFFF")),  # Cyan for 1
-        "h_xtalk_frbias": (ROOT.TColor.GetColor("#FFFFFF"), ROOT.TColor.GetColor("#FFFF00")),  # Yellow for 1
-        "h_xray_xtalk_frbias": (ROOT.TColor.GetColor("#FFFFFF"), ROOT.TColor.GetColor("#000000")),  # Black for 1
+        "h_xray_exclusive": "#0000FF",  # Blue for 1
+        "h_xtalk_exclusive": "#FF0000",  # Red for 1
+        "h_frbias_exclusive": "#00FF00",   # Green for 1
+        "h_xray_xtalk": "#FF00FF",  # Magenta for 1
+        "h_xray_frbias": "#00FFFF",  # Cyan for 1
+        "h_xtalk_frbias": "#FFFF00",  # Yellow for 1
+        "h_xray_xtalk_frbias": "#000000",  # Black for 1
     }
+    default_colors = ["#0000FF", "#FF0000", "#00FF00", "#FF00FF", "#00FFFF", "#FFFF00", "#FF8000", "#8000FF", "#808080", "#000000"]
+    return color_sets.get(name, default_colors[index % len(default_colors)])
 
-    # Create a canvas
-    c = ROOT.TCanvas("c", "Canvas", h_xray_exclusive.GetNbinsX(), h_xray_exclusive.GetNbinsY())
-    
-    # Draw and save histograms
-    histnames = ["h_xray_exclusive", "h_xtalk_exclusive", "h_frbias_exclusive", "h_xray_xtalk", "h_xray_frbias", "h_xtalk_frbias", "h_xray_xtalk_frbias"]
-    
-    for hist, name in zip(histograms, histnames):
-        # Set the palette for the current histogram
-        set_palette(hist, *color_sets[f"{name}"])
-        c.Clear()
-        hist.Draw("COLZ")
-        c.SaveAs(f"{png_file_path_base}_{name}.png")
-
-    # Create an output file to save the result histogram
-    output_file = ROOT.TFile(output_file_path, "RECREATE")
-    h_xray_exclusive.Write()
-    h_xray_exclusive.Write()
-    h_xtalk_exclusive.Write()
-    h_xray_xtalk.Write()
-    h_xray_frbias.Write()
-    h_xtalk_frbias.Write()
-    h_xray_xtalk_frbias.Write()
-    output_file.Close()
-    
-    # Close the input files
-    xray_file.Close()
-    xtalk_file.Close()
-    frbias_file.Close()
+# Draws the region maps ({name: (rows, cols) map}, white for 0, the region color for 1) with matplotlib,
+# one pixel per bin, and saves them as <png_file_path_base>_<region>.png
+def draw_regions(regions, png_file_path_base):
+    from xrayplots import Pyplot
+    import matplotlib
+    plt = Pyplot()
+    for index, (name, region) in enumerate(regions.items()):
+        num_rows, num_cols = np.shape(region)
+        fig = plt.figure(figsize=(num_cols/100, num_rows/100), dpi=100)
+        ax = fig.add_axes([0, 0, 1, 1])
+        ax.set_axis_off()
+        ax.imshow(np.asarray(region, dtype=np.uint8), origin="lower", cmap=matplotlib.colors.ListedColormap(["#FFFFFF", region_color(name, index)]),
+                  vmin=0, vmax=1, interpolation="nearest")
+        fig.savefig(f"{png_file_path_base}_{name}.png", format="png", dpi=100)
+        plt.close(fig)
 
+# Compares the missing maps, writes the region histograms to a root file (rootextract.WriteTH2s, ROOT or uproot) and draws them
+def compare_and_save(maps, output_file_path, png_file_path_base=None):
+    from rootextract import WriteTH2s
+    regions, counts = compare_methods(maps)
+
+    if png_file_path_base is not None:
+        draw_regions(regions, png_file_path_base)
+
+    # Create an output file to save the result histograms
+    WriteTH2s(output_file_path, {name: (region, name) for name, region in regions.items()})
+
+    for name, count in counts.items():
+        print(f"{name}:\t{count}")
     print("Comparison complete. Result saved to: ", output_file_path)
+    return counts
+
+def compare_xtalk_xray(xray_file_path, xtalk_file_path, frbias_file_path, output_file_path, png_file_path_base="results/histogram"):
+    from rootextract import ExtractTH2
+    # Load the missing maps as numpy arrays
+    # maps = {"xray": ExtractTH2(xray_file_path, "MissingMap"),
+    #         "xtalk": ExtractTH2(xtalk_file_path, "h_confirmed2D"),
+    #         "frbias": ExtractTH2(frbias_file_path, "missing_map")}
+
+    # Toy histograms to test logic, delete when using real histograms
+    maps = {"xray": ExtractTH2(xray_file_path, "hist1"),
+            "xtalk": ExtractTH2(xtalk_file_path, "hist2"),
+            "frbias": ExtractTH2(frbias_file_path, "hist3")}
+
+    return compare_and_save(maps, output_file_path, png_file_path_base)
+
+# Loads the missing maps of a chip from the result store ({method: boolean map}, newest result of each method
+# unless runs={method: run} is given) without opening any root file
+def load_store_maps(store, module, chip, methods=("xray", "xtalk", "frbias"), runs=None, include_low_occ=False):
+    runs = runs or {}
+    return {method: MissingMask(LoadResult(store, module, chip, method, runs.get(method))[0], include_low_occ)
+            for method in methods}
+
+# Compares the methods of a chip straight from the result store, returns the region counts
+def compare_store(store, module, chip, methods=("xray", "xtalk", "frbias"), runs=None, include_low_occ=False):
+    return compare_methods(load_store_maps(store, module, chip, methods, runs, include_low_occ))[1]
 
-# Example usage
-xray_file_path = "outputroot/xray/xrayroot12.root"
-xtalk_file_path = "outputroot/xtalk/h_missing2dC12.root"
-frbias_file_path = "outputroot/frbias/histograms_chip12.root"
-output_file_path = "results/RH0026C12Comparison.root"
-png_file_path_base = "results/histogram"
+if __name__ == "__main__":
+    # Example usage
+    xray_file_path = "outputroot/xray/xrayroot12.root"
+    xtalk_file_path = "outputroot/xtalk/h_missing2dC12.root"
+    frbias_file_path = "outputroot/frbias/histograms_chip12.root"
+    output_file_path = "results/RH0026C12Comparison.root"
+    png_file_path_base = "results/histogram"
 
-# compare_xtalk_xray(xray_file_path, xtalk_file_path, frbias_file_path, output_file_path)
-compare_xtalk_xray("toy_histograms.root", "toy_histograms.root", "toy_histograms.root", output_file_path)
+    # compare_xtalk_xray(xray_file_path, xtalk_file_path, frbias_file_path, output_file_path, png_file_path_base)
+    compare_xtalk_xray("toy_histograms.root", "toy_histograms.root", "toy_histograms.root", output_file_path, png_file_path_base)
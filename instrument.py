@@ -0,0 +1,153 @@
+##############################################################################
+# Opt-in instrumentation of the analysis stages: wall time, CPU time and peak memory per stage and per chip
+# Usage: python3 xray.py ... -profile results_xray/profile    (or xraybatch.py -profile; PIXELMAP_PROFILE=1 for any script)
+#        with Stage('classification'): ...                   (no-op unless profiling is enabled)
+#        python3 instrument.py -report results_batch/profile.json [-by chip]
+# PIXELMAP_PROFILE=1 records wall and CPU time, PIXELMAP_PROFILE=mem also the peak memory of every stage
+# (tracemalloc, slows down the allocations). The setting is inherited by the worker processes of xraybatch.py
+# and xrayplots.py, whose records are sent back with their results and merged.
+# Records: one per stage per chip (module, chip, stage, calls, wall_s, cpu_s, peak_mb). Stages can be nested:
+# the time of a stage includes its sub-stages, peak_mb is the largest memory allocated above the start of the stage.
+# Report: json (records + per stage aggregate), csv (records) and a table per stage
+# (chips, total/mean/median/max wall time, CPU/wall ratio, max peak memory).
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+##############################################################################
+import os
+import csv
+import json
+import time
+import argparse
+import tracemalloc
+from contextlib import contextmanager
+import numpy as np
+
+MODES = ('', '0', '1', 'mem')
+RECORD_FIELDS = ['module', 'chip', 'stage', 'calls', 'wall_s', 'cpu_s', 'peak_mb']
+AGGREGATE_FIELDS = ['stage', 'chips', 'calls', 'total_s', 'mean_s', 'median_s', 'max_s', 'cpu_s', 'cpu_ratio', 'peak_mb']
+
+_RECORDS = {}             # (module, chip, stage): record
+_CONTEXT = ('', '')       # (module, chip) the stages are attributed to
+_MEMORY = []              # [memory at the start, largest memory seen] of the open stages (tracemalloc)
+
+# Profiling mode of this process: '' (off), '1' (times) or 'mem' (times + peak memory)
+def Mode():
+    mode = os.environ.get('PIXELMAP_PROFILE', '')
+    if mode not in MODES: raise ValueError("Unknown PIXELMAP_PROFILE "+mode+", choose from 0, 1, mem")
+    return '' if mode == '0' else mode
+
+def Enabled():
+    return Mode() != ''
+
+# Switches profiling on ('1', 'mem') or off ('0') (also inherited by the worker processes started afterwards)
+def Enable(mode='1'):
+    if mode not in MODES: raise ValueError("Unknown profiling mode "+mode+", choose from 0, 1, mem")
+    os.environ['PIXELMAP_PROFILE'] = mode
+
+# Attributes the next stages to a chip
+def SetContext(module,chip):
+    global _CONTEXT
+    _CONTEXT = (str(module), str(chip))
+
+def Context():
+    return _CONTEXT
+
+# Times a block of code as one stage of the current chip
+@contextmanager
+def Stage(name):
+    mode = Mode()
+    if not mode:
+        yield
+        return
+    if mode == 'mem':
+        if not tracemalloc.is_tracing(): tracemalloc.start()
+        current, peak = tracemalloc.get_traced_memory()
+        if _MEMORY: _MEMORY[-1][1] = max(_MEMORY[-1][1], peak)
+        _MEMORY.append([current, current]); tracemalloc.reset_peak()
+    wall = time.perf_counter(); cpu = time.process_time()
+    try:
+        yield
+    finally:
+        wall = time.perf_counter()-wall; cpu = time.process_time()-cpu
+        extra = 0
+        if mode == 'mem' and _MEMORY:
+            start, seen = _MEMORY.pop()
+            peak = max(seen, tracemalloc.get_traced_memory()[1])
+            if _MEMORY: _MEMORY[-1][1] = max(_MEMORY[-1][1], peak)
+            extra = peak-start
+        _Add({'module': _CONTEXT[0], 'chip': _CONTEXT[1], 'stage': name, 'calls': 1, 'wall_s': wall, 'cpu_s': cpu, 'peak_mb': extra/1024/1024})
+
+# Adds a record to the ones of the same chip and stage (times summed, peak memory maximum)
+def _Add(record):
+    key = (record['module'], record['chip'], record['stage'])
+    if key not in _RECORDS: _RECORDS[key] = dict(record); return
+    total = _RECORDS[key]
+    for field in ('calls', 'wall_s', 'cpu_s'): total[field] += record[field]
+    total['peak_mb'] = max(total['peak_mb'], record['peak_mb'])
+
+# Records of this process (in the order the stages were first seen)
+def Records():
+    return [dict(record) for record in _RECORDS.values()]
+
+# Returns the records of this process and clears them (workers send them back with their results)
+def TakeRecords():
+    records = Records()
+    _RECORDS.clear()
+    return records
+
+# Merges the records of another process into the ones of this process
+def Merge(records):
+    for record in records or []: _Add(record)
+
+# Aggregate of every stage over the chips: {stage: {chips, calls, total_s, mean_s, median_s, max_s, cpu_s, cpu_ratio, peak_mb}}
+def Aggregate(records):
+    stages = {}
+    for record in records: stages.setdefault(record['stage'], []).append(record)
+    aggregate = {}
+    for stage,chips in stages.items():
+        wall = np.array([record['wall_s'] for record in chips]); cpu = sum(record['cpu_s'] for record in chips)
+        aggregate[stage] = {'stage': stage, 'chips': len(chips), 'calls': sum(record['calls'] for record in chips),
+                            'total_s': float(wall.sum()), 'mean_s': float(wall.mean()), 'median_s': float(np.median(wall)), 'max_s': float(wall.max()),
+                            'cpu_s': cpu, 'cpu_ratio': cpu/wall.sum() if wall.sum() > 0 else 0.0,
+                            'peak_mb': max(record['peak_mb'] for record in chips)}
+    return aggregate
+
+# Writes <prefix>.json (records + aggregate) and <prefix>.csv (one line per stage per chip). Returns the file names
+def WriteReport(records,prefix,extra=None):
+    outdir = os.path.dirname(prefix)
+    if outdir and not os.path.exists(outdir): os.makedirs(outdir)
+    report = {'created': time.strftime('%Y-%m-%d %H:%M:%S'), 'mode': Mode(), 'records': records, 'stages': Aggregate(records)}
+    report.update(extra or {})
+    with open(prefix+'.json', 'w') as file: json.dump(report, file, indent=1)
+    with open(prefix+'.csv', 'w', newline='') as file:
+        writer = csv.DictWriter(file, fieldnames=RECORD_FIELDS)
+        writer.writeheader()
+        for record in records: writer.writerow({key: round(value, 6) if isinstance(value, float) else value for key,value in record.items()})
+    return prefix+'.json', prefix+'.csv'
+
+# Human readable table of the aggregate per stage (slowest first) or of the total time per chip
+def PrintReport(records,by='stage'):
+    print('##############################################################\n PROFILE ('+str(len({(r['module'], r['chip']) for r in records}))+' chips)\n##############################################################')
+    if by == 'chip':
+        chips = {}
+        for record in records: chips.setdefault(record['module']+' chip '+record['chip'], {})[record['stage']] = record['wall_s']
+        for chip,stages in chips.items():
+            print(chip+':\t'+'  '.join(stage+' '+'{:.3f}'.format(wall)+' s' for stage,wall in sorted(stages.items(), key=lambda item: -item[1])))
+    else:
+        print('{:<28} {:>5} {:>10} {:>10} {:>10} {:>10} {:>6} {:>9}'.format('stage', 'chips', 'total [s]', 'mean [s]', 'median [s]', 'max [s]', 'cpu', 'peak [MB]'))
+        for values in sorted(Aggregate(records).values(), key=lambda values: -values['total_s']):
+            print('{:<28} {:>5} {:>10.3f} {:>10.4f} {:>10.4f} {:>10.4f} {:>5.0%} {:>9.1f}'.format(values['stage'], values['chips'], values['total_s'],
+                  values['mean_s'], values['median_s'], values['max_s'], values['cpu_ratio'], values['peak_mb']))
+    print('##############################################################')
+
+def main():
+    parser = argparse.ArgumentParser(description='Print a profile report written by xray.py / xraybatch.py -profile')
+    parser.add_argument('-report','--report', help = 'The json report (<prefix>.json)',                              required = True, type = str)
+    parser.add_argument('-by','--by', help = 'Aggregate per stage or list the stages of every chip',                default = 'stage', choices = ['stage','chip'])
+    args = parser.parse_args()
+
+    with open(args.report) as file: report = json.load(file)
+    PrintReport(report['records'], args.by)
+
+if __name__ == "__main__":
+    main()
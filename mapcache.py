@@ -0,0 +1,99 @@
+##############################################################################
+# On-disk cache of the maps extracted from the root files
+# Usage: from mapcache import CachedItems
+#        maps = CachedItems(file_path, ['Chip_12/Threshold2D/2D', ...], loader)
+# Entries are keyed by the content hash of the input file + the histogram path, so a re-run on unchanged
+# inputs reuses the decoded numpy arrays without opening the root file. The cache folder is bounded in size,
+# the least recently used entries are removed first.
+# Environment: PIXELMAP_CACHE (cache root, default .cache), PIXELMAP_CACHE_SIZE (max size in MB, default 1024),
+#              PIXELMAP_NO_CACHE=1 (disable the cache)
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+##############################################################################
+import os
+import sys
+import hashlib
+import numpy as np
+
+CACHE_DIR = os.path.join(os.environ.get('PIXELMAP_CACHE', '.cache'), 'maps')
+CACHE_SIZE = int(float(os.environ.get('PIXELMAP_CACHE_SIZE', 1024))*1024*1024)
+
+def CacheEnabled():
+    return os.environ.get('PIXELMAP_NO_CACHE', '0') in ('', '0')
+
+_hashes = {}
+# Content hash of a file, computed once per (path, mtime, size) in this process
+def FileHash(file_path):
+    stat = os.stat(file_path)
+    key = (os.path.abspath(file_path), stat.st_mtime_ns, stat.st_size)
+    if key not in _hashes:
+        digest = hashlib.sha1()
+        with open(file_path, 'rb') as file:
+            for chunk in iter(lambda: file.read(1 << 20), b''): digest.update(chunk)
+        _hashes[key] = digest.hexdigest()
+    return _hashes[key]
+
+def _EntryPath(file_hash,item,cache_dir):
+    return os.path.join(cache_dir, file_hash[:2], file_hash+'_'+hashlib.sha1(item.encode()).hexdigest()[:16]+'.npy')
+
+# Reads one entry (None if missing or unreadable) and marks it as recently used
+def _Read(path):
+    try:
+        value = np.load(path, allow_pickle=False)
+    except (OSError, ValueError):
+        return None
+    try: os.utime(path)
+    except OSError: pass # evicted by another process meanwhile, the value is already loaded
+    return value
+
+def _Write(path,value):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path[:-4]+'.'+str(os.getpid())+'.tmp.npy'
+    np.save(tmp_path, np.asarray(value), allow_pickle=False)
+    os.replace(tmp_path, path)
+
+# Removes the least recently used entries until the cache is below max_size bytes
+def Evict(cache_dir=CACHE_DIR,max_size=CACHE_SIZE):
+    entries = []
+    for root,_,files in os.walk(cache_dir):
+        for name in files:
+            if not name.endswith('.npy') or name.endswith('.tmp.npy'): continue
+            path = os.path.join(root,name)
+            try: stat = os.stat(path)
+            except OSError: continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+    total = sum(size for _,size,_ in entries)
+    for _,size,path in sorted(entries):
+        if total <= max_size: break
+        try: os.remove(path)
+        except OSError: continue
+        total -= size
+    return total
+
+# Returns {item: value} for the items of a file: cached values are read from disk, the missing ones are
+# produced by loader(missing items) -> {item: value} (called at most once) and stored.
+# Values are numpy arrays or numbers (stored as 0-d arrays, returned as python numbers)
+def CachedItems(file_path,items,loader,cache_dir=CACHE_DIR,max_size=CACHE_SIZE):
+    if not CacheEnabled(): return loader(list(items))
+    file_hash = FileHash(file_path)
+    values = {}; missing = []
+    for item in items:
+        value = _Read(_EntryPath(file_hash,item,cache_dir))
+        if value is None: missing.append(item)
+        else: values[item] = value.item() if value.ndim == 0 else value
+    if missing:
+        loaded = loader(missing)
+        for item in missing:
+            _Write(_EntryPath(file_hash,item,cache_dir), loaded[item])
+            values[item] = loaded[item]
+        Evict(cache_dir,max_size)
+    return values
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == 'clear':
+        print('Cache size after clear: '+str(Evict(CACHE_DIR,0))+' bytes')
+    else:
+        print(CACHE_DIR+': '+str(Evict(CACHE_DIR,CACHE_SIZE)/1024/1024)+' MB (max '+str(CACHE_SIZE/1024/1024)+' MB)')
+
+if __name__ == "__main__":
+    main()
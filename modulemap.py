@@ -0,0 +1,156 @@
+##############################################################################
+# Module assembly: places the chip maps of a dual or quad module into one sensor map (mosaic)
+# Usage: python3 modulemap.py -module RH0026 -layout quad -store results_store [-methods xray,xtalk,frbias]
+#        python3 modulemap.py -module RH0026 -layout quad -occupancy Run000046 -txt input/txt/Run000081_CMSIT_RD53_RH0026_0_{chip}.txt
+# With -occupancy the xray classification runs on the assembled hits and enable maps (each root file opened once),
+# otherwise the stored status maps of every chip are assembled. The overlap of the methods is computed on the module map.
+# Output: module counts per method + overlap regions, one png per module (<outpath>/<module>_module_map.png)
+# LAYOUTS gives, for every chip, its block (row, col) in the module and whether its rows/cols are mirrored:
+# edit it if the geometry of a module differs. Chips missing from the inputs are left as fill value.
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+##############################################################################
+import os
+import argparse
+import numpy as np
+
+num_rows = 336; num_cols = 432
+# chipID: (block row, block col, flip rows, flip cols). Block row 0 is drawn at the bottom (origin='lower')
+LAYOUTS = {
+    'single': {12: (0, 0, False, False)},
+    'dual':   {12: (0, 0, False, False), 13: (0, 1, False, False)},
+    'quad':   {12: (0, 0, False, False), 13: (0, 1, False, False),
+               15: (1, 0, True, True),   14: (1, 1, True, True)}, # upper chips are rotated by 180 degrees
+}
+
+# Shape of the module map of a layout
+def ModuleShape(layout,chip_shape=(num_rows,num_cols)):
+    return (chip_shape[0]*(1+max(block[0] for block in layout.values())), chip_shape[1]*(1+max(block[1] for block in layout.values())))
+
+# Region of the module map of every chip: {chip: (row slice, col slice, flip rows, flip cols)}
+def ChipSlices(layout,chip_shape=(num_rows,num_cols)):
+    return {chip: (slice(row*chip_shape[0], (row+1)*chip_shape[0]), slice(col*chip_shape[1], (col+1)*chip_shape[1]), flip_rows, flip_cols)
+            for chip,(row,col,flip_rows,flip_cols) in layout.items()}
+
+# Chip orientation <-> module orientation (a view, no copy)
+def _Oriented(array,flip_rows,flip_cols):
+    return array[::-1 if flip_rows else 1, ::-1 if flip_cols else 1]
+
+# Assembles {chip: (rows, cols) map} into one preallocated module map: every chip is copied exactly once
+# (the mirrored views are written straight into their region)
+def AssembleModule(chip_maps,layout,fill=0,dtype=None):
+    if not chip_maps: raise ValueError('No chip map to assemble')
+    first = next(iter(chip_maps.values()))
+    module = np.full(ModuleShape(layout,np.shape(first)), fill, dtype=dtype or np.asarray(first).dtype)
+    for chip,(rows,cols,flip_rows,flip_cols) in ChipSlices(layout,np.shape(first)).items():
+        if chip in chip_maps: module[rows,cols] = _Oriented(np.asarray(chip_maps[chip]),flip_rows,flip_cols)
+    return module
+
+# Views of the module map back in the orientation of every chip ({chip: (rows, cols) view})
+def SplitModule(module,layout,chip_shape=(num_rows,num_cols)):
+    return {chip: _Oriented(module[rows,cols],flip_rows,flip_cols) for chip,(rows,cols,flip_rows,flip_cols) in ChipSlices(layout,chip_shape).items()}
+
+# X-Ray classification of a whole module: the hits and enable maps of all the chips are assembled and classified at once.
+# Returns the module status map and the module summary (classify.SummarizeStatus). A chip of the layout missing from the file is an error
+def XRayModule(occupancy_file,txt_pattern,layout,Thr=1,Thr_strange=1000,nTrg=1e7,nBX=10,module=''):
+    from rootextract import ExtractModuleMaps
+    from txtconfig import GetEnableMask
+    from classify import ClassifyMissing, SummarizeStatus
+    occupancy = ExtractModuleMaps(occupancy_file,{'PixelAlive':'2D'})
+    absent = [chip for chip in layout if chip not in occupancy]
+    if absent: raise KeyError('Module '+str(module)+': chip(s) '+', '.join(map(str, absent))+' of the layout not in '+occupancy_file
+                              +' (chips in the file: '+', '.join(map(str, sorted(occupancy)))+')')
+    occupancy = {chip: occupancy[chip] for chip in layout}
+    Data = AssembleModule({chip: maps['PixelAlive'] for chip,maps in occupancy.items()},layout,dtype=np.float64)
+    Data *= nTrg*nBX
+    Enable = AssembleModule({chip: GetEnableMask(txt_pattern.format(chip=chip)) for chip in layout if os.path.exists(txt_pattern.format(chip=chip))},layout)
+    status = ClassifyMissing(Data,Enable,Thr,Thr_strange)
+    return status, SummarizeStatus(status)
+
+# Assembles the newest stored status map of every chip of a module for one method (memory-mapped, copied once)
+def StoredModule(store,module,method,layout,runs=None):
+    from resultstore import LoadResult
+    chip_maps = {}
+    for chip in layout:
+        try: chip_maps[chip] = LoadResult(store,module,chip,method,(runs or {}).get(method))[0]
+        except KeyError: continue
+    if not chip_maps: raise KeyError('No '+method+' result for module '+str(module))
+    return AssembleModule(chip_maps,layout,dtype=np.int8)
+
+# One image of the module: the status map of every method and the overlap of their missing maps, with the chip borders
+def PlotModule(status_maps,codes,names,layout,module,file_path,dpi=150):
+    from xrayplots import Pyplot
+    from histcomparison import overlap_regions, region_color
+    import matplotlib
+    plt = Pyplot()
+    fig, axes = plt.subplots(1, len(status_maps)+1, figsize=(6.5*(len(status_maps)+1), 6))
+    fig.suptitle('Module '+str(module))
+    missing_cmap = matplotlib.colors.ListedColormap(['orange','blue','red','white'])
+    missing_norm = matplotlib.colors.BoundaryNorm([-1.5,-0.5,0.5,1.5,3.5], missing_cmap.N)
+    regions = {mask: name for name,mask,exclusive in overlap_regions(names)}
+    code_colors = ['white']+[region_color(regions[code], code) for code in range(1, 1 << len(names))]
+    code_cmap = matplotlib.colors.ListedColormap(code_colors)
+    binary_cmap = matplotlib.colors.ListedColormap(['white','red'])
+    binary_norm = matplotlib.colors.BoundaryNorm([-0.5,0.5,1.5], binary_cmap.N)
+    # xray: full status map (low occ, masked, missing, good), other methods: missing map
+    panels = [(method, status, missing_cmap, missing_norm) if method == 'xray' else (method, status == 1, binary_cmap, binary_norm)
+              for method,status in status_maps.items()]
+    panels.append(('overlap', codes, code_cmap, matplotlib.colors.BoundaryNorm(np.arange(len(code_colors)+1)-0.5, len(code_colors))))
+    for ax,(title,image,cmap,norm) in zip(np.atleast_1d(axes), panels):
+        ax.imshow(image, origin='lower', cmap=cmap, norm=norm, interpolation='nearest')
+        for chip,(rows,cols,_,_) in ChipSlices(layout).items():
+            ax.add_patch(matplotlib.patches.Rectangle((cols.start-0.5, rows.start-0.5), num_cols, num_rows, fill=False, linewidth=1))
+            ax.text(cols.start+10, rows.start+10, 'chip '+str(chip), fontsize=10)
+        ax.set_title(title)
+    handles = [matplotlib.patches.Patch(color=code_colors[code], label=regions[code][2:]) for code in range(1, len(code_colors))]
+    np.atleast_1d(axes)[-1].legend(handles=handles, loc='upper center', bbox_to_anchor=(0.5, -0.08), ncol=2, fontsize=9)
+    fig.savefig(file_path, format='png', dpi=dpi, bbox_inches='tight')
+    plt.close(fig)
+    return file_path
+
+def main():
+    from rootextract import TriggerCount, RunFile
+    from resultstore import MissingMask, STORE_DIR
+    from histcomparison import compare_methods, overlap_codes
+    parser = argparse.ArgumentParser(description='Assemble the chips of a module and analyse the module as one sensor')
+    parser.add_argument('-module','--module', help = 'The name of the module',                                       required = True, type = str)
+    parser.add_argument('-layout','--layout', help = 'The module layout',                                            default = 'quad', choices = list(LAYOUTS))
+    parser.add_argument('-store','--store', help = 'The result store folder',                                        default = STORE_DIR, type = str)
+    parser.add_argument('-methods','--methods', help = 'The stored methods to assemble, comma separated',            default = 'xray,xtalk,frbias', type = str)
+    parser.add_argument('-occupancy','--occupancy', help = 'Run # of the occupancy scan (xray classified on the module map)', default = None, type = str)
+    parser.add_argument('-txt','--txt', help = 'The chip txt files, {chip} is replaced by the chip ID',              default = None, type = str)
+    parser.add_argument('-input','--input', help = 'The folder with the root files',                                 default = 'input', type = str)
+    parser.add_argument('-thr_missing','--thr_missing', help = 'The threshold to classify the missing bumps [Hits]', default = 1, type = int)
+    parser.add_argument('-thr_strange','--thr_strange', help = 'The threshold to classify the Low Occ bumps [Hits]', default = 1000, type = int)
+    parser.add_argument('-ntrg','--ntrg', help = 'The total # of triggers in the xml',                               default = int(1e7), type = TriggerCount)
+    parser.add_argument('-nbx','--nbx', help = 'The total # of bunch crossing for each trigger in the xml',          default = 10, type = int)
+    parser.add_argument('-outpath','--outpath', help = 'The folder of the module image',                             default = 'results_module/', type = str)
+    parser.add_argument('-noplots','--noplots', help = 'Do not draw the module image',                               action = 'store_true')
+    args = parser.parse_args()
+
+    layout = LAYOUTS[args.layout]
+    status_maps = {}
+    if args.occupancy:
+        if not args.txt: parser.error('-txt is needed with -occupancy')
+        try: status_maps['xray'], summary = XRayModule(RunFile(args.occupancy,'PixelAlive',args.input),args.txt,layout,
+                                                       args.thr_missing,args.thr_strange,args.ntrg,args.nbx,args.module)
+        except KeyError as error: raise SystemExit(error.args[0])
+        print('xray (module): masked '+str(summary['disabled'])+', missing '+str(summary['missing'])+' ('+str(summary['perc_missing'])+'%), low occ '
+              +str(summary['low_occ'])+' ('+str(summary['perc_low_occ'])+'%)')
+    for method in args.methods.split(','):
+        if method in status_maps: continue
+        try: status_maps[method] = StoredModule(args.store,args.module,method,layout)
+        except KeyError as error: print(error.args[0]); continue
+        print(method+' (module): missing '+str(int(np.count_nonzero(MissingMask(status_maps[method])))))
+
+    if not status_maps: return
+    missing_maps = {method: MissingMask(status) for method,status in status_maps.items()}
+    names, codes = overlap_codes(missing_maps)
+    if len(names) > 1:
+        for name,count in compare_methods(missing_maps)[1].items(): print(name+':\t'+str(count))
+    if not args.noplots:
+        if not os.path.exists(args.outpath): os.makedirs(args.outpath)
+        print('Saved '+PlotModule(status_maps,codes,names,layout,args.module,os.path.join(args.outpath,args.module+'_module_map.png')))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+##############################################################################
+# Accumulation of the X-Ray occupancy of many runs of the same chips
+# Usage: python3 occupancy.py -module RH0026 -add Run000046 [Run000047 ...] -txt input/txt/Run000081_CMSIT_RD53_RH0026_0_{chip}.txt
+#        [-chip 12,13] [-ntrg 1e7] [-nbx 10] [-thr_missing 1] [-thr_strange 1000] [-store results_store]
+# Every chip keeps the sum of its hits (PixelAlive * nTrg * nBX) and of its triggers in
+# <store>/<module>/chip_<chip>/occupancy.npz: adding a run reads only that run and the stored totals, whatever
+# the number of runs already accumulated. Runs already in the sums (same file content) are skipped.
+# The missing bumps are then classified on the summed hits: missing if total hits < thr_missing, low occ if
+# total hits < thr_strange * accumulated triggers / (ntrg * nbx): thr_strange is the cut of one run of -ntrg x -nbx
+# triggers and is scaled by the triggers really summed, so runs taken with a different -ntrg/-nbx (given when they
+# are added) are compared with the right cut. The status map is saved in the store
+# as method 'xray_accumulated', run 'accumulated' (one entry per chip, overwritten at every update; the runs and
+# thresholds are in its summary), so the per-run xray results stay the newest 'xray' entries.
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+##############################################################################
+import os
+import glob
+import argparse
+import numpy as np
+from resultstore import SaveResult, RunName, STORE_DIR
+
+METHOD = 'xray_accumulated' # method of the classification of the accumulated hits in the result store
+
+def AccumulatorPath(store,module,chip):
+    return os.path.join(store, str(module), 'chip_'+str(int(chip)), 'occupancy.npz')
+
+# Stored totals of a chip: {'hits': (rows, cols) float64, 'triggers': float, 'runs': [run names], 'hashes': [file hashes]} (None if empty)
+def LoadAccumulated(store,module,chip):
+    path = AccumulatorPath(store,module,chip)
+    if not os.path.exists(path): return None
+    with np.load(path) as acc:
+        return {'hits': acc['hits'], 'triggers': float(acc['triggers']), 'runs': list(acc['runs']), 'hashes': list(acc['hashes'])}
+
+def _SaveAccumulated(store,module,chip,acc):
+    path = AccumulatorPath(store,module,chip)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path[:-4]+'.'+str(os.getpid())+'.tmp.npz'
+    np.savez(tmp_path, hits=acc['hits'], triggers=np.float64(acc['triggers']), runs=np.array(acc['runs'], dtype=str), hashes=np.array(acc['hashes'], dtype=str))
+    os.replace(tmp_path, path)
+
+# Adds one occupancy run to the totals of the chips (each file opened once). Returns {chip: True if added, False if already there}
+def AddRun(store,module,occupancy_file,chips=None,nTrg=1e7,nBX=10):
+    from mapcache import FileHash
+    from rootextract import ExtractModuleMaps
+    file_hash = FileHash(occupancy_file)
+    added = {}
+    maps = ExtractModuleMaps(occupancy_file,{'PixelAlive':'2D'},chips)
+    for chip,scans in maps.items():
+        acc = LoadAccumulated(store,module,chip)
+        if acc is not None and file_hash in acc['hashes']:
+            added[chip] = False; continue
+        hits = scans['PixelAlive']*np.float64(nTrg*nBX)
+        if acc is None: acc = {'hits': hits, 'triggers': 0.0, 'runs': [], 'hashes': []}
+        else: acc['hits'] += hits
+        acc['triggers'] += float(nTrg*nBX); acc['runs'].append(RunName(occupancy_file)); acc['hashes'].append(file_hash)
+        _SaveAccumulated(store,module,chip,acc)
+        added[chip] = True
+    return added
+
+# Classifies the accumulated hits of a chip. Thr_strange is the Low Occ cut of one run of run_triggers (nTrg * nBX) triggers,
+# scaled by the accumulated triggers. Returns the status map and the summary (classify.SummarizeStatus + runs, triggers, cut)
+def ClassifyAccumulated(acc,Enable,Thr=1,Thr_strange=1000,run_triggers=1e8):
+    from classify import ClassifyMissing, SummarizeStatus
+    thr_low_occ = Thr_strange*acc['triggers']/float(run_triggers)
+    status = ClassifyMissing(acc['hits'],Enable,Thr,thr_low_occ)
+    summary = SummarizeStatus(status)
+    summary.update({'runs': len(acc['runs']), 'triggers': acc['triggers'], 'thr_low_occ': thr_low_occ})
+    return status, summary
+
+def main():
+    from txtconfig import GetEnableMask
+    from rootextract import TriggerCount, RunFile
+    parser = argparse.ArgumentParser(description='Accumulate the X-Ray occupancy of several runs and classify the missing bumps')
+    parser.add_argument('-module','--module', help = 'The name of the module',                                       required = True, type = str)
+    parser.add_argument('-add','--add', help = 'Run # (or root files) of the occupancy scans to add',                nargs = '*', default = [])
+    parser.add_argument('-input','--input', help = 'The folder with the root files',                                 default = 'input', type = str)
+    parser.add_argument('-scan','--scan', help = 'The occupancy scan of the run files',                              default = 'PixelAlive', type = str)
+    parser.add_argument('-chip','--chip', help = 'The ROC ID(s), comma separated (default: all chips in the files)', default = None, type = str)
+    parser.add_argument('-txt','--txt', help = 'The chip txt files, {chip} is replaced by the chip ID',              required = True, type = str)
+    parser.add_argument('-ntrg','--ntrg', help = 'The total # of triggers in the xml',                               default = int(1e7), type = TriggerCount)
+    parser.add_argument('-nbx','--nbx', help = 'The total # of bunch crossing for each trigger in the xml',          default = 10, type = int)
+    parser.add_argument('-thr_missing','--thr_missing', help = 'The threshold to classify the missing bumps [Hits]', default = 1, type = int)
+    parser.add_argument('-thr_strange','--thr_strange', help = 'The Low Occ threshold of one run of -ntrg x -nbx triggers [Hits]', default = 1000, type = int)
+    parser.add_argument('-store','--store', help = 'The result store folder',                                        default = STORE_DIR, type = str)
+    parser.add_argument('-reset','--reset', help = 'Clear the accumulated runs of the chips first (-chip or all)',    action = 'store_true')
+    args = parser.parse_args()
+
+    chips = None if args.chip is None else [int(chip) for chip in args.chip.split(',')]
+    if args.reset:
+        paths = [AccumulatorPath(args.store,args.module,chip) for chip in chips] if chips else glob.glob(AccumulatorPath(args.store,args.module,0).replace('chip_0','chip_*'))
+        for path in paths:
+            if os.path.exists(path): os.remove(path); print('Reset '+path)
+    touched = set(chips or [])
+    for run in args.add:
+        added = AddRun(args.store,args.module,RunFile(run,args.scan,args.input),chips,args.ntrg,args.nbx)
+        for chip,new in sorted(added.items()):
+            print(run+' chip '+str(chip)+(': added' if new else ': already accumulated, skipped'))
+        touched |= set(added)
+
+    for chip in sorted(touched):
+        acc = LoadAccumulated(args.store,args.module,chip)
+        if acc is None: print('chip '+str(chip)+': no accumulated run'); continue
+        if not os.path.exists(args.txt.format(chip=chip)): print('chip '+str(chip)+': no txt file '+args.txt.format(chip=chip)+', not classified'); continue
+        status, summary = ClassifyAccumulated(acc,GetEnableMask(args.txt.format(chip=chip)),args.thr_missing,args.thr_strange,args.ntrg*args.nbx)
+        summary.update({'thr_missing': args.thr_missing, 'thr_strange': args.thr_strange, 'accumulated_runs': sorted(acc['runs'])})
+        SaveResult(args.store,args.module,chip,METHOD,'accumulated',status,summary)
+        print('chip '+str(chip)+': '+str(summary['runs'])+' runs, '+'{:.3g}'.format(summary['triggers'])+' triggers -- masked '+str(summary['disabled'])
+              +', missing '+str(summary['missing'])+' ('+str(summary['perc_missing'])+'%), low occ '+str(summary['low_occ'])+' ('+str(summary['perc_low_occ'])+'%)')
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+##############################################################################
+# Campaign pipeline: xray -> xtalk -> frbias -> comparison for every chip, in memory
+# Input: a manifest (csv) with one line per chip:
+#   module,chip,scurve,occupancy,txt,injtype1,injtype5,injtype6,forward,reverse
+#   [,bias,thr_missing,thr_strange,ntrg,nbx,vref,alive_eff,coupled_eff,uncoupled_eff,cut]
+#   (run numbers or root files, see xraybatch.py). Leave the columns of a method empty to skip that method.
+# Usage: python3 pipeline.py -manifest <manifest.csv> -store <result store> -jobs <# of workers> [-plots none|summary|full]
+# Output: status maps + summaries of every method and of the comparison in the result store,
+#         campaign table in <outpath>/pipeline_summary.csv. No intermediate root file is written.
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+##############################################################################
+import os
+import csv
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from rootextract import RunFile, TxtFile
+from resultstore import SaveResult, RunName, MissingMask
+
+# Reads the manifest and returns one dict per chip with the input files of each method
+def ReadPipelineManifest(manifest_path,input_dir='input',outpath='results_pipeline/',plotset='none',dpi=300):
+    entries = []
+    with open(manifest_path, newline='') as file:
+        rows = csv.DictReader(line for line in file if line.strip() and not line.startswith('#'))
+        for row in rows:
+            row = {key.strip(): value.strip() for key,value in row.items() if key and value}
+            entry = {'module': row['module'], 'chip': int(row['chip'])}
+            if 'scurve' in row and 'occupancy' in row and 'txt' in row:
+                entry['xray'] = dict(Sensor=row['module'], chipID=row['chip'], thr_data_file=RunFile(row['scurve'],'SCurve',input_dir),
+                                     analyzed_data_file=RunFile(row['occupancy'],'PixelAlive',input_dir),
+                                     analyzed_txt_file=TxtFile(row['txt'],input_dir), Path=outpath, verbose=False, plotset=plotset, dpi=dpi)
+                for column,key,cast in [('bias','Voltage_1',str),('thr_missing','Thr',int),('thr_strange','Thr_strange',int),
+                                        ('ntrg','nTrg',lambda value: int(float(value))),('nbx','nBX',int),('vref','V_adc',int)]:
+                    if column in row: entry['xray'][key] = cast(row[column])
+            if 'injtype1' in row and 'injtype5' in row and 'injtype6' in row:
+                entry['xtalk'] = [RunFile(row[column],'PixelAlive',input_dir) for column in ('injtype1','injtype5','injtype6')]
+                entry['xtalk_params'] = {key: float(row.get(key, default)) for key,default in
+                                         [('alive_eff',0.9),('coupled_eff',0.5),('uncoupled_eff',0.3)]}
+            if 'forward' in row and 'reverse' in row:
+                entry['frbias'] = [RunFile(row[column],'SCurve',input_dir) for column in ('forward','reverse')]
+                entry['cut'] = float(row.get('cut', 0.5))
+            entries.append(entry)
+    return entries
+
+# Runs every method available for one chip and compares them, keeping all the maps in memory.
+# Only the final status maps and summaries are written (result store) + the xray plots if requested
+def ProcessChip(entry,store):
+    import numpy as np
+    from rootextract import ExtractChipMaps
+    from histcomparison import compare_methods
+    module, chip = entry['module'], entry['chip']
+    summary = {'module': module, 'chip': chip}; missing_maps = {}
+
+    if 'xray' in entry:
+        import xray
+        cfg = xray.ChipConfig(**entry['xray'], store=store)
+        xray_summary, status, maps = xray.XRayChip(cfg)
+        xray.PlotsFromSummary(cfg, xray_summary, status, maps)
+        if store: xray.StoreResult(cfg, status, xray_summary)
+        summary.update({'xray_'+key: value for key,value in xray_summary.items() if key not in ('module','chip')})
+        missing_maps['xray'] = MissingMask(status)
+
+    if 'xtalk' in entry:
+        from xtalk import XTalkAnalysis, XTalkCounts, CONFIRMED
+        pa = [ExtractChipMaps(file_path, {'PixelAlive':'2D'}, chip)['PixelAlive'] for file_path in entry['xtalk']]
+        status = XTalkAnalysis(*pa, **entry['xtalk_params'])
+        counts = XTalkCounts(status)
+        if store: SaveResult(store, module, chip, 'xtalk', RunName(entry['xtalk'][0]), status, counts, entry['xtalk_params'])
+        summary.update({'xtalk_'+key: value for key,value in counts.items()})
+        missing_maps['xtalk'] = status == CONFIRMED
+
+    if 'frbias' in entry:
+        from frbias import FRBiasAnalysis
+        forward, reverse = [ExtractChipMaps(file_path, {'Threshold2D':'2D','Noise2D':'2D'}, chip) for file_path in entry['frbias']]
+        missing_map = FRBiasAnalysis(forward['Threshold2D'], forward['Noise2D'], reverse['Threshold2D'], reverse['Noise2D'], entry['cut'])[2]
+        counts = {'missing': int(np.count_nonzero(missing_map))}
+        if store: SaveResult(store, module, chip, 'frbias', RunName(entry['frbias'][0])+'-'+RunName(entry['frbias'][1]),
+                             missing_map, counts, {'cut': entry['cut']})
+        summary['frbias_missing'] = counts['missing']
+        missing_maps['frbias'] = missing_map
+
+    if len(missing_maps) > 1:
+        regions, counts = compare_methods(missing_maps)
+        summary.update(counts)
+        if store:
+            from histcomparison import overlap_codes
+            methods, codes = overlap_codes(missing_maps)
+            SaveResult(store, module, chip, 'comparison', '-'.join(methods), codes, counts, {'methods': methods})
+    return summary
+
+def _ProcessEntry(entry,store):
+    try:
+        return ProcessChip(entry,store)
+    except Exception as error:
+        return {'module': entry['module'], 'chip': entry['chip'], 'error': type(error).__name__+': '+str(error)}
+
+# Processes all the chips of the manifest in a process pool (in manifest order)
+def RunPipeline(entries,store,jobs=None):
+    results = [None]*len(entries)
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = {pool.submit(_ProcessEntry,entry,store): i for i,entry in enumerate(entries)}
+        for future in as_completed(futures):
+            result = future.result()
+            results[futures[future]] = result
+            print('Done: module '+result['module']+' chip '+str(result['chip'])+(' -- ERROR '+result['error'] if 'error' in result else ''))
+    return results
+
+def WritePipelineSummary(results,file_path):
+    fields = []
+    for result in results:
+        fields += [key for key in result if key not in fields]
+    with open(file_path, 'w', newline='') as file:
+        writer = csv.DictWriter(file, fieldnames=fields)
+        writer.writeheader()
+        writer.writerows(results)
+    print('Summary saved to '+file_path)
+
+def main():
+    parser = argparse.ArgumentParser(description='Run xray, xtalk, frbias and their comparison for a whole campaign')
+    parser.add_argument('-manifest','--manifest', help = 'The csv manifest (one line per chip)',                     required = True, type = str)
+    parser.add_argument('-input','--input', help = 'The folder with the root files (and txt/ subfolder)',            default = 'input', type = str)
+    parser.add_argument('-store','--store', help = 'The result store folder',                                        default = 'results_store', type = str)
+    parser.add_argument('-outpath','--outpath', help = 'The folder of the summary table and of the plots',           default = 'results_pipeline/', type = str)
+    parser.add_argument('-plots','--plots', help = 'The set of xray plots to produce for each chip',                 default = 'none', choices = ['full','summary','none'])
+    parser.add_argument('-dpi','--dpi', help = 'The resolution of the png plots',                                    default = 300, type = int)
+    parser.add_argument('-jobs','--jobs', help = 'The number of worker processes (default: # of cpus)',              default = None, type = int)
+    args = parser.parse_args()
+
+    outpath = os.path.join(args.outpath,'')
+    entries = ReadPipelineManifest(args.manifest,args.input,outpath,args.plots,args.dpi)
+    if not os.path.exists(outpath): os.makedirs(outpath)
+    results = RunPipeline(entries,args.store,args.jobs)
+    WritePipelineSummary(results,os.path.join(outpath,'pipeline_summary.csv'))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+##############################################################################
+# Pixel history database: status of every pixel per (module, chip, method, run, bias) as packed bitmaps in SQLite
+# Usage: python3 pixeldb.py -query import  [-store results_store] [-db results_store/pixel_history.sqlite]
+#        python3 pixeldb.py -query history -module RH0026 -chip 12 -pixel 120,37 [-method xray]
+#        python3 pixeldb.py -query new     -module RH0026 -chip 12 -method xray -from 80 -to 120      (bias [V] or run names)
+#        python3 pixeldb.py -query trend   -module RH0026 -chip 12 -method xray [-order bias|time]
+#        python3 pixeldb.py -query stable  -module RH0026 -chip 12 -method xray [-runs Run000046,Run000047]
+# Every stored result (resultstore.py) becomes one row: missing and low occ maps packed 8 pixels per byte
+# (np.packbits, row-major, 336 x 432 pixels -> 18144 bytes each) + the counts, the bias and the parameters.
+# Queries combine the bitmaps with bitwise operations (no map is rescanned): newly failing = OR(to) & ~OR(from),
+# always missing = AND, ever missing = OR, unstable = OR & ~AND; the history of one pixel reads one byte per run
+# (substr in SQL). Import is incremental: results already in the database and not rewritten since are skipped.
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+##############################################################################
+import os
+import json
+import sqlite3
+import argparse
+import numpy as np
+from resultstore import FindResults, MissingMask, STORE_DIR
+
+DB_NAME = 'pixel_history.sqlite'
+SKIP_METHODS = ['comparison'] # overlap codes, not status maps
+_POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint16)
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS results (
+    id INTEGER PRIMARY KEY, module TEXT NOT NULL, chip INTEGER NOT NULL, method TEXT NOT NULL, run TEXT NOT NULL,
+    params TEXT NOT NULL, bias REAL, label TEXT, mtime REAL NOT NULL, num_rows INTEGER NOT NULL, num_cols INTEGER NOT NULL,
+    missing_count INTEGER NOT NULL, low_occ_count INTEGER NOT NULL, missing BLOB NOT NULL, low_occ BLOB NOT NULL,
+    UNIQUE(module, chip, method, run, params));
+CREATE INDEX IF NOT EXISTS results_chip ON results(module, chip, method, bias, mtime);
+'''
+
+def Connect(db_path):
+    outdir = os.path.dirname(db_path)
+    if outdir and not os.path.exists(outdir): os.makedirs(outdir)
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    conn.executescript(_SCHEMA)
+    return conn
+
+# Packed bitmap of a boolean map and back
+def PackMask(mask):
+    return np.packbits(np.asarray(mask, dtype=bool).ravel()).tobytes()
+
+def UnpackMask(blob,shape):
+    return np.unpackbits(np.frombuffer(blob, dtype=np.uint8), count=shape[0]*shape[1]).reshape(shape).astype(bool)
+
+def CountBits(bitmap):
+    return int(_POPCOUNT[bitmap].sum())
+
+# Pixels (row, col) set in a packed bitmap
+def BitmapPixels(bitmap,num_cols):
+    index = np.flatnonzero(np.unpackbits(bitmap))
+    return [(int(i//num_cols), int(i%num_cols)) for i in index]
+
+def _Bias(params):
+    try: return float(str(params.get('bias')).rstrip('Vv'))
+    except (TypeError, ValueError): return None
+
+# Adds (or replaces) one status map. Returns the row id
+def AddResult(conn,module,chip,method,run,status,params=None,bias=None,label=None,mtime=0.0):
+    status = np.asarray(status)
+    params = params or {}
+    missing = MissingMask(status); low_occ = status == -1
+    cursor = conn.execute('INSERT OR REPLACE INTO results (module, chip, method, run, params, bias, label, mtime, num_rows, num_cols, '
+                          'missing_count, low_occ_count, missing, low_occ) VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?)',
+                          (str(module), int(chip), method, str(run), json.dumps(params, sort_keys=True, default=str),
+                           _Bias(params) if bias is None else float(bias), label, float(mtime), status.shape[0], status.shape[1],
+                           int(np.count_nonzero(missing)), int(np.count_nonzero(low_occ)), PackMask(missing), PackMask(low_occ)))
+    return cursor.lastrowid
+
+# Imports the results of a result store (only the new or rewritten ones). Returns the # of imported results
+def ImportStore(conn,store,module=None,chip=None,method=None):
+    known = {(row['module'], row['chip'], row['method'], row['run'], row['params']): row['mtime']
+             for row in conn.execute('SELECT module, chip, method, run, params, mtime FROM results')}
+    imported = 0
+    with conn:
+        for meta in FindResults(store,module,chip,method):
+            if meta['method'] in SKIP_METHODS: continue
+            key = (str(meta['module']), int(meta['chip']), meta['method'], str(meta['run']), json.dumps(meta['params'], sort_keys=True, default=str))
+            if known.get(key, -1) >= meta['mtime']: continue
+            AddResult(conn,meta['module'],meta['chip'],meta['method'],meta['run'],np.load(meta['path'], mmap_mode='r'),
+                      meta['params'],mtime=meta['mtime'])
+            imported += 1
+    return imported
+
+# Results of a chip (without the bitmaps), ordered by bias or by time. runs: run names and/or bias values to keep
+def SelectResults(conn,module,chip,method=None,runs=None,order='bias'):
+    query = 'SELECT id, module, chip, method, run, params, bias, label, mtime, num_rows, num_cols, missing_count, low_occ_count FROM results WHERE module=? AND chip=?'
+    values = [str(module), int(chip)]
+    if method: query += ' AND method=?'; values.append(method)
+    query += ' ORDER BY '+('bias, mtime' if order == 'bias' else 'mtime')
+    rows = [dict(row) for row in conn.execute(query, values)]
+    if runs: rows = [row for row in rows if _Matches(row,runs)]
+    return rows
+
+# A run selector is a run name or a bias value ('120', '120V')
+def _Matches(row,runs):
+    for run in runs:
+        if row['run'] == run: return True
+        try:
+            if row['bias'] is not None and float(run.rstrip('Vv')) == row['bias']: return True
+        except ValueError: continue
+    return False
+
+def _Bitmaps(conn,ids,column='missing'):
+    if not ids: return np.zeros((0,0), dtype=np.uint8)
+    rows = {row[0]: row[1] for row in conn.execute('SELECT id, '+column+' FROM results WHERE id IN ('+','.join('?'*len(ids))+')', ids)}
+    return np.stack([np.frombuffer(rows[i], dtype=np.uint8) for i in ids])
+
+# Status of one pixel in every result of a chip: [(method, run, bias, 'missing'|'low_occ'|'ok')], one byte read per result
+def PixelHistory(conn,module,chip,row,col,method=None,order='bias'):
+    results = SelectResults(conn,module,chip,method,order=order)
+    history = []
+    for result in results:
+        index = row*result['num_cols']+col; shift = 7-index%8
+        missing, low_occ = conn.execute('SELECT substr(missing, ?, 1), substr(low_occ, ?, 1) FROM results WHERE id=?',
+                                        (index//8+1, index//8+1, result['id'])).fetchone()
+        state = 'missing' if missing[0] >> shift & 1 else 'low_occ' if low_occ[0] >> shift & 1 else 'ok'
+        history.append((result['method'], result['run'], result['bias'], state))
+    return history
+
+# Pixels missing in any result of 'after' and in none of 'before' (run names or bias values). Returns (pixels, before rows, after rows)
+def NewlyFailing(conn,module,chip,method,before,after):
+    rows_before = SelectResults(conn,module,chip,method,before); rows_after = SelectResults(conn,module,chip,method,after)
+    if not rows_before or not rows_after: raise KeyError('No result for '+(str(before) if not rows_before else str(after)))
+    bitmap = np.bitwise_or.reduce(_Bitmaps(conn,[row['id'] for row in rows_after])) & ~np.bitwise_or.reduce(_Bitmaps(conn,[row['id'] for row in rows_before]))
+    return BitmapPixels(bitmap,rows_after[0]['num_cols']), rows_before, rows_after
+
+# Missing bumps of a chip along its runs: count, new and recovered w.r.t. the previous run, ever missing so far
+def Trend(conn,module,chip,method,runs=None,order='bias'):
+    rows = SelectResults(conn,module,chip,method,runs,order)
+    bitmaps = _Bitmaps(conn,[row['id'] for row in rows])
+    ever = np.zeros(bitmaps.shape[1:], dtype=np.uint8)
+    trend = []
+    for i,row in enumerate(rows):
+        previous = bitmaps[i-1] if i else np.zeros_like(ever)
+        ever |= bitmaps[i]
+        trend.append({'run': row['run'], 'bias': row['bias'], 'missing': row['missing_count'], 'low_occ': row['low_occ_count'],
+                      'new': CountBits(bitmaps[i] & ~previous), 'recovered': CountBits(previous & ~bitmaps[i]) if i else 0, 'ever': CountBits(ever)})
+    return trend
+
+# Always missing (AND), ever missing (OR) and unstable (missing in some runs only) pixels of the selected runs
+def Stability(conn,module,chip,method,runs=None):
+    rows = SelectResults(conn,module,chip,method,runs)
+    if not rows: raise KeyError('No result for module '+str(module)+' chip '+str(chip)+' method '+str(method))
+    bitmaps = _Bitmaps(conn,[row['id'] for row in rows])
+    always = np.bitwise_and.reduce(bitmaps); ever = np.bitwise_or.reduce(bitmaps)
+    return {'runs': len(rows), 'always': always, 'ever': ever, 'unstable': ever & ~always, 'num_cols': rows[0]['num_cols']}
+
+def _RunLabel(row):
+    return row['run']+('' if row['bias'] is None else ' ('+'{:g}'.format(row['bias'])+' V)')
+
+def main():
+    parser = argparse.ArgumentParser(description='Pixel status history over the stored runs')
+    parser.add_argument('-query','--query', help = 'The query to run',                                               required = True, choices = ['import','history','new','trend','stable'])
+    parser.add_argument('-store','--store', help = 'The result store folder',                                        default = STORE_DIR, type = str)
+    parser.add_argument('-db','--db', help = 'The database (default: <store>/'+DB_NAME+')',                          default = None, type = str)
+    parser.add_argument('-module','--module', help = 'The name of the module',                                       default = None, type = str)
+    parser.add_argument('-chip','--chip', help = 'The ROC ID',                                                       default = None, type = int)
+    parser.add_argument('-method','--method', help = 'The analysis method (xray, xtalk, frbias)',                    default = None, type = str)
+    parser.add_argument('-pixel','--pixel', help = 'The pixel of the history query (row,col)',                       default = None, type = str)
+    parser.add_argument('-from','--from', help = 'Reference runs or bias values, comma separated',                   default = None, type = str, dest = 'before')
+    parser.add_argument('-to','--to', help = 'Compared runs or bias values, comma separated',                         default = None, type = str, dest = 'after')
+    parser.add_argument('-runs','--runs', help = 'The runs or bias values of trend/stable, comma separated (default: all)', default = None, type = str)
+    parser.add_argument('-order','--order', help = 'The order of the runs',                                           default = 'bias', choices = ['bias','time'])
+    parser.add_argument('-top','--top', help = 'The # of pixels listed',                                              default = 50, type = int)
+    args = parser.parse_args()
+
+    conn = Connect(args.db or os.path.join(args.store, DB_NAME))
+    if args.query == 'import':
+        print('Imported '+str(ImportStore(conn,args.store,args.module,args.chip,args.method))+' results, '
+              +str(conn.execute('SELECT count(*) FROM results').fetchone()[0])+' in the database')
+        return
+    if args.module is None or args.chip is None: parser.error('-module and -chip are needed with -query '+args.query)
+    if args.query != 'history' and not args.method: parser.error('-method is needed with -query '+args.query)
+    runs = args.runs.split(',') if args.runs else None
+    if args.query == 'history':
+        if not args.pixel: parser.error('-pixel row,col is needed with -query history')
+        row, col = (int(value) for value in args.pixel.split(','))
+        for method,run,bias,state in PixelHistory(conn,args.module,args.chip,row,col,args.method,args.order):
+            print(method+'\t'+run+'\t'+('' if bias is None else '{:g}'.format(bias)+' V')+'\t'+state)
+    elif args.query == 'new':
+        if not args.before or not args.after: parser.error('-from and -to are needed with -query new')
+        pixels, rows_before, rows_after = NewlyFailing(conn,args.module,args.chip,args.method,args.before.split(','),args.after.split(','))
+        print(str(len(pixels))+' pixels missing in '+', '.join(map(_RunLabel, rows_after))+' and not in '+', '.join(map(_RunLabel, rows_before)))
+        if pixels: print('  (row, col): '+', '.join(str(pixel) for pixel in pixels[:args.top])+(' ...' if len(pixels) > args.top else ''))
+    elif args.query == 'trend':
+        print('{:<24} {:>8} {:>8} {:>6} {:>10} {:>6}'.format('run', 'missing', 'low occ', 'new', 'recovered', 'ever'))
+        for row in Trend(conn,args.module,args.chip,args.method,runs,args.order):
+            print('{:<24} {:>8} {:>8} {:>6} {:>10} {:>6}'.format(_RunLabel(row), row['missing'], row['low_occ'], row['new'], row['recovered'], row['ever']))
+    else:
+        stability = Stability(conn,args.module,args.chip,args.method,runs)
+        print(str(stability['runs'])+' runs: always missing '+str(CountBits(stability['always']))+', ever missing '+str(CountBits(stability['ever']))
+              +', unstable '+str(CountBits(stability['unstable'])))
+        pixels = BitmapPixels(stability['unstable'],stability['num_cols'])
+        if pixels: print('  unstable (row, col): '+', '.join(str(pixel) for pixel in pixels[:args.top])+(' ...' if len(pixels) > args.top else ''))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+##############################################################################
+# Summary-only campaign report: one csv + one static html page with small thumbnails, from the result store
+# Usage: python3 report.py [-store results_store] [-module RH0026] [-outpath results_report/] [-jobs 4] [-scale 4] [-warn 1.0]
+# Input: the results written by xray.py/xraybatch.py/pipeline.py -store (newest result of every method per chip).
+# Output: <outpath>/campaign_report.csv (one line per chip: masked, missing, low occ, fit/readout errors,
+#         threshold/noise mean and sigma, xtalk/frbias missing, overlap region counts) and <outpath>/campaign_report.html
+#         (the same table with one thumbnail per method, embedded as png, chips above -warn % missing highlighted).
+# Thumbnails are the status maps reduced by -scale in each direction (a block shows its worst pixel: missing >
+# low occ > masked > good) and written as RGB pngs without figures, in a process pool. No ROOT, no full resolution plot.
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+##############################################################################
+import os
+import io
+import csv
+import html
+import base64
+import argparse
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from resultstore import FindResults, STORE_DIR
+
+METHODS = ['xray', 'xtalk', 'frbias', 'comparison']
+XRAY_FIELDS = ['masked', 'missing', 'perc_missing', 'low_occ', 'perc_low_occ', 'fit_errors', 'readout_errors', 'readout_errors_xray',
+               'thr_mean', 'thr_sigma', 'noise_mean', 'noise_sigma']
+# Colors of the thumbnails: xray status codes (classify.py), missing of the other methods
+XRAY_COLORS = {-1: (255,165,0), 0: (0,0,255), 1: (255,0,0), 2: (255,255,255), 3: (255,255,255)}
+_SEVERITY = {2: 0, 3: 0, 0: 1, -1: 2, 1: 3} # worst pixel of a block wins
+WHITE = (255,255,255); RED = (255,0,0)
+
+# Newest result of every method of every chip: {(module, chip): {method: meta}}
+def LatestResults(store,module=None):
+    chips = {}
+    for meta in FindResults(store,module): # newest first
+        chips.setdefault((meta['module'], int(meta['chip'])), {}).setdefault(meta['method'], meta)
+    return dict(sorted(chips.items()))
+
+# One report line per chip from the stored summaries (no map is read)
+def ReportRow(module,chip,results):
+    row = {'module': module, 'chip': chip}
+    if 'xray' in results:
+        row['xray_run'] = results['xray']['run']; row['bias'] = results['xray']['params'].get('bias')
+        row.update({key: results['xray']['counts'].get(key) for key in XRAY_FIELDS})
+    if 'xtalk' in results:
+        row['xtalk_run'] = results['xtalk']['run']; row['xtalk_missing'] = results['xtalk']['counts'].get('confirmed')
+    if 'frbias' in results:
+        row['frbias_run'] = results['frbias']['run']; row['frbias_missing'] = results['frbias']['counts'].get('missing')
+    if 'comparison' in results:
+        row.update({region: count for region,count in results['comparison']['counts'].items()})
+    return row
+
+# Reduces a status map by scale x scale blocks keeping the worst pixel of every block
+def Downsample(status,scale,severity=None):
+    status = np.asarray(status)
+    rows, cols = status.shape[0]//scale*scale, status.shape[1]//scale*scale
+    ranked = status[:rows,:cols] if severity is None else severity[status[:rows,:cols]-min(_SEVERITY)]
+    return ranked.reshape(rows//scale, scale, cols//scale, scale).max(axis=(1,3))
+
+# RGB thumbnail (rows, cols, 3) of a stored status map, row 0 at the bottom like the plots
+def Thumbnail(method,status,scale,regions=None):
+    if method == 'xray':
+        severity = np.zeros(max(_SEVERITY)-min(_SEVERITY)+1, dtype=np.int8)
+        for code,rank in _SEVERITY.items(): severity[code-min(_SEVERITY)] = rank
+        palette = np.array([XRAY_COLORS[3], XRAY_COLORS[0], XRAY_COLORS[-1], XRAY_COLORS[1]], dtype=np.uint8)
+        image = palette[Downsample(status,scale,severity)]
+    elif method == 'comparison':
+        from histcomparison import region_color
+        palette = np.array([WHITE]+[tuple(int(color[i:i+2], 16) for i in (1,3,5)) for color in
+                                    (region_color(regions[code], code) for code in range(1, len(regions)+1))], dtype=np.uint8)
+        image = palette[Downsample(status,scale)]
+    else:
+        image = np.array([WHITE, RED], dtype=np.uint8)[Downsample(np.asarray(status) == 1,scale).astype(np.int8)]
+    return image[::-1]
+
+# png bytes of the thumbnails of one chip ({method: base64 png}), run in the pool workers
+def ChipThumbnails(results,scale):
+    from matplotlib.image import imsave
+    from histcomparison import overlap_regions
+    thumbnails = {}
+    for method,meta in results.items():
+        if method not in METHODS: continue
+        regions = {mask: name for name,mask,exclusive in overlap_regions(meta['params']['methods'])} if method == 'comparison' else None
+        buffer = io.BytesIO()
+        imsave(buffer, Thumbnail(method,np.load(meta['path'], mmap_mode='r'),scale,regions), format='png')
+        thumbnails[method] = base64.b64encode(buffer.getvalue()).decode()
+    return thumbnails
+
+def WriteReportCsv(rows,file_path):
+    fields = []
+    for row in rows: fields += [key for key in row if key not in fields]
+    with open(file_path, 'w', newline='') as file:
+        writer = csv.DictWriter(file, fieldnames=fields)
+        writer.writeheader()
+        writer.writerows(rows)
+    return fields
+
+def _Cell(value):
+    if value is None: return ''
+    if isinstance(value, float): return '{:.4g}'.format(value)
+    return html.escape(str(value))
+
+# Static html page: campaign totals, then one table row per chip with its numbers and thumbnails
+def WriteReportHtml(rows,fields,thumbnails,file_path,title='Campaign report',warn=1.0):
+    numbers = [field for field in fields if field not in ('module','chip','xray_run','xtalk_run','frbias_run','bias')]
+    shown = [method for method in METHODS if any(method in chip_thumbnails for chip_thumbnails in thumbnails)]
+    totals = {field: sum(row.get(field) or 0 for row in rows) for field in ('masked','missing','low_occ','xtalk_missing','frbias_missing') if field in fields}
+    lines = ['<!DOCTYPE html>', '<html><head><meta charset="utf-8"><title>'+html.escape(title)+'</title>', '<style>',
+             'body{font-family:sans-serif;font-size:13px} table{border-collapse:collapse} th,td{border:1px solid #ccc;padding:2px 5px;text-align:right}',
+             'th{background:#eee;position:sticky;top:0} tr.warn td{background:#fdd} td.name{text-align:left} img{image-rendering:pixelated;display:block}',
+             '</style></head><body>', '<h2>'+html.escape(title)+'</h2>',
+             '<p>'+str(len(rows))+' chips'+''.join(', '+field+' '+str(total) for field,total in totals.items())+'. Highlighted: more than '+str(warn)+' % missing (xray).</p>',
+             '<table><tr><th>module</th><th>chip</th><th>runs</th><th>bias</th>'+''.join('<th>'+html.escape(field)+'</th>' for field in numbers)
+             +''.join('<th>'+method+'</th>' for method in shown)+'</tr>']
+    for row,chip_thumbnails in zip(rows,thumbnails):
+        warn_row = (row.get('perc_missing') or 0) > warn
+        runs = '<br>'.join(_Cell(row[key]) for key in ('xray_run','xtalk_run','frbias_run') if row.get(key))
+        lines.append('<tr'+(' class="warn"' if warn_row else '')+'><td class="name">'+_Cell(row['module'])+'</td><td>'+str(row['chip'])+'</td><td class="name">'+runs+'</td><td>'
+                     +_Cell(row.get('bias'))+'</td>'+''.join('<td>'+_Cell(row.get(field))+'</td>' for field in numbers)
+                     +''.join('<td>'+('<img src="data:image/png;base64,'+chip_thumbnails[method]+'" alt="'+method+'">' if method in chip_thumbnails else '')+'</td>'
+                              for method in shown)+'</tr>')
+    lines += ['</table>', '</body></html>']
+    with open(file_path, 'w') as file: file.write('\n'.join(lines))
+
+# Writes the csv and html report of the store. jobs: # of thumbnail processes (None: # of cpus, 1: in this process, 0: no thumbnail).
+# thumbnails: {(module, chip): (results key, thumbnails)} kept by the caller between two builds (watcher.py): only the chips
+# with a new result are drawn again. Returns (csv file, html file, # of chips), None if the store is empty
+def BuildReport(store,outpath,module=None,scale=4,jobs=None,warn=1.0,thumbnails=None):
+    chips = LatestResults(store,module)
+    if not chips: return None
+    rows = [ReportRow(module,chip,results) for (module,chip),results in chips.items()]
+    thumbnails = {} if thumbnails is None else thumbnails
+    if jobs != 0:
+        keys = {chip: (scale,)+tuple(sorted((method, meta['path'], meta['mtime']) for method,meta in results.items())) for chip,results in chips.items()}
+        todo = [chip for chip in chips if thumbnails.get(chip, (None,))[0] != keys[chip]]
+        if jobs == 1 or len(todo) <= 1: drawn = [ChipThumbnails(chips[chip],scale) for chip in todo]
+        else:
+            with ProcessPoolExecutor(max_workers=jobs) as pool:
+                drawn = list(pool.map(ChipThumbnails, [chips[chip] for chip in todo], [scale]*len(todo)))
+        thumbnails.update({chip: (keys[chip], chip_thumbnails) for chip,chip_thumbnails in zip(todo,drawn)})
+    if not os.path.exists(outpath): os.makedirs(outpath)
+    fields = WriteReportCsv(rows,os.path.join(outpath,'campaign_report.csv'))
+    WriteReportHtml(rows,fields,[thumbnails[chip][1] if jobs != 0 else {} for chip in chips],os.path.join(outpath,'campaign_report.html'),
+                    'Campaign report'+(' '+module if module else ''),warn)
+    return os.path.join(outpath,'campaign_report.csv'), os.path.join(outpath,'campaign_report.html'), len(rows)
+
+def main():
+    parser = argparse.ArgumentParser(description='Summary-only campaign report (csv + html with thumbnails) from the result store')
+    parser.add_argument('-store','--store', help = 'The result store folder',                                        default = STORE_DIR, type = str)
+    parser.add_argument('-module','--module', help = 'Only this module (default: every module in the store)',        default = None, type = str)
+    parser.add_argument('-outpath','--outpath', help = 'The folder of the report',                                   default = 'results_report/', type = str)
+    parser.add_argument('-jobs','--jobs', help = 'The number of processes drawing the thumbnails (default: # of cpus)', default = None, type = int)
+    parser.add_argument('-scale','--scale', help = 'The reduction of the thumbnails in each direction [pixels]',     default = 4, type = int)
+    parser.add_argument('-warn','--warn', help = 'Highlight the chips with more missing bumps [%]',                  default = 1.0, type = float)
+    parser.add_argument('-nothumbs','--nothumbs', help = 'Numbers only, no thumbnail',                               action = 'store_true')
+    args = parser.parse_args()
+
+    files = BuildReport(args.store,args.outpath,args.module,args.scale,0 if args.nothumbs else args.jobs,args.warn)
+    if files: print('Report of '+str(files[2])+' chips saved to '+files[0]+', '+files[1])
+    else: print('No result in '+args.store)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+##############################################################################
+# Result store of the per-chip analyses (xray, xtalk, frbias, ...)
+# Usage: from resultstore import SaveResult, LoadResult, FindResults
+#        SaveResult('results_store', 'RH0026', 12, 'xray', 'Run000040', status, counts, params={'thr_missing': 1})
+#        status, meta = LoadResult('results_store', 'RH0026', 12, 'xray')
+# Layout: <store>/<module>/chip_<chip>/<method>/<run>__<params key>.npy   status map, int8 (rows, cols)
+#                                                 <run>__<params key>.json  module, chip, method, run, params, counts
+# The status maps use the codes of classify.py (1 = MISSING for every method) and are loaded memory-mapped,
+# so comparison and reporting read them without ROOT. ExportToROOT writes an entry as a TH2F if a root file is needed.
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+##############################################################################
+import os
+import sys
+import glob
+import json
+import hashlib
+import numpy as np
+
+STORE_DIR = 'results_store'
+
+# Short stable key of the analysis parameters (same parameters -> same file, re-runs overwrite)
+def ParamsKey(params):
+    if not params: return 'default'
+    return hashlib.sha1(json.dumps(params, sort_keys=True, default=str).encode()).hexdigest()[:12]
+
+# Run name of a root file (input/Run000040_PixelAlive.root -> Run000040)
+def RunName(file_path):
+    return os.path.basename(file_path).split('_')[0].replace('.root','')
+
+def _EntryBase(store,module,chip,method,run,params):
+    return os.path.join(store, str(module), 'chip_'+str(int(chip)), method, str(run)+'__'+ParamsKey(params))
+
+def _Jsonable(value):
+    if isinstance(value, np.generic): return value.item()
+    if isinstance(value, np.ndarray): return value.tolist()
+    return value
+
+# Saves the status map and the summary numbers of one (module, chip, method, run, params) result
+def SaveResult(store,module,chip,method,run,status,counts=None,params=None):
+    base = _EntryBase(store,module,chip,method,run,params)
+    os.makedirs(os.path.dirname(base), exist_ok=True)
+    np.save(base+'.tmp.npy', np.ascontiguousarray(status, dtype=np.int8))
+    os.replace(base+'.tmp.npy', base+'.npy')
+    meta = {'module': str(module), 'chip': int(chip), 'method': method, 'run': str(run), 'params': params or {},
+            'counts': {key: _Jsonable(value) for key,value in (counts or {}).items()}, 'shape': list(np.shape(status))}
+    with open(base+'.tmp.json', 'w') as file: json.dump(meta, file, indent=1, default=str)
+    os.replace(base+'.tmp.json', base+'.json')
+    return base+'.npy'
+
+# Lists the results matching the given fields (None = any), newest first. Returns the metadata dicts (+ 'path' of the map)
+def FindResults(store,module=None,chip=None,method=None,run=None):
+    pattern = os.path.join(store, '*' if module is None else str(module), '*' if chip is None else 'chip_'+str(int(chip)),
+                           '*' if method is None else method, ('*' if run is None else glob.escape(str(run)))+'__*.json')
+    results = []
+    for json_path in glob.glob(pattern):
+        if json_path.endswith('.tmp.json'): continue
+        with open(json_path) as file: meta = json.load(file)
+        meta['path'] = json_path[:-len('.json')]+'.npy'
+        meta['mtime'] = os.path.getmtime(json_path)
+        results.append(meta)
+    return sorted(results, key=lambda meta: meta['mtime'], reverse=True)
+
+# Loads one status map (memory-mapped by default) and its metadata. With params=None (or run=None) the newest match is returned
+def LoadResult(store,module,chip,method,run=None,params=None,mmap=True):
+    if run is not None and params is not None:
+        base = _EntryBase(store,module,chip,method,run,params)
+        if not os.path.exists(base+'.json'): raise KeyError('No result '+base)
+        with open(base+'.json') as file: meta = json.load(file)
+        meta['path'] = base+'.npy'
+    else:
+        matches = FindResults(store,module,chip,method,run)
+        if not matches: raise KeyError('No result for module '+str(module)+' chip '+str(chip)+' method '+method+('' if run is None else ' run '+str(run)))
+        meta = matches[0]
+    return np.load(meta['path'], mmap_mode='r' if mmap else None), meta
+
+# Boolean map of the missing bumps of a status map (optionally counting the low occupancy ones too)
+def MissingMask(status,include_low_occ=False):
+    if include_low_occ: return (status == 1) | (status == -1)
+    return status == 1
+
+# Optional writer: exports a stored result as a TH2F in a root file (the only function of this module needing ROOT)
+def ExportToROOT(meta,file_path,hist_name=None,missing_only=True):
+    from rootextract import WriteTH2s
+    status = np.load(meta['path'])
+    values = MissingMask(status, include_low_occ=True)*status if missing_only else status
+    name = hist_name or meta['method']+'_'+meta['run']+'_chip'+str(meta['chip'])
+    WriteTH2s(file_path,{name: (values, meta['method']+' '+meta['run']+' chip '+str(meta['chip']))})
+
+def main():
+    store = sys.argv[1] if len(sys.argv) > 1 else STORE_DIR
+    for meta in FindResults(store):
+        counts = ', '.join(key+'='+str(value) for key,value in meta['counts'].items())
+        print(meta['module']+'\tchip '+str(meta['chip'])+'\t'+meta['method']+'\t'+meta['run']+'\t'+json.dumps(meta['params'], sort_keys=True)+'\t'+counts)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+##############################################################################
+# Shared TH2 -> numpy extraction layer for the Ph2_ACF root files
+# Usage: from rootextract import ExtractChipMaps, TH2ToNumpy, NumpyToTH2
+# Every script (xray.py, frbias.py, histcomparison.py) reads its maps through
+# these functions instead of looping over GetBinContent/SetBinContent.
+# ROOT is imported the first time a root file is read or written: maps found in the map cache
+# and scripts only asking for --help never load it.
+# Backend (PIXELMAP_BACKEND or SetBackend): 'root' (PyROOT), 'uproot' (uprootextract.py, no ROOT needed)
+# or 'auto' (default: PyROOT if installed, uproot otherwise). Both return identical arrays.
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+##############################################################################
+import os
+import importlib.util
+import numpy as np
+from mapcache import CachedItems
+from instrument import Stage
+
+BACKENDS = ('auto', 'root', 'uproot')
+
+# Reader/writer used for the root files in this process (resolved at every call, so it can be changed at runtime)
+def Backend():
+    backend = os.environ.get('PIXELMAP_BACKEND', 'auto') or 'auto'
+    if backend not in BACKENDS: raise ValueError("Unknown PIXELMAP_BACKEND "+backend+", choose from "+", ".join(BACKENDS))
+    if backend == 'auto': backend = 'root' if importlib.util.find_spec('ROOT') is not None else 'uproot'
+    return backend
+
+# Selects the backend (also inherited by the worker processes started afterwards)
+def SetBackend(backend):
+    if backend not in BACKENDS: raise ValueError("Unknown backend "+backend+", choose from "+", ".join(BACKENDS))
+    os.environ['PIXELMAP_BACKEND'] = backend
+
+_ROOT = None
+# Imports ROOT (batch mode, warnings only) the first time it is needed in this process
+def Root():
+    global _ROOT
+    if _ROOT is None:
+        import ROOT; ROOT.gErrorIgnoreLevel = ROOT.kWarning; ROOT.gROOT.SetBatch(True)
+        _ROOT = ROOT
+    return _ROOT
+
+# Layout of the histograms written by Ph2_ACF (one TCanvas per scan per chip)
+BOARD_ID='0'; OPTICAL_ID='0'; H_ID='0'
+
+# argparse type of the trigger counts of the Ph2_ACF xml (-ntrg): an integer, also written as 1e7
+def TriggerCount(value):
+    count = float(value)
+    if count != int(count) or count < 0: raise ValueError("Not a # of triggers: "+str(value))
+    return int(count)
+
+# numpy dtype of the internal TArray of each ROOT histogram class
+_DTYPES = {'TH2F': np.float32, 'TH2D': np.float64, 'TH2I': np.int32, 'TH2S': np.int16, 'TH2C': np.int8,
+           'TH1F': np.float32, 'TH1D': np.float64, 'TH1I': np.int32, 'TH1S': np.int16, 'TH1C': np.int8}
+
+# Builds the directory of a chip and the name of a scan inside a Ph2_ACF root file
+def Ph2_ACFHistName(Scan_n,chipID,H_ID=H_ID):
+    return "D_B("+BOARD_ID+")_O("+OPTICAL_ID+")_H("+H_ID+")_"+Scan_n+"_Chip("+str(int(chipID))+")"
+def Ph2_ACFHistPath(Scan_n,chipID,H_ID=H_ID):
+    return "Detector/Board_"+BOARD_ID+"/OpticalGroup_"+OPTICAL_ID+"/Hybrid_"+H_ID+"/Chip_"+str(int(chipID))+"/"+Ph2_ACFHistName(Scan_n,chipID,H_ID)
+
+# Resolves a run number (or a path) into the root file of a scan
+def RunFile(run,scan,input_dir):
+    if run.endswith('.root'): return run
+    return os.path.join(input_dir,run+'_'+scan+'.root')
+
+# Resolves the chip configuration txt file (absolute, relative to cwd or to <input_dir>/txt)
+def TxtFile(txt,input_dir):
+    if os.path.exists(txt): return txt
+    return os.path.join(input_dir,'txt',txt)
+
+# Lists the chip IDs stored in a Ph2_ACF root file
+def ListChips(infile,H_ID=H_ID):
+    hybrid = infile.Get("Detector/Board_"+BOARD_ID+"/OpticalGroup_"+OPTICAL_ID+"/Hybrid_"+H_ID)
+    if not hybrid: return []
+    chips = [key.GetName() for key in hybrid.GetListOfKeys() if key.GetName().startswith("Chip_")]
+    return sorted(int(name.replace("Chip_","")) for name in chips)
+
+# Returns the histogram drawn in the canvas of a scan (canvas -> primitive lookup)
+def GetChipHist(infile,Scan_n,chipID,H_ID=H_ID):
+    path = Ph2_ACFHistPath(Scan_n,chipID,H_ID)
+    canvas = infile.Get(path)
+    if not canvas: raise KeyError("No object "+path+" in "+infile.GetName())
+    if not canvas.InheritsFrom("TCanvas"): return canvas
+    hist = canvas.GetPrimitive(Ph2_ACFHistName(Scan_n,chipID,H_ID))
+    if hist: return hist
+    # Fall back on the first histogram of the canvas if the primitive has a different name
+    for primitive in canvas.GetListOfPrimitives():
+        if primitive.InheritsFrom("TH1"): return primitive
+    raise KeyError("No histogram in canvas "+path)
+
+# Converts a TH2 into a (nbinsY, nbinsX) = (rows, cols) numpy array with one buffer copy.
+# ROOT stores the bins as x + (nx+2)*y including under/overflow, which are stripped here.
+# With copy=False the returned array is a view on the histogram memory (valid while the histogram lives).
+def TH2ToNumpy(hist,copy=True):
+    nx = hist.GetNbinsX(); ny = hist.GetNbinsY(); ncells = (nx+2)*(ny+2)
+    buf = hist.GetArray()
+    buf.reshape((ncells,))
+    arr = np.frombuffer(buf, dtype=_DTYPES[hist.ClassName()], count=ncells).reshape(ny+2,nx+2)[1:-1,1:-1]
+    return arr.copy() if copy else arr
+
+# Creates a TH2F from a (rows, cols) numpy array, filling the bins with one buffer copy
+def NumpyToTH2(array,name,title=None):
+    num_rows, num_cols = array.shape
+    hist = Root().TH2F(name, title if title is not None else name, num_cols, 0, num_cols, num_rows, 0, num_rows)
+    hist.SetDirectory(0) # owned by python, written explicitly to the output file
+    SetTH2Content(hist,array)
+    return hist
+
+# Overwrites the in-range bins of an existing TH2 with a (rows, cols) numpy array
+def SetTH2Content(hist,array):
+    TH2ToNumpy(hist,copy=False)[...] = array
+    hist.SetEntries(array.size)
+    return hist
+
+# Extracts a 2D histogram as a numpy array or the number of entries of a 1D histogram
+def Ph2_ACFRootExtractor(infile,Scan_n,type,chipID,H_ID=H_ID):
+    hist = GetChipHist(infile,Scan_n,chipID,H_ID)
+    if "2D" in type: return TH2ToNumpy(hist)
+    return hist.GetEntries()
+
+# Name of an extracted item in the map cache (see mapcache.py)
+def _ItemName(Scan_n,type,chipID,H_ID):
+    return "Hybrid_"+H_ID+"/Chip_"+str(int(chipID))+"/"+Scan_n+"/"+("2D" if "2D" in type else "Entries")
+
+# Opens the root file once and extracts the requested items ({item name: (Scan_n, type, chipID)} or {item name: 'chips'})
+def _ExtractItems(file_path,requests,H_ID):
+    with Stage('root_read'): return _ReadItems(file_path,requests,H_ID)
+
+def _ReadItems(file_path,requests,H_ID):
+    if Backend() == 'uproot':
+        from uprootextract import ExtractItems
+        return ExtractItems(file_path,requests,H_ID)
+    inFile = Root().TFile.Open(file_path,"READ")
+    if not inFile or inFile.IsZombie(): raise OSError("Cannot open "+file_path)
+    try:
+        return {name: np.array(ListChips(inFile,H_ID)) if request == 'chips' else Ph2_ACFRootExtractor(inFile,*request,H_ID=H_ID)
+                for name,request in requests.items()}
+    finally:
+        inFile.Close()
+
+# Extracts the requested items through the map cache: the root file is opened only if some item is not cached
+def _CachedExtract(file_path,requests,H_ID,cache):
+    loader = lambda names: _ExtractItems(file_path,{name: requests[name] for name in names},H_ID)
+    if not cache: return loader(list(requests))
+    return CachedItems(file_path,list(requests),loader)
+
+# Opens a Ph2_ACF root file once and extracts several scans of one chip.
+# scans is a dict {Scan_n: type} with type '2D' (numpy map) or 'Entries' (number of entries)
+# With cache=True (default) maps already extracted from a file with the same content are read from the map cache.
+def ExtractChipMaps(file_path,scans,chipID,H_ID=H_ID,cache=True):
+    requests = {_ItemName(Scan_n,type,chipID,H_ID): (Scan_n,type,chipID) for Scan_n,type in scans.items()}
+    values = _CachedExtract(file_path,requests,H_ID,cache)
+    return {Scan_n: values[_ItemName(Scan_n,type,chipID,H_ID)] for Scan_n,type in scans.items()}
+
+# Opens a Ph2_ACF root file once and extracts the same scans for several chips ({chipID: {Scan_n: value}}).
+# chips=None extracts every chip stored in the file
+def ExtractModuleMaps(file_path,scans,chips=None,H_ID=H_ID,cache=True):
+    if chips is None:
+        chips = _CachedExtract(file_path,{"Hybrid_"+H_ID+"/chips": 'chips'},H_ID,cache)["Hybrid_"+H_ID+"/chips"]
+    requests = {_ItemName(Scan_n,type,chipID,H_ID): (Scan_n,type,chipID) for chipID in chips for Scan_n,type in scans.items()}
+    values = _CachedExtract(file_path,requests,H_ID,cache)
+    return {int(chipID): {Scan_n: values[_ItemName(Scan_n,type,chipID,H_ID)] for Scan_n,type in scans.items()} for chipID in chips}
+
+# Reads a plain TH2 (not inside a canvas) from a root file as a numpy array
+def ExtractTH2(file_path,hist_name):
+    if Backend() == 'uproot':
+        from uprootextract import ExtractTH2 as UprootExtractTH2
+        return UprootExtractTH2(file_path,hist_name)
+    inFile = Root().TFile.Open(file_path,"READ")
+    if not inFile or inFile.IsZombie(): raise OSError("Cannot open "+file_path)
+    try:
+        hist = inFile.Get(hist_name)
+        if not hist: raise KeyError("No histogram "+hist_name+" in "+file_path)
+        return TH2ToNumpy(hist)
+    finally:
+        inFile.Close()
+
+# Writes numpy maps to a root file as TH2F histograms ({name: array} or {name: (array, title)})
+def WriteTH2s(file_path,maps):
+    if Backend() == 'uproot':
+        from uprootextract import WriteTH2s as UprootWriteTH2s
+        return UprootWriteTH2s(file_path,maps)
+    output_file = Root().TFile(file_path,"RECREATE")
+    hists = []
+    for name,value in maps.items():
+        array,title = value if isinstance(value,tuple) else (value,name)
+        hist = NumpyToTH2(array,name,title)
+        hist.Write(); hists.append(hist)
+    output_file.Close()
@@ -0,0 +1,49 @@
+# ClassifyMissing/SummarizeStatus against the loop-free but unvectorized logic of the original xray.py
+import numpy as np
+import pytest
+from classify import ClassifyMissing, SummarizeStatus, CountStatus
+
+num_rows = 336; num_cols = 432
+
+# Classification of the original XRayAnalysis: masks in (cols, rows), Data in (rows, cols), Missing_mat returned transposed
+def BaselineXRay(Data,Enable,Thr,Thr_strange):
+    Mask_before = Enable.T.astype(np.float64)
+    Disabled = np.where(Mask_before == 0)
+    Mask_XRay = np.ones((num_cols,num_rows))+1
+    Cut = np.where(Data < Thr)
+    Mask_XRay[Cut[1],Cut[0]] = 0
+    Mask_strange = np.ones((num_cols,num_rows))+1
+    Cut_strange = np.where((Data < Thr_strange) & (Data >= Thr))
+    Mask_strange[Cut_strange[1],Cut_strange[0]] = 0
+    Missing_mat = Mask_before+Mask_XRay
+    Missing = np.where(Missing_mat == 1)
+    Perc_missing = float("{:.4f}".format((Missing[0].size/((num_rows*num_cols)-Disabled[0].size))*100))
+    Missing_mat_strange = Mask_strange+Mask_before
+    Missing_strange = np.where(Missing_mat_strange == 1)
+    Perc_missing_strange = float("{:.4f}".format((Missing_strange[0].size/((num_rows*num_cols)-Disabled[0].size))*100))
+    Missing_mat[Missing_strange[0],Missing_strange[1]] = -1
+    return Missing_mat.T, Disabled[0].size, Missing[0].size, Missing_strange[0].size, Perc_missing, Perc_missing_strange
+
+@pytest.mark.parametrize('seed,Thr,Thr_strange', [(0, 1, 1000), (1, 50, 2000), (2, 1, 1)])
+def test_classify_matches_baseline(seed,Thr,Thr_strange):
+    rng = np.random.default_rng(seed)
+    Data = rng.poisson(3000, (num_rows,num_cols)).astype(np.float64)
+    Data[rng.random(Data.shape) < 0.01] = 0
+    Data[rng.random(Data.shape) < 0.01] = 500
+    Enable = (rng.random(Data.shape) > 0.01).astype(np.uint8)
+    expected, disabled, missing, low_occ, perc_missing, perc_low_occ = BaselineXRay(Data,Enable,Thr,Thr_strange)
+    status = ClassifyMissing(Data,Enable,Thr,Thr_strange)
+    assert status.shape == (num_rows,num_cols)
+    np.testing.assert_array_equal(status, expected)
+    summary = SummarizeStatus(status)
+    assert (summary['disabled'], summary['missing'], summary['low_occ']) == (disabled, missing, low_occ)
+    assert summary['perc_missing'] == perc_missing and summary['perc_low_occ'] == perc_low_occ
+
+def test_count_status_of_a_stack():
+    rng = np.random.default_rng(3)
+    status = rng.integers(-1, 4, (3,num_rows,num_cols)).astype(np.int8)
+    counts = CountStatus(status)
+    for chip in range(3):
+        assert counts['missing'][chip] == np.count_nonzero(status[chip] == 1)
+        assert counts['low_occ'][chip] == np.count_nonzero(status[chip] == -1)
+    assert sum(int(counts[name].sum()) for name in counts) == status.size
@@ -0,0 +1,42 @@
+# Bitmask overlap engine against the bin by bin comparison of the original histcomparison.py
+import numpy as np
+from histcomparison import overlap_codes, code_counts, overlap_regions, region_table, region_counts, compare_methods
+
+def Maps(seed=0,shape=(336,432)):
+    rng = np.random.default_rng(seed)
+    return {'xray': rng.random(shape) < 0.1, 'xtalk': rng.random(shape) < 0.2, 'frbias': (rng.random(shape) < 0.3).astype(np.float32)}
+
+# The 7 region histograms of the original script
+def BaselineRegions(maps):
+    xray, xtalk, frbias = (np.asarray(maps[name]) != 0 for name in ('xray','xtalk','frbias'))
+    return {'h_xray_exclusive': xray & ~xtalk & ~frbias, 'h_xtalk_exclusive': ~xray & xtalk & ~frbias, 'h_frbias_exclusive': ~xray & ~xtalk & frbias,
+            'h_xray_xtalk': xray & xtalk, 'h_xray_frbias': xray & frbias, 'h_xtalk_frbias': xtalk & frbias, 'h_xray_xtalk_frbias': xray & xtalk & frbias}
+
+def test_overlap_codes():
+    maps = Maps()
+    names, codes = overlap_codes(maps)
+    assert names == ['xray', 'xtalk', 'frbias'] and codes.dtype == np.uint8
+    for bit,name in enumerate(names): np.testing.assert_array_equal((codes >> bit) & 1, np.asarray(maps[name]) != 0)
+    assert code_counts(codes,3).sum() == codes.size
+    assert overlap_codes({str(i): np.zeros((2,2)) for i in range(9)})[1].dtype == np.uint16
+
+def test_regions_match_baseline():
+    maps = Maps(1)
+    regions, counts = compare_methods(maps)
+    expected = BaselineRegions(maps)
+    assert list(regions) == list(expected)
+    for name,region in expected.items():
+        np.testing.assert_array_equal(regions[name], region)
+        assert counts[name] == np.count_nonzero(region)
+
+def test_region_table():
+    names = ['xray', 'xtalk', 'frbias']
+    assert [(name, mask, exclusive) for name,mask,exclusive in overlap_regions(names)][:3] == \
+           [('h_xray_exclusive', 1, True), ('h_xtalk_exclusive', 2, True), ('h_frbias_exclusive', 4, True)]
+    table = dict(region_table(names))
+    assert list(np.flatnonzero(table['h_xray_exclusive'])) == [1]
+    assert list(np.flatnonzero(table['h_xray_frbias'])) == [5, 7]
+    assert list(np.flatnonzero(table['h_xray_xtalk_frbias'])) == [7]
+    counts = np.arange(8)
+    assert region_counts(names,counts)['h_xtalk_frbias'] == 6+7
+    assert len(region_table(['a', 'b', 'c', 'd'])) == 4+11 # exclusive regions + every intersection of 2 or more methods
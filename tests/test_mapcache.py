@@ -0,0 +1,62 @@
+# Map cache: hits keyed by the file content, least recently used entries evicted first
+import os
+import numpy as np
+import pytest
+from mapcache import CachedItems, Evict, FileHash
+
+@pytest.fixture(autouse=True)
+def cache_enabled(monkeypatch):
+    monkeypatch.delenv('PIXELMAP_NO_CACHE', raising=False)
+
+# Loader counting its calls and the items it was asked for
+class Loader:
+    def __init__(self):
+        self.calls = []
+    def __call__(self,items):
+        self.calls.append(sorted(items))
+        return {item: (np.full((4,5), len(item), dtype=np.float32) if item.endswith('2D') else 1000.0+len(item)) for item in items}
+
+def Entries(cache_dir):
+    return sorted(os.path.join(root,name) for root,_,files in os.walk(cache_dir) for name in files)
+
+def test_hit_and_miss(tmp_path):
+    data = tmp_path/'Run000001_PixelAlive.root'; data.write_bytes(b'first content')
+    cache_dir = str(tmp_path/'cache'); loader = Loader()
+    first = CachedItems(str(data),['Chip_12/PixelAlive/2D', 'Chip_12/PixelAlive/Entries'],loader,cache_dir)
+    second = CachedItems(str(data),['Chip_12/PixelAlive/2D', 'Chip_12/PixelAlive/Entries', 'Chip_13/PixelAlive/2D'],loader,cache_dir)
+    assert loader.calls == [['Chip_12/PixelAlive/2D', 'Chip_12/PixelAlive/Entries'], ['Chip_13/PixelAlive/2D']] # only the new item is loaded
+    np.testing.assert_array_equal(second['Chip_12/PixelAlive/2D'], first['Chip_12/PixelAlive/2D'])
+    assert second['Chip_12/PixelAlive/Entries'] == first['Chip_12/PixelAlive/Entries'] and isinstance(second['Chip_12/PixelAlive/Entries'], float)
+    # Same path, new content: new hash, everything is loaded again
+    data.write_bytes(b'second content, longer')
+    CachedItems(str(data),['Chip_12/PixelAlive/2D'],loader,cache_dir)
+    assert loader.calls[-1] == ['Chip_12/PixelAlive/2D']
+    # Same content at another path: cache hit
+    copy = tmp_path/'copy.root'; copy.write_bytes(b'first content')
+    CachedItems(str(copy),['Chip_12/PixelAlive/2D'],loader,cache_dir)
+    assert len(loader.calls) == 3
+
+def test_disabled(tmp_path,monkeypatch):
+    monkeypatch.setenv('PIXELMAP_NO_CACHE', '1')
+    data = tmp_path/'run.root'; data.write_bytes(b'content')
+    loader = Loader()
+    for _ in range(2): CachedItems(str(data),['a/2D'],loader,str(tmp_path/'cache'))
+    assert len(loader.calls) == 2 and not os.path.exists(str(tmp_path/'cache'))
+
+def test_evict_least_recently_used(tmp_path):
+    cache_dir = str(tmp_path/'cache'); loader = Loader()
+    files = []
+    for i in range(3):
+        data = tmp_path/('run'+str(i)+'.root'); data.write_bytes(b'content '+str(i).encode()); files.append(str(data))
+        CachedItems(str(data),['x/2D'],loader,cache_dir)
+    paths = Entries(cache_dir); size = os.path.getsize(paths[0])
+    assert len(paths) == 3
+    by_file = {}
+    for i,file_path in enumerate(files):
+        by_file[i] = next(path for path in paths if os.path.basename(path).startswith(FileHash(file_path)))
+        os.utime(by_file[i], (1000+i, 1000+i)) # run0 oldest, run2 newest
+    CachedItems(files[0],['x/2D'],loader,cache_dir) # a hit marks run0 as recently used
+    assert len(loader.calls) == 3
+    assert Evict(cache_dir,2*size) == 2*size
+    assert Entries(cache_dir) == sorted([by_file[0], by_file[2]])
+    assert Evict(cache_dir,0) == 0 and Entries(cache_dir) == []
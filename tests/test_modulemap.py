@@ -0,0 +1,38 @@
+# Module mosaics: assembling the chip maps and splitting them back gives the chip maps unchanged
+import numpy as np
+import pytest
+from modulemap import LAYOUTS, ModuleShape, AssembleModule, SplitModule
+
+num_rows = 336; num_cols = 432
+
+def ChipMaps(layout):
+    rng = np.random.default_rng(0)
+    return {chip: rng.integers(-1, 4, (num_rows,num_cols)).astype(np.int8) for chip in layout}
+
+@pytest.mark.parametrize('name,shape', [('single', (num_rows,num_cols)), ('dual', (num_rows,2*num_cols)), ('quad', (2*num_rows,2*num_cols))])
+def test_round_trip(name,shape):
+    layout = LAYOUTS[name]
+    chip_maps = ChipMaps(layout)
+    module = AssembleModule(chip_maps,layout)
+    assert module.shape == ModuleShape(layout) == shape and module.dtype == np.int8
+    split = SplitModule(module,layout)
+    assert sorted(split) == sorted(chip_maps)
+    for chip,chip_map in chip_maps.items(): np.testing.assert_array_equal(split[chip], chip_map)
+
+def test_quad_orientation():
+    layout = LAYOUTS['quad']
+    chip_maps = ChipMaps(layout)
+    module = AssembleModule(chip_maps,layout)
+    np.testing.assert_array_equal(module[:num_rows,:num_cols], chip_maps[12])
+    np.testing.assert_array_equal(module[:num_rows,num_cols:], chip_maps[13])
+    np.testing.assert_array_equal(module[num_rows:,:num_cols], chip_maps[15][::-1,::-1]) # rotated by 180 degrees
+    np.testing.assert_array_equal(module[num_rows:,num_cols:], chip_maps[14][::-1,::-1])
+
+def test_missing_chip_is_filled():
+    layout = LAYOUTS['quad']
+    chip_maps = ChipMaps(layout); del chip_maps[14]
+    module = AssembleModule(chip_maps,layout,fill=-2)
+    assert (SplitModule(module,layout)[14] == -2).all()
+
+def test_empty_input():
+    with pytest.raises(ValueError): AssembleModule({},LAYOUTS['dual'])
@@ -0,0 +1,40 @@
+# Occupancy accumulation: a run is added once per chip, the totals grow with every new run
+import os
+import shutil
+import numpy as np
+import pytest
+from occupancy import AddRun, LoadAccumulated, AccumulatorPath, ClassifyAccumulated
+
+INPUT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'input', 'Run000046_PixelAlive.root')
+
+@pytest.mark.skipif(not os.path.exists(INPUT), reason='no input root file')
+def test_add_run_once(tmp_path,monkeypatch):
+    pytest.importorskip('uproot')
+    monkeypatch.setenv('PIXELMAP_BACKEND', 'uproot'); monkeypatch.setenv('PIXELMAP_NO_CACHE', '1')
+    from rootextract import ExtractChipMaps
+    store = str(tmp_path/'store')
+    pixel_alive = ExtractChipMaps(INPUT,{'PixelAlive':'2D'},12,cache=False)['PixelAlive']
+    assert AddRun(store,'RH0026',INPUT,[12],nTrg=100,nBX=10) == {12: True}
+    assert AddRun(store,'RH0026',INPUT,[12],nTrg=100,nBX=10) == {12: False} # same file again: skipped
+    copy = str(tmp_path/'Run000146_PixelAlive.root'); shutil.copy(INPUT, copy)
+    assert AddRun(store,'RH0026',copy,[12],nTrg=100,nBX=10) == {12: False}  # same content under another name: skipped
+    acc = LoadAccumulated(store,'RH0026',12)
+    assert acc['runs'] == ['Run000046'] and acc['triggers'] == 1000.0
+    np.testing.assert_allclose(acc['hits'], pixel_alive*1000.0)
+    assert os.path.exists(AccumulatorPath(store,'RH0026',12)) and LoadAccumulated(store,'RH0026',13) is None
+    other = INPUT.replace('Run000046','Run000047')
+    if os.path.exists(other):
+        assert AddRun(store,'RH0026',other,[12],nTrg=100,nBX=10) == {12: True}
+        acc = LoadAccumulated(store,'RH0026',12)
+        assert acc['runs'] == ['Run000046', 'Run000047'] and acc['triggers'] == 2000.0
+        np.testing.assert_allclose(acc['hits'], (pixel_alive+ExtractChipMaps(other,{'PixelAlive':'2D'},12,cache=False)['PixelAlive'])*1000.0)
+
+def test_low_occ_cut_follows_the_triggers():
+    hits = np.array([[0., 500., 1500., 2500.]])
+    enable = np.ones(hits.shape, dtype=np.uint8)
+    # two runs of 1e8 triggers: cut 2 x 1000
+    status, summary = ClassifyAccumulated({'hits': hits, 'triggers': 2e8, 'runs': ['Run1', 'Run2']},enable,1,1000,1e8)
+    assert list(status[0]) == [1, -1, -1, 3] and summary['thr_low_occ'] == 2000
+    # one run of 1e8 and one of 0.5e8 triggers: cut 1.5 x 1000, not 2 x 1000
+    status, summary = ClassifyAccumulated({'hits': hits, 'triggers': 1.5e8, 'runs': ['Run1', 'Run2']},enable,1,1000,1e8)
+    assert list(status[0]) == [1, -1, 3, 3] and summary['thr_low_occ'] == 1500 and summary['runs'] == 2
@@ -0,0 +1,53 @@
+# Packed bitmaps of the pixel database and the queries over several runs
+import numpy as np
+import pytest
+from pixeldb import Connect, PackMask, UnpackMask, CountBits, BitmapPixels, AddResult, NewlyFailing, Stability
+
+num_rows = 336; num_cols = 432
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = Connect(str(tmp_path/'pixel_history.sqlite'))
+    yield conn
+    conn.close()
+
+# Random status maps (classify.py codes) of the same chip at several bias voltages
+def StatusMaps(seed,biases):
+    rng = np.random.default_rng(seed)
+    return {bias: rng.choice([-1, 0, 1, 3], size=(num_rows,num_cols), p=[0.02, 0.01, 0.03, 0.94]).astype(np.int8) for bias in biases}
+
+@pytest.mark.parametrize('shape', [(num_rows,num_cols), (3,5), (1,7)])
+def test_pack_unpack_round_trip(shape):
+    mask = np.random.default_rng(0).random(shape) < 0.3
+    blob = PackMask(mask)
+    assert len(blob) == -(-mask.size//8)
+    np.testing.assert_array_equal(UnpackMask(blob,shape), mask)
+    assert CountBits(np.frombuffer(blob, dtype=np.uint8)) == np.count_nonzero(mask)
+
+def test_bitmap_pixels():
+    mask = np.zeros((num_rows,num_cols), dtype=bool)
+    pixels = [(0, 0), (0, num_cols-1), (17, 200), (num_rows-1, num_cols-1)]
+    for row,col in pixels: mask[row,col] = True
+    assert BitmapPixels(np.frombuffer(PackMask(mask), dtype=np.uint8),num_cols) == pixels
+
+def test_newly_failing(conn):
+    maps = StatusMaps(1,[50, 100, 150, 200])
+    for bias,status in maps.items(): AddResult(conn,'RH0026',12,'xray','Run'+str(bias),status,bias=bias)
+    pixels, rows_before, rows_after = NewlyFailing(conn,'RH0026',12,'xray',['50','Run100'],['150V','200'])
+    assert [row['run'] for row in rows_before] == ['Run50', 'Run100']
+    assert [row['run'] for row in rows_after] == ['Run150', 'Run200']
+    expected = ((maps[150] == 1) | (maps[200] == 1)) & ~((maps[50] == 1) | (maps[100] == 1))
+    assert pixels == [tuple(int(i) for i in pixel) for pixel in np.argwhere(expected)]
+    with pytest.raises(KeyError): NewlyFailing(conn,'RH0026',12,'xray',['Run1'],['Run200'])
+
+def test_stability(conn):
+    maps = StatusMaps(2,[50, 100, 150])
+    for bias,status in maps.items(): AddResult(conn,'RH0026',13,'xray','Run'+str(bias),status,bias=bias)
+    AddResult(conn,'RH0026',13,'xtalk','Run50',np.ones((num_rows,num_cols), dtype=np.int8),bias=50) # other method, ignored
+    stable = Stability(conn,'RH0026',13,'xray')
+    missing = np.stack([maps[bias] == 1 for bias in (50, 100, 150)])
+    assert stable['runs'] == 3 and stable['num_cols'] == num_cols
+    for key,expected in (('always', missing.all(axis=0)), ('ever', missing.any(axis=0)), ('unstable', missing.any(axis=0) & ~missing.all(axis=0))):
+        np.testing.assert_array_equal(UnpackMask(stable[key].tobytes(),(num_rows,num_cols)), expected)
+    assert Stability(conn,'RH0026',13,'xray',['Run50'])['runs'] == 1
+    with pytest.raises(KeyError): Stability(conn,'RH0026',14,'xray')
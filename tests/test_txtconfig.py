@@ -0,0 +1,51 @@
+# Parser of the chip txt files against the line by line reading of the original xray.py, on the files in input/txt
+import os
+import glob
+import numpy as np
+import pytest
+from txtconfig import ParseChipConfig, num_rows, num_cols
+
+TXT_FILES = sorted(glob.glob(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'input', 'txt', '*.txt')))
+
+# GetMaskFromTxt of the original xray.py, transposed back to (rows, cols)
+def BaselineBlock(file_path,block='ENABLE'):
+    array_2d = np.zeros((num_rows,num_cols))
+    col=-1
+    with open(file_path, 'r') as file:
+        for line in file:
+            if line.startswith("COL "): col+=1
+            if line.startswith(block+" "):
+                values = line.replace(block, "", 1).strip().split(',')
+                for row,value in enumerate(values): array_2d[row,col]=int(value)
+    return array_2d
+
+@pytest.mark.skipif(not TXT_FILES, reason='no txt file in input/txt')
+@pytest.mark.parametrize('file_path', TXT_FILES)
+def test_blocks_match_baseline(file_path,tmp_path):
+    config = ParseChipConfig(file_path,cache_dir=str(tmp_path))
+    assert sorted(config) == ['ENABLE', 'HITBUS', 'INJEN', 'TDAC']
+    for block,values in config.items():
+        assert values.shape == (num_rows,num_cols)
+        np.testing.assert_array_equal(values, BaselineBlock(file_path,block))
+    assert np.count_nonzero(config['ENABLE'] == 0) > 0
+
+@pytest.mark.skipif(not TXT_FILES, reason='no txt file in input/txt')
+def test_cache_follows_the_file(tmp_path):
+    txt = tmp_path/'chip.txt'
+    txt.write_text(open(TXT_FILES[0]).read())
+    cache_dir = str(tmp_path/'cache')
+    first = ParseChipConfig(str(txt),cache_dir=cache_dir)
+    assert len(os.listdir(cache_dir)) == 1
+    np.testing.assert_array_equal(ParseChipConfig(str(txt),cache_dir=cache_dir)['ENABLE'], first['ENABLE'])
+    # Mask one more pixel (first ENABLE line = column 0): the modified file is parsed again
+    lines = txt.read_text().split('\n')
+    index = next(i for i,line in enumerate(lines) if line.startswith('ENABLE '))
+    lines[index] = 'ENABLE 0'+lines[index][len('ENABLE 1'):]
+    txt.write_text('\n'.join(lines))
+    os.utime(str(txt), ns=(os.stat(str(txt)).st_atime_ns, os.stat(str(txt)).st_mtime_ns+10**9))
+    assert ParseChipConfig(str(txt),cache_dir=cache_dir)['ENABLE'][0,0] == 0
+
+def test_wrong_number_of_columns(tmp_path):
+    txt = tmp_path/'short.txt'
+    txt.write_text('COL 0\nENABLE '+','.join(['1']*num_rows)+'\n')
+    with pytest.raises(ValueError): ParseChipConfig(str(txt),use_cache=False)
@@ -0,0 +1,50 @@
+# Orientation of the maps read by the two backends: both return (rows, cols) = (nbinsY, nbinsX) arrays
+import os
+import numpy as np
+import pytest
+
+uproot = pytest.importorskip('uproot')
+import rootextract
+import uprootextract
+
+INPUT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'input', 'Run000046_PixelAlive.root')
+
+# Stand-in for a ROOT TH2F: GetArray() holds the bins as x + (nx+2)*y with under/overflow, like ROOT
+class FakeTH2F:
+    def __init__(self,cells,nx,ny):
+        self.cells = cells; self.nx = nx; self.ny = ny
+    def GetNbinsX(self): return self.nx
+    def GetNbinsY(self): return self.ny
+    def GetArray(self): return self.cells
+    def ClassName(self): return 'TH2F'
+
+# Asymmetric (rows, cols) map: every pixel different, rows != cols
+def TestMap(num_rows=7,num_cols=11):
+    return (np.arange(num_rows)[:,None]*100+np.arange(num_cols)[None,:]).astype(np.float32)
+
+def test_root_layout():
+    array = TestMap()
+    num_rows, num_cols = array.shape
+    cells = np.full(((num_rows+2)*(num_cols+2),), -1, dtype=np.float32) # under/overflow
+    for row in range(num_rows):
+        for col in range(num_cols): cells[(col+1)+(num_cols+2)*(row+1)] = array[row,col] # bin (x=col+1, y=row+1)
+    np.testing.assert_array_equal(rootextract.TH2ToNumpy(FakeTH2F(cells,num_cols,num_rows)), array)
+
+def test_uproot_matches_root_layout(tmp_path):
+    array = TestMap()
+    num_rows, num_cols = array.shape
+    file_path = str(tmp_path/'maps.root')
+    uprootextract.WriteTH2s(file_path,{'test': (array,'test map')})
+    np.testing.assert_array_equal(uprootextract.ExtractTH2(file_path,'test'), array)
+    with uproot.open(file_path) as infile:
+        hist = infile['test']
+        assert hist.member('fXaxis').member('fNbins') == num_cols and hist.member('fYaxis').member('fNbins') == num_rows
+        cells = np.asarray(hist.values(flow=True), dtype=np.float32).T.ravel() # the TArray of the file, as ROOT holds it
+        np.testing.assert_array_equal(uprootextract.TH2ToNumpy(hist), rootextract.TH2ToNumpy(FakeTH2F(cells,num_cols,num_rows)))
+
+@pytest.mark.skipif(not os.path.exists(INPUT), reason='no input root file')
+def test_ph2_acf_map_shape(monkeypatch):
+    monkeypatch.setenv('PIXELMAP_BACKEND', 'uproot')
+    maps = rootextract.ExtractModuleMaps(INPUT,{'PixelAlive':'2D'},cache=False)
+    assert maps
+    for scans in maps.values(): assert scans['PixelAlive'].shape == (336, 432)
@@ -0,0 +1,34 @@
+# Python xtalk analysis: detection rules, and the confirmed map of chip 12 against the one written by xtalk.cpp (output/)
+import os
+import numpy as np
+import pytest
+from xtalk import XTalkAnalysis, XTalkCounts, NOT_DETECTABLE, CONFIRMED, DEAD, GOOD
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RUNS = [os.path.join(ROOT_DIR, 'input', 'Run0000'+run+'_PixelAlive.root') for run in ('59', '60', '61')]
+REFERENCE = os.path.join(ROOT_DIR, 'output', 'xtalk_m-RH00026_c-12.root')
+
+def test_detection_rules():
+    pa1 = np.ones((4,6)); pa5 = np.ones((4,6)); pa6 = np.ones((4,6))
+    pa1[1,1] = 0.5                           # dead
+    pa5[2,2] = 0.1; pa6[2,2] = 0.1           # confirmed
+    pa5[2,3] = 0.1; pa6[2,3] = 0.4           # coupled neighbour but uncoupled efficiency above the cut
+    pa5[0,0] = 0.1; pa6[0,0] = 0.1           # first row, even column: no coupled neighbour
+    pa5[3,1] = 0.1; pa6[3,1] = 0.1           # last row, odd column: no coupled neighbour
+    status = XTalkAnalysis(pa1,pa5,pa6)
+    assert status.dtype == np.int8
+    assert status[1,1] == DEAD and status[2,2] == CONFIRMED and status[2,3] == GOOD
+    assert (status[0,0::2] == NOT_DETECTABLE).all() and (status[3,1::2] == NOT_DETECTABLE).all()
+    assert status[0,1] == GOOD and status[3,0] == GOOD
+    assert XTalkCounts(status) == {'dead': 1, 'suspicious': 0, 'confirmed': 1}
+
+@pytest.mark.skipif(not all(os.path.exists(path) for path in RUNS+[REFERENCE]), reason='no input runs 59/60/61 or no xtalk.cpp output')
+def test_matches_cpp_reference(monkeypatch):
+    pytest.importorskip('uproot')
+    monkeypatch.setenv('PIXELMAP_BACKEND', 'uproot'); monkeypatch.setenv('PIXELMAP_NO_CACHE', '1')
+    from rootextract import ExtractTH2
+    from xtalk import XTalkModule
+    status = XTalkModule(*RUNS,chips=[12])[12]
+    reference = ExtractTH2(REFERENCE,'h_confirmed2D')
+    assert reference.shape == status.shape == (336, 432)
+    np.testing.assert_array_equal(status == CONFIRMED, reference != 0)
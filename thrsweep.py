@@ -0,0 +1,67 @@
+##############################################################################
+# Threshold sweep of the missing bumps classification
+# Input: 1 root file of an X-Ray occupancy scan + 1 corresponding txt file
+# Usage: python3 thrsweep.py -occupancy <occupancy root file> -txt <txt file> -chip <chip#> -thr_min 1 -thr_max 1000 -thr_step 1 -thr_strange 1000
+# Output: table (csv) and sensitivity curve (png) of missing and low occ bumps vs threshold in <outpath>
+# The occupancy map is read once, all thresholds are computed from one sorted copy of the hits (classify.SweepThresholds)
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+##############################################################################
+import os
+import csv
+import argparse
+import numpy as np
+from classify import SweepThresholds
+from txtconfig import GetEnableMask
+
+def WriteSweepTable(sweep,file_path):
+    with open(file_path, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(list(sweep))
+        writer.writerows(zip(*(values.tolist() for values in sweep.values())))
+
+def PlotSweep(sweep,Thr_strange,title,file_path,dpi=150):
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    fig = plt.figure(figsize=(1050/96, 750/96), dpi=96)
+    ax = fig.add_subplot(111)
+    ax.plot(sweep['thr'], sweep['perc_missing'], '-', color='red', label='Missing bumps (< thr)')
+    ax.plot(sweep['thr'], sweep['perc_low_occ'], '-', color='orange', label='Low Occ bumps (thr - '+str(Thr_strange)+')')
+    ax.set_xlabel('Threshold [Hits]')
+    ax.set_ylabel('% of enabled pixels')
+    ax.set_title(title)
+    ax.legend(prop={'size': 14}, loc='upper left')
+    fig.savefig(file_path, format='png', dpi=dpi)
+    plt.close(fig)
+
+def main():
+    from rootextract import ExtractChipMaps, TriggerCount
+    parser = argparse.ArgumentParser(description='Sweep the threshold of the missing bumps classification')
+    parser.add_argument('-occupancy','--occupancy', help = 'The X-Ray occupancy root file (PixelAlive/NoiseScan)',   required = True, type = str)
+    parser.add_argument('-txt','--txt', help = 'The txt file with the chip configuration',                          required = True, type = str)
+    parser.add_argument('-module','--module', help = 'The name of the module',                                       default = 'RH0027', type = str)
+    parser.add_argument('-chip','--chip', help = 'The ROC ID [12,15] for Quads and [12,13] for Duals',               default = '12', type = str)
+    parser.add_argument('-thr_min','--thr_min', help = 'The first threshold of the sweep [Hits]',                    default = 1, type = float)
+    parser.add_argument('-thr_max','--thr_max', help = 'The last threshold of the sweep [Hits]',                     default = 1000, type = float)
+    parser.add_argument('-thr_step','--thr_step', help = 'The step of the sweep [Hits]',                             default = 1, type = float)
+    parser.add_argument('-thr_strange','--thr_strange', help = 'The threshold to classify the Low Occ bumps [Hits]', default = 1000, type = int)
+    parser.add_argument('-ntrg','--ntrg', help = 'The total # of triggers in the xml',                               default = int(1e7), type = TriggerCount)
+    parser.add_argument('-nbx','--nbx', help = 'The total # of bunch crossing for each trigger in the xml',          default = 10, type = int)
+    parser.add_argument('-outpath','--outpath', help = 'The folder where the results are stored',                    default = 'results_sweep/', type = str)
+    parser.add_argument('-noplots','--noplots', help = 'Only write the table',                                       action = 'store_true')
+    args = parser.parse_args()
+
+    Data = ExtractChipMaps(args.occupancy,{'PixelAlive':'2D'},args.chip)['PixelAlive']*args.ntrg*args.nbx
+    Enable = GetEnableMask(args.txt)
+    thresholds = np.arange(args.thr_min, args.thr_max+args.thr_step/2, args.thr_step)
+    sweep = SweepThresholds(Data,Enable,thresholds,args.thr_strange)
+
+    if not os.path.exists(args.outpath): os.makedirs(args.outpath)
+    base = os.path.join(args.outpath, args.module+'_chip_'+str(int(args.chip))+'_ThrSweep_'+'{:g}_{:g}_{:g}'.format(args.thr_min,args.thr_max,args.thr_strange))
+    WriteSweepTable(sweep,base+'.csv')
+    if not args.noplots: PlotSweep(sweep,args.thr_strange,'Sensor: '+args.module+' chip_'+str(int(args.chip)),base+'.png')
+    print('Sweep of '+str(thresholds.size)+' thresholds saved to '+base+'.csv')
+
+if __name__ == "__main__":
+    main()
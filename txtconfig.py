@@ -0,0 +1,76 @@
+##############################################################################
+# Parser of the Ph2_ACF chip configuration txt files (CMSIT_RD53_*.txt)
+# Usage: from txtconfig import ParseChipConfig; cfg = ParseChipConfig('input/txt/Run000081_CMSIT_RD53_RH0026_0_12.txt')
+#        python3 txtconfig.py <txt file> (prints a summary of the per-pixel blocks)
+# Output: dict with the per-pixel blocks as (rows, cols) numpy arrays:
+#         ENABLE, HITBUS, INJEN (uint8) and TDAC (int8)
+# The parsed arrays are cached in <cache dir>/txtconfig/ and reused as long as the txt file is not modified.
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+##############################################################################
+import os
+import sys
+import hashlib
+import numpy as np
+
+num_rows = 336; num_cols = 432
+PIXEL_BLOCKS = {'ENABLE': np.uint8, 'HITBUS': np.uint8, 'INJEN': np.uint8, 'TDAC': np.int8}
+CACHE_DIR = os.path.join(os.environ.get('PIXELMAP_CACHE', '.cache'), 'txtconfig')
+
+# Reads all the per-pixel blocks in one pass. In the txt file every "COL" section holds one line
+# per block with the values of the num_rows pixels of that column.
+def _ParseTxt(file_path,num_rows,num_cols):
+    lines = {block: [] for block in PIXEL_BLOCKS}
+    with open(file_path, 'r') as file:
+        for line in file:
+            block = line.split(' ',1)[0]
+            if block in lines: lines[block].append(line[len(block):])
+    config = {}
+    for block,dtype in PIXEL_BLOCKS.items():
+        if not lines[block]: continue
+        if len(lines[block]) != num_cols:
+            raise ValueError(file_path+": found "+str(len(lines[block]))+" "+block+" columns, expected "+str(num_cols))
+        values = np.fromstring(','.join(lines[block]), dtype=np.int16, sep=',')
+        if values.size != num_rows*num_cols:
+            raise ValueError(file_path+": found "+str(values.size)+" "+block+" values, expected "+str(num_rows*num_cols))
+        config[block] = np.ascontiguousarray(values.reshape(num_cols,num_rows).T.astype(dtype))
+    return config
+
+# Cache file of a txt file (one per path, the mtime and size of the parsed file are stored inside)
+def _CachePath(file_path,cache_dir):
+    key = hashlib.sha1(os.path.abspath(file_path).encode()).hexdigest()
+    return os.path.join(cache_dir, key+'.npz')
+
+# Returns the per-pixel blocks of a chip configuration txt file, parsing it only if the cache is missing or outdated
+def ParseChipConfig(file_path,num_rows=num_rows,num_cols=num_cols,cache_dir=CACHE_DIR,use_cache=True):
+    stat = os.stat(file_path)
+    stamp = np.array([stat.st_mtime_ns, stat.st_size, num_rows, num_cols], dtype=np.int64)
+    cache_path = _CachePath(file_path,cache_dir)
+    if use_cache and os.path.exists(cache_path):
+        try:
+            with np.load(cache_path) as cached:
+                if np.array_equal(cached['_stamp'], stamp):
+                    return {block: cached[block] for block in cached.files if block != '_stamp'}
+        except (OSError, ValueError, KeyError):
+            pass # corrupted cache file, parse again
+    config = _ParseTxt(file_path,num_rows,num_cols)
+    if use_cache:
+        if not os.path.exists(cache_dir): os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = cache_path+'.'+str(os.getpid())+'.tmp.npz'
+        np.savez(tmp_path, _stamp=stamp, **config)
+        os.replace(tmp_path, cache_path)
+    return config
+
+# Mask of the enabled pixels, (rows, cols): 0 means MASKED, 1 Good
+def GetEnableMask(file_path,num_rows=num_rows,num_cols=num_cols):
+    return ParseChipConfig(file_path,num_rows,num_cols)['ENABLE']
+
+def main():
+    for file_path in sys.argv[1:]:
+        config = ParseChipConfig(file_path)
+        print(file_path)
+        for block,values in config.items():
+            print('  '+block+':\t'+str(values.shape)+' '+str(values.dtype)+'\tmin '+str(values.min())+'\tmax '+str(values.max())+'\tzeros '+str(int(np.count_nonzero(values==0))))
+
+if __name__ == "__main__":
+    main()
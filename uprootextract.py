@@ -0,0 +1,89 @@
+##############################################################################
+# Pure python (uproot) backend of rootextract.py: reads the Ph2_ACF root files without a ROOT installation
+# Usage: PIXELMAP_BACKEND=uproot python3 xray.py ...   (or rootextract.SetBackend('uproot'))
+# The files are memory-mapped (uproot MemmapSource) and the histograms are decoded straight into numpy arrays
+# identical to the PyROOT ones: (rows, cols) with the dtype of the histogram class, entries as float.
+# Ph2_ACF stores every scan as a TCanvas, which uproot cannot model (no TCanvas streamer in the files): the
+# histogram is found in the canvas buffer by its class tag and deserialized on its own.
+# Writing produces TH2F histograms with the same content, entries and binning as rootextract.NumpyToTH2.
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+##############################################################################
+import re
+import numpy as np
+import uproot
+from rootextract import BOARD_ID, OPTICAL_ID, Ph2_ACFHistName, Ph2_ACFHistPath
+
+# New class tag (kNewClassTag + class name) of a histogram inside an object buffer
+_HIST_TAG = re.compile(rb'\xff\xff\xff\xff(TH[12][CSIFD])\x00')
+
+def Open(file_path):
+    return uproot.open(file_path, handler=uproot.MemmapSource)
+
+# Lists the chip IDs stored in a Ph2_ACF root file
+def ListChips(infile,H_ID):
+    path = "Detector/Board_"+BOARD_ID+"/OpticalGroup_"+OPTICAL_ID+"/Hybrid_"+H_ID
+    if path not in infile: return []
+    chips = {name.split(';')[0] for name in infile[path].keys(recursive=False) if name.startswith("Chip_")}
+    return sorted(int(name.replace("Chip_","")) for name in chips)
+
+# Deserializes the histograms found in the buffer of a key (in the order they are stored)
+def _BufferHists(key,infile):
+    chunk, cursor = key.get_uncompressed_chunk_cursor()
+    raw = bytes(chunk.raw_data)
+    for match in _HIST_TAG.finditer(raw, cursor.index):
+        hist_cursor = cursor.copy()
+        hist_cursor.skip(match.start()-4-cursor.index) # byte count in front of the class tag
+        yield uproot.deserialization.read_object_any(chunk, hist_cursor, {'breadcrumbs': (), 'TKey': key}, infile.file, infile.file, None)
+
+# Returns the histogram drawn in the canvas of a scan (the primitive with the scan name, or the first histogram)
+def GetChipHist(infile,Scan_n,chipID,H_ID):
+    path = Ph2_ACFHistPath(Scan_n,chipID,H_ID)
+    if path not in infile: raise KeyError("No object "+path+" in "+infile.file_path)
+    key = infile.key(path)
+    if key.fClassName != "TCanvas": return infile[path]
+    first = None
+    for hist in _BufferHists(key,infile):
+        if hist.member('fName') == Ph2_ACFHistName(Scan_n,chipID,H_ID): return hist
+        if first is None: first = hist
+    if first is None: raise KeyError("No histogram in canvas "+path)
+    return first
+
+# (nbinsY, nbinsX) = (rows, cols) numpy array of a TH2, without under/overflow
+def TH2ToNumpy(hist):
+    return np.ascontiguousarray(hist.values().T)
+
+# Extracts a 2D histogram as a numpy array or the number of entries of a 1D histogram
+def Ph2_ACFRootExtractor(infile,Scan_n,type,chipID,H_ID):
+    hist = GetChipHist(infile,Scan_n,chipID,H_ID)
+    if "2D" in type: return TH2ToNumpy(hist)
+    return float(hist.member('fEntries'))
+
+# Opens the root file once and extracts the requested items (see rootextract._ExtractItems)
+def ExtractItems(file_path,requests,H_ID):
+    with Open(file_path) as inFile:
+        return {name: np.array(ListChips(inFile,H_ID)) if request == 'chips' else Ph2_ACFRootExtractor(inFile,*request,H_ID=H_ID)
+                for name,request in requests.items()}
+
+# Reads a plain TH2 (not inside a canvas) from a root file as a numpy array
+def ExtractTH2(file_path,hist_name):
+    with Open(file_path) as inFile:
+        if hist_name not in inFile: raise KeyError("No histogram "+hist_name+" in "+file_path)
+        return TH2ToNumpy(inFile[hist_name])
+
+# TH2F with the content of a (rows, cols) array and the binning of rootextract.NumpyToTH2 (no statistics, entries = # of bins)
+def _WritableTH2(array,name,title):
+    num_rows, num_cols = array.shape
+    data = np.zeros((num_rows+2, num_cols+2), dtype=np.float32)
+    data[1:-1,1:-1] = array
+    return uproot.writing.identify.to_TH2x(name, title, data.ravel(), float(array.size), 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0,
+                                           np.zeros(0, dtype=np.float64),
+                                           uproot.writing.identify.to_TAxis("xaxis", "", num_cols, 0.0, float(num_cols)),
+                                           uproot.writing.identify.to_TAxis("yaxis", "", num_rows, 0.0, float(num_rows)))
+
+# Writes numpy maps to a root file as TH2F histograms ({name: array} or {name: (array, title)})
+def WriteTH2s(file_path,maps):
+    with uproot.recreate(file_path) as output_file:
+        for name,value in maps.items():
+            array,title = value if isinstance(value,tuple) else (value,name)
+            output_file[name] = _WritableTH2(np.asarray(array),name,title)
@@ -0,0 +1,232 @@
+##############################################################################
+# Ingestion daemon: watches the input folders and analyses the new runs as soon as they land (asyncio)
+# Usage: python3 watcher.py -bias 80 -input input [other folders] [-store results_store] [-jobs 2] [-queue 8] [-scurve Run000081]
+#        [-thr_missing 1] [-thr_strange 1000] [-ntrg 1e7] [-nbx 10] [-manifest plan.csv] [-plots summary] [-report results_report/] [-once]
+# Matching: the chip txt files (Run<scurve>_CMSIT_RD53_<module>_<hybrid>_<chip>.txt, in the folder or in its txt/ subfolder)
+# give the module and chips of an SCurve run. Every new Run*_PixelAlive.root is analysed by xray.py for these chips with
+# the newest SCurve run having txt files (or -scurve). xtalk/frbias and the comparison need to know which runs belong
+# together: list them in a pipeline manifest (-manifest, see pipeline.py, re-read at every scan), an entry runs as soon
+# as all its files are there. The bias, thresholds and triggers of the command line apply to every occupancy run, except
+# the runs listed in the manifest (occupancy column), analysed with the values of their manifest line.
+# When the bias changes, restart the watcher with the new -bias: the settings are part of the job identity.
+# A file is used once its size did not change for one scan and it is older than -settle seconds (still written otherwise).
+# Jobs go through a bounded queue (-queue): when the workers are busy the scanner waits, nothing is read ahead.
+# De-duplication: a job is identified by its kind, chip and the content hash of its files; done jobs are kept in
+# <store>/watcher_state.json, so a restart or a copied file does not analyse the same data twice.
+# Publishing: the result store (status maps + summaries), one json line per chip in <store>/watcher_results.jsonl,
+# one terminal line per chip, and with -report the campaign report (report.py), rebuilt at most once per -interval when
+# chips finished, outside of the workers: only the thumbnails of the new chips are drawn, the others are kept in memory.
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+##############################################################################
+import os
+import re
+import json
+import time
+import glob
+import asyncio
+import argparse
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from resultstore import RunName, STORE_DIR
+
+RUN_FILE = re.compile(r'^(Run\d+)_(\w+)\.root$')
+TXT_FILE = re.compile(r'^(Run\d+)_CMSIT_RD53_(.+)_(\d+)_(\d+)\.txt$')
+STATE_FILE = 'watcher_state.json'; RESULTS_FILE = 'watcher_results.jsonl'
+
+# Files of the input folders: ({run: {scan: root file}}, {run: {(module, chip): txt file}})
+def ScanInputs(input_dirs):
+    runs = {}; txts = {}
+    for input_dir in input_dirs:
+        for file_path in glob.glob(os.path.join(input_dir,'*.root')):
+            match = RUN_FILE.match(os.path.basename(file_path))
+            if match: runs.setdefault(match.group(1), {})[match.group(2)] = file_path
+        for file_path in glob.glob(os.path.join(input_dir,'*.txt'))+glob.glob(os.path.join(input_dir,'txt','*.txt')):
+            match = TXT_FILE.match(os.path.basename(file_path))
+            if match: txts.setdefault(match.group(1), {})[(match.group(2), int(match.group(4)))] = file_path
+    return runs, txts
+
+# xray jobs of the occupancy runs: every chip with a txt file of the SCurve run (the newest one with txt files if not given),
+# with the bias, thresholds and triggers of the command line.
+# exclude: files of the manifest runs (xtalk injection scans, and occupancy runs analysed with the settings of their manifest line)
+def XRayJobs(runs,txts,cfg,exclude=()):
+    scurves = [run for run in sorted(txts) if 'SCurve' in runs.get(run, {})]
+    scurve = cfg.scurve if cfg.scurve else (scurves[-1] if scurves else None)
+    if scurve not in txts or 'SCurve' not in runs.get(scurve, {}): return []
+    jobs = []
+    for run,scans in sorted(runs.items()):
+        if cfg.occupancy_scan not in scans or scans[cfg.occupancy_scan] in exclude: continue
+        for (module,chip),txt in sorted(txts[scurve].items()):
+            entry = dict(Sensor=module, chipID=str(chip), thr_data_file=runs[scurve]['SCurve'], analyzed_data_file=scans[cfg.occupancy_scan],
+                         analyzed_txt_file=txt, Path=cfg.outpath, outroot='', verbose=False, plotset=cfg.plots, dpi=cfg.dpi,
+                         Voltage_1=cfg.bias, Thr=cfg.thr_missing, Thr_strange=cfg.thr_strange, nTrg=cfg.ntrg, nBX=cfg.nbx, V_adc=cfg.vref)
+            jobs.append({'kind': 'xray', 'module': module, 'chip': chip, 'run': run, 'entry': entry,
+                         'files': [entry['thr_data_file'], entry['analyzed_data_file'], entry['analyzed_txt_file']]})
+    return jobs
+
+# Jobs of the pipeline manifest entries (xray + xtalk + frbias + comparison of one chip)
+def ManifestJobs(cfg):
+    from pipeline import ReadPipelineManifest
+    if not cfg.manifest or not os.path.exists(cfg.manifest): return []
+    jobs = []
+    for entry in ReadPipelineManifest(cfg.manifest,cfg.input[0],cfg.outpath,cfg.plots,cfg.dpi):
+        if 'xray' in entry: entry['xray']['outroot'] = ''
+        files = ([entry['xray'][key] for key in ('thr_data_file','analyzed_data_file','analyzed_txt_file')] if 'xray' in entry else []) \
+                + entry.get('xtalk', []) + entry.get('frbias', [])
+        run = RunName(entry['xray']['analyzed_data_file']) if 'xray' in entry else RunName(files[0])
+        jobs.append({'kind': 'pipeline', 'module': entry['module'], 'chip': entry['chip'], 'run': run, 'entry': entry, 'files': files})
+    return jobs
+
+# True when all the files exist, are older than settle seconds and kept their size since the previous scan
+def FilesReady(files,sizes,settle):
+    now = time.time(); ready = True
+    for file_path in files:
+        try: stat = os.stat(file_path)
+        except OSError: return False
+        if sizes.get(file_path) != stat.st_size or now-stat.st_mtime < settle: ready = False
+        sizes[file_path] = stat.st_size
+    return ready
+
+# Identity of a job: kind, chip, settings and content of its files (the same data under another name is not analysed again)
+def JobKey(job):
+    from mapcache import FileHash
+    from resultstore import ParamsKey
+    settings = {key: value for key,value in (job['entry'] if job['kind'] == 'xray' else job['entry'].get('xray', {})).items()
+                if key in ('Voltage_1','Thr','Thr_strange','nTrg','nBX','V_adc')}
+    return job['kind']+'|'+job['module']+'|'+str(job['chip'])+'|'+ParamsKey(settings)+'|'+'|'.join(FileHash(file_path)[:16] for file_path in job['files'])
+
+# Runs one job in a worker process. Returns the summary of the chip (errors in 'error')
+def RunJob(job,store):
+    start = time.perf_counter()
+    if job['kind'] == 'xray':
+        import xray
+        try: result = xray.AnalyzeChip(xray.ChipConfig(**job['entry'], store=store))
+        except Exception as error: result = {'module': job['module'], 'chip': job['chip'], 'error': type(error).__name__+': '+str(error)}
+    else:
+        from pipeline import _ProcessEntry
+        result = _ProcessEntry(job['entry'],store)
+    result.update({'kind': job['kind'], 'run': job['run'], 'seconds': round(time.perf_counter()-start, 3)})
+    return result
+
+def LoadState(store):
+    path = os.path.join(store,STATE_FILE)
+    if not os.path.exists(path): return {}
+    with open(path) as file: return json.load(file)
+
+def SaveState(store,done):
+    path = os.path.join(store,STATE_FILE)
+    with open(path+'.tmp', 'w') as file: json.dump(done, file, indent=1)
+    os.replace(path+'.tmp', path)
+
+# Publishes the result of a chip: json line and terminal line
+def Publish(result,cfg):
+    line = {key: value.item() if isinstance(value, np.generic) else value for key,value in result.items()
+            if isinstance(value, (str, int, float, bool, np.generic)) or value is None}
+    line['finished'] = time.strftime('%Y-%m-%d %H:%M:%S')
+    with open(os.path.join(cfg.store,RESULTS_FILE), 'a') as file: file.write(json.dumps(line, default=str)+'\n')
+    missing = ', '.join(key+' '+str(result[key]) for key in ('missing','xray_missing','xtalk_confirmed','frbias_missing') if key in result)
+    print(line['finished']+'  '+result['kind']+'\t'+str(result['module'])+' chip '+str(result['chip'])+'\t'+result['run']+'\t'
+          +('ERROR '+result['error'] if 'error' in result else missing)+'\t('+str(result['seconds'])+' s)', flush=True)
+
+# Rebuilds the campaign report every -interval seconds if chips were published since the last build, and once more at the end
+async def Reporter(state,cfg,done):
+    from report import BuildReport
+    loop = asyncio.get_running_loop()
+    thumbnails = {} # {(module, chip): (results key, thumbnails)}, only the chips with new results are drawn again
+    while True:
+        finished = done.is_set()
+        if state['report']:
+            state['report'] = False
+            await loop.run_in_executor(None, BuildReport, cfg.store, cfg.report, None, 4, 1, 1.0, thumbnails)
+        if finished: return
+        try: await asyncio.wait_for(done.wait(), cfg.interval)
+        except asyncio.TimeoutError: pass
+
+# Scans the folders every -interval seconds and queues the ready jobs not done yet (waits while the queue is full)
+async def Scanner(queue,state,cfg):
+    loop = asyncio.get_running_loop()
+    sizes = {}; manifest_jobs = []
+    while True:
+        runs, txts = ScanInputs(cfg.input)
+        # a manifest being edited can be incomplete: keep the jobs of the last readable version until the next scan
+        try: manifest_jobs = ManifestJobs(cfg)
+        except Exception as error: print('Manifest '+str(cfg.manifest)+' not readable ('+type(error).__name__+': '+str(error)+'), previous version kept', flush=True)
+        exclude = {file_path for job in manifest_jobs for file_path in job['entry'].get('xtalk', [])+[job['entry'].get('xray', {}).get('analyzed_data_file')]}
+        jobs = XRayJobs(runs,txts,cfg,exclude) + manifest_jobs
+        waiting = 0
+        for job in jobs:
+            if not all(os.path.exists(file_path) for file_path in job['files']): continue # some runs did not land yet
+            if not FilesReady(job['files'],sizes,cfg.settle): waiting += 1; continue
+            try: key = await loop.run_in_executor(None, JobKey, job) # hashing in a thread, the workers keep publishing
+            except OSError: waiting += 1; continue
+            if key in state['done'] or key in state['queued']: continue
+            job['key'] = key; state['queued'].add(key)
+            await queue.put(job) # backpressure: blocks while the workers are busy
+        if cfg.once and not waiting: break
+        await asyncio.sleep(cfg.interval)
+    for _ in range(cfg.jobs): await queue.put(None)
+
+# Takes the jobs from the queue, runs them in the process pool and publishes every chip as soon as it is done
+async def Worker(queue,pool,state,cfg):
+    loop = asyncio.get_running_loop()
+    while True:
+        job = await queue.get()
+        if job is None: queue.task_done(); return
+        try: result = await loop.run_in_executor(pool, RunJob, job, cfg.store)
+        except Exception as error: result = {'module': job['module'], 'chip': job['chip'], 'kind': job['kind'], 'run': job['run'], 'seconds': 0,
+                                             'error': type(error).__name__+': '+str(error)}
+        state['queued'].discard(job['key'])
+        state['done'][job['key']] = {'kind': job['kind'], 'module': job['module'], 'chip': job['chip'], 'run': job['run'],
+                                     'finished': time.time(), 'error': result.get('error')}
+        SaveState(cfg.store,state['done'])
+        async with state['publish']: await loop.run_in_executor(None, Publish, result, cfg)
+        state['report'] = True
+        queue.task_done()
+
+async def Watch(cfg):
+    if not os.path.exists(cfg.store): os.makedirs(cfg.store)
+    state = {'done': LoadState(cfg.store), 'queued': set(), 'publish': asyncio.Lock(), 'report': False}
+    if cfg.retry: state['done'] = {key: done for key,done in state['done'].items() if not done.get('error')}
+    queue = asyncio.Queue(maxsize=cfg.queue)
+    print('Watching '+', '.join(cfg.input)+' ('+str(len(state['done']))+' jobs already done, '+str(cfg.jobs)+' workers)', flush=True)
+    with ProcessPoolExecutor(max_workers=cfg.jobs) as pool:
+        workers = [asyncio.create_task(Worker(queue,pool,state,cfg)) for _ in range(cfg.jobs)]
+        done = asyncio.Event()
+        reporter = asyncio.create_task(Reporter(state,cfg,done)) if cfg.report else None
+        await Scanner(queue,state,cfg)
+        await asyncio.gather(*workers)
+        done.set()
+        if reporter: await reporter
+
+def main():
+    from rootextract import TriggerCount
+    parser = argparse.ArgumentParser(description='Analyse the new runs of the input folders as they land')
+    parser.add_argument('-input','--input', help = 'The folders to watch (root files, txt files in it or in txt/)',  nargs = '+', default = ['input'])
+    parser.add_argument('-store','--store', help = 'The result store folder (also keeps the watcher state)',        default = STORE_DIR, type = str)
+    parser.add_argument('-outpath','--outpath', help = 'The folder of the plots',                                    default = 'results_watch/', type = str)
+    parser.add_argument('-manifest','--manifest', help = 'Pipeline manifest of the xtalk/frbias runs (see pipeline.py)', default = None, type = str)
+    parser.add_argument('-scurve','--scurve', help = 'The SCurve run of the xray jobs (default: the newest with txt files)', default = None, type = str)
+    parser.add_argument('-occupancy_scan','--occupancy_scan', help = 'The scan name of the occupancy files',         default = 'PixelAlive', type = str)
+    parser.add_argument('-bias','--bias', help = 'The bias of the module during the occupancy runs [V]',             required = True, type = str)
+    parser.add_argument('-thr_missing','--thr_missing', help = 'The threshold to classify the missing bumps [Hits]', default = 1, type = int)
+    parser.add_argument('-thr_strange','--thr_strange', help = 'The threshold to classify the Low Occ bumps [Hits]', default = 1000, type = int)
+    parser.add_argument('-ntrg','--ntrg', help = 'The total # of triggers in the xml',                               default = int(1e7), type = TriggerCount)
+    parser.add_argument('-nbx','--nbx', help = 'The total # of bunch crossing for each trigger in the xml',          default = 10, type = int)
+    parser.add_argument('-vref','--vref', help = 'The VRef_ADC [mV]',                                                default = 800, type = int)
+    parser.add_argument('-jobs','--jobs', help = 'The number of worker processes',                                   default = 2, type = int)
+    parser.add_argument('-queue','--queue', help = 'The # of jobs waiting for a worker before the scanner waits',    default = 8, type = int)
+    parser.add_argument('-interval','--interval', help = 'Time between two scans of the folders [s]',                default = 5, type = float)
+    parser.add_argument('-settle','--settle', help = 'Minimum age of a file before it is read [s]',                  default = 5, type = float)
+    parser.add_argument('-plots','--plots', help = 'The set of xray plots to produce for each chip',                 default = 'summary', choices = ['full','summary','none'])
+    parser.add_argument('-dpi','--dpi', help = 'The resolution of the png plots',                                    default = 100, type = int)
+    parser.add_argument('-report','--report', help = 'Keep the campaign report up to date in this folder',            default = None, type = str)
+    parser.add_argument('-retry','--retry', help = 'Run again the jobs that ended with an error',                    action = 'store_true')
+    parser.add_argument('-once','--once', help = 'Process the files present and exit (no watching)',                 action = 'store_true')
+    cfg = parser.parse_args()
+    cfg.outpath = os.path.join(cfg.outpath,'')
+
+    try: asyncio.run(Watch(cfg))
+    except KeyboardInterrupt: print('Stopped')
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+##############################################################################
+# Batch X-Ray analysis of many modules and chips with a process pool
+# Input: a manifest (csv) with one line per chip:
+#   module,chip,scurve,occupancy,txt[,bias,thr_missing,thr_strange,ntrg,nbx,vref]
+#   scurve/occupancy are run numbers (Run000081) or paths to the root files, txt is the chip configuration txt file
+# Usage: python3 xraybatch.py -manifest <manifest.csv> -outpath <results folder> -jobs <# of workers> [-plots full|summary|none] [-dpi 300]
+# Output: per chip png plots + missing map root file in <outpath>/<module>/, campaign summary in <outpath>/campaign_summary.csv
+# -profile: wall/CPU time of every stage of every chip, aggregated over the batch in <outpath>/profile.json/.csv (see instrument.py)
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+##############################################################################
+import os
+import csv
+import time
+import argparse
+import instrument
+from rootextract import RunFile, TxtFile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+SUMMARY_FIELDS = ['module','chip','masked','missing','perc_missing','low_occ','perc_low_occ','fit_errors','readout_errors','readout_errors_xray',
+                  'thr_mean','thr_sigma','noise_mean','noise_sigma','error']
+
+# Reads the manifest and returns one dict of ChipConfig arguments per chip
+def ReadManifest(manifest_path,input_dir='input',outpath='results_batch/',occupancy_scan='PixelAlive',plotset='full',dpi=300,store=None):
+    entries = []
+    with open(manifest_path, newline='') as file:
+        rows = csv.DictReader(line for line in file if line.strip() and not line.startswith('#'))
+        for row in rows:
+            row = {key.strip(): value.strip() for key,value in row.items() if key and value}
+            entry = dict(Sensor=row['module'], chipID=row['chip'],
+                         thr_data_file=RunFile(row['scurve'],'SCurve',input_dir),
+                         analyzed_data_file=RunFile(row['occupancy'],occupancy_scan,input_dir),
+                         analyzed_txt_file=TxtFile(row['txt'],input_dir),
+                         Path=outpath, outroot=os.path.join(outpath,row['module'],'xrayroot'+row['chip']+'.root'),
+                         verbose=False, plotset=plotset, dpi=dpi, store=store)
+            if 'bias' in row: entry['Voltage_1']=row['bias']
+            if 'thr_missing' in row: entry['Thr']=int(row['thr_missing'])
+            if 'thr_strange' in row: entry['Thr_strange']=int(row['thr_strange'])
+            if 'ntrg' in row: entry['nTrg']=int(float(row['ntrg']))
+            if 'nbx' in row: entry['nBX']=int(row['nbx'])
+            if 'vref' in row: entry['V_adc']=int(row['vref'])
+            entries.append(entry)
+    return entries
+
+# Imports the analysis (ROOT, matplotlib, ...) once per worker process
+def _InitWorker():
+    import xray
+
+# Runs the analysis of one chip inside a worker, errors are reported in the summary instead of stopping the batch
+def _AnalyzeEntry(entry):
+    import xray
+    try:
+        result = xray.AnalyzeChip(xray.ChipConfig(**entry))
+    except Exception as error:
+        result = {'module': entry['Sensor'], 'chip': entry['chipID'], 'error': type(error).__name__+': '+str(error)}
+    if instrument.Enabled(): result['profile'] = instrument.TakeRecords()
+    return result
+
+# Fans the manifest entries across a process pool and collects the per-chip summaries (in manifest order)
+def RunBatch(entries,jobs=None):
+    results = [None]*len(entries)
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_InitWorker) as pool:
+        futures = {pool.submit(_AnalyzeEntry,entry): i for i,entry in enumerate(entries)}
+        for future in as_completed(futures):
+            result = future.result()
+            instrument.Merge(result.pop('profile', None))
+            results[futures[future]] = result
+            print('Done: module '+result['module']+' chip '+str(result['chip'])+(' -- ERROR '+result['error'] if 'error' in result else ''))
+    return results
+
+# Writes the campaign summary table (csv) and prints it
+def WriteSummary(results,file_path):
+    with open(file_path, 'w', newline='') as file:
+        writer = csv.DictWriter(file, fieldnames=SUMMARY_FIELDS, extrasaction='ignore')
+        writer.writeheader()
+        for result in results: writer.writerow(result)
+    print('##############################################################\n CAMPAIGN SUMMARY\n##############################################################')
+    print('Module\t\tChip\tMasked\tMissing\t\tLow Occ\t\tFit err\tRO err\tRO err (xray)')
+    for result in results:
+        if 'error' in result:
+            print(result['module']+'\t'+str(result['chip'])+'\tERROR: '+result['error'])
+            continue
+        print(result['module']+'\t'+str(result['chip'])+'\t'+str(result['masked'])+'\t'+str(result['missing'])+' ('+str(result['perc_missing'])+'%)\t'
+              +str(result['low_occ'])+' ('+str(result['perc_low_occ'])+'%)\t'+str(result['fit_errors'])+'\t'+str(result['readout_errors'])+'\t'+str(result['readout_errors_xray']))
+    print('##############################################################')
+    print('Summary saved to '+file_path+'\n')
+
+def main():
+    parser = argparse.ArgumentParser(description='Do the XRay analysis of a whole campaign')
+    parser.add_argument('-manifest','--manifest', help = 'The csv manifest (module,chip,scurve,occupancy,txt,...)',  required = True, type = str)
+    parser.add_argument('-input','--input', help = 'The folder with the root files (and txt/ subfolder)',            default = 'input', type = str)
+    parser.add_argument('-outpath','--outpath', help = 'The folder where the results are stored',                    default = 'results_batch/', type = str)
+    parser.add_argument('-occupancy_scan','--occupancy_scan', help = 'The scan name of the occupancy files',         default = 'PixelAlive', type = str)
+    parser.add_argument('-jobs','--jobs', help = 'The number of worker processes (default: # of cpus)',              default = None, type = int)
+    parser.add_argument('-plots','--plots', help = 'The set of plots to produce for each chip',                      default = 'full', choices = ['full','summary','none'])
+    parser.add_argument('-dpi','--dpi', help = 'The resolution of the png plots',                                    default = 300, type = int)
+    parser.add_argument('-store','--store', help = 'The result store folder (no store if not given)',                default = None, type = str)
+    parser.add_argument('-profile','--profile', help = 'Time every stage of every chip (report in <outpath>/profile.json/.csv)', action = 'store_true')
+    args = parser.parse_args()
+
+    outpath = os.path.join(args.outpath,'')
+    entries = ReadManifest(args.manifest,args.input,outpath,args.occupancy_scan,args.plots,args.dpi,args.store)
+    if not os.path.exists(outpath): os.makedirs(outpath)
+    if args.profile and not instrument.Enabled(): instrument.Enable()
+    start = time.perf_counter()
+    results = RunBatch(entries,args.jobs)
+    elapsed = time.perf_counter()-start
+    WriteSummary(results,os.path.join(outpath,'campaign_summary.csv'))
+    if instrument.Enabled():
+        records = instrument.Records()
+        instrument.PrintReport(records)
+        print('Batch: '+str(len(entries))+' chips in '+'{:.1f}'.format(elapsed)+' s with '+str(args.jobs or os.cpu_count())+' workers')
+        print('Profile saved to '+', '.join(instrument.WriteReport(records,os.path.join(outpath,'profile'),
+                                                                   {'chips': len(entries), 'jobs': args.jobs or os.cpu_count(), 'elapsed_s': elapsed})))
+
+if __name__ == "__main__":
+    main()
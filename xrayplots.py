@@ -0,0 +1,210 @@
+##############################################################################
+# Rendering of the xray.py plots from a plain data bundle
+# Usage: from xrayplots import PlotBundle, RenderPlots
+#        RenderPlots(PlotBundle(...), plotset='full', dpi=300, workers=4)
+# Plot sets: 'full' (all the figures), 'summary' (missing bumps map only), 'none' (matplotlib is not even imported)
+# Every figure is an independent task: with workers > 1 they are rendered in a process pool,
+# each figure is closed as soon as it is saved.
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+##############################################################################
+import os
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from instrument import Stage, SetContext, Context, TakeRecords, Merge
+
+####### PARAMETERS TO BE CHANGED MANUALLY: ###################################
+FIT=True; YMAX=100000; step=10; VMAX=7000
+##############################################################################
+
+# Collects everything the plots need: maps as numpy arrays + numbers and names, no ROOT or analysis objects
+def PlotBundle(cfg, ToTMap, NoiseMap, ThrMap, Data, Missing_mat, ToTMapX, Missing, Missing_strange, Perc_missing, Perc_missing_strange, Disabled, FitErrors):
+    return dict(Path=cfg.Path, Sensor=cfg.Sensor, Voltage_1=cfg.Voltage_1, C_ID=cfg.chipID, Thr=cfg.Thr, Thr_strange=cfg.Thr_strange,
+                V_adc=cfg.V_adc, ToTMap=ToTMap, NoiseMap=NoiseMap, ThrMap=ThrMap, Data=Data, Missing_mat=Missing_mat, ToTMapX=ToTMapX,
+                Missing=Missing, Missing_strange=Missing_strange, Perc_missing=Perc_missing, Perc_missing_strange=Perc_missing_strange,
+                Disabled=Disabled, FitErrors=FitErrors)
+
+_plt = None
+# Imports matplotlib (Agg backend + CMS style) the first time a figure is drawn in this process
+def Pyplot():
+    global _plt
+    if _plt is None:
+        import matplotlib
+        matplotlib.use('Agg')
+        import matplotlib.pyplot as plt
+        try:
+            import mplhep as hep
+            hep.style.use("CMS")
+        except ImportError:
+            print("mplhep not found, using default Matplotlib style")
+        _plt = plt
+    return _plt
+
+def _Frame(ax):
+    ax.spines["bottom"].set_linewidth(1); ax.spines["left"].set_linewidth(1); ax.spines["top"].set_linewidth(1); ax.spines["right"].set_linewidth(1)
+
+def _Save(fig,b,name,dpi):
+    plt = Pyplot()
+    fig.savefig(b['Path']+b['Sensor']+'/'+name, format='png', dpi=dpi)
+    plt.close(fig)
+    return b['Path']+b['Sensor']+'/'+name
+
+# Conversion from VCal to electrons and histogram ranges
+def _ElConv(b):
+    el_conv=b['V_adc']/162
+    return dict(el_conv=el_conv, Noise_MAX=65*el_conv, Thr_MAX=600*el_conv, step_noise=0.1*el_conv, step_thr=2*el_conv)
+
+# Fits a Gaussian to a histogram (bin centers, counts) with gaussfit.py and draws it with its mean and sigma
+def GAUSS_FIT(x_hist,y_hist,color):
+    from gaussfit import FitGaussians, gaus
+    plt = Pyplot()
+    params = FitGaussians(x_hist,y_hist,refine=True)
+    if not params['valid']: return
+    x_hist_2=np.linspace(np.min(x_hist),np.max(x_hist),500)
+    plt.plot(x_hist_2,gaus(x_hist_2,params['amplitude'],params['mean'],params['sigma']),color,label='FIT: $\\mu$ = '+str(round(float(params['mean']),1))+' e$^-$ $\\sigma$ = '+str(round(float(params['sigma']),1))+' e$^-$')
+
+# Map with a horizontal colorbar (Noise, Threshold, ToT and Hits maps)
+def _MapFigure(b,key,name,label,dpi,scale=1,**imshow_args):
+    plt = Pyplot()
+    fig = plt.figure()
+    ax = fig.add_subplot(111)
+    _Frame(ax)
+    imgplot = ax.imshow(b[key]*scale if scale != 1 else b[key], **imshow_args)
+    ax.set_aspect(1)
+    plt.colorbar(imgplot, orientation='horizontal', extend='max', label=label)
+    return _Save(fig,b,name,dpi)
+
+# Noise Map: This plot shows the distribution of noise levels across the sensor.
+def NoiseMapPlot(b,dpi):
+    c=_ElConv(b)
+    return _MapFigure(b,'NoiseMap',b['Voltage_1']+'V_Noise_Map.png','electrons',dpi,scale=c['el_conv'],vmax=c['Noise_MAX']) #150vmax
+
+# Threshold Map: This plot shows the threshold levels across the sensor.
+def ThresholdMapPlot(b,dpi):
+    c=_ElConv(b)
+    return _MapFigure(b,'ThrMap',b['Voltage_1']+'V_Threshold_Map.png','electrons',dpi,scale=c['el_conv'],vmax=c['Thr_MAX'],vmin=1200) #3500 vmax
+
+# ToT Map: This plot shows the time-over-threshold values across the sensor.
+def ToTMapPlot(b,dpi):
+    return _MapFigure(b,'ToTMap',b['Voltage_1']+'V_ToT_Map.png','ToT',dpi)
+
+# ToT Map XRay: This plot shows the ToT values specifically for the X-ray scan.
+def ToTMapXRayPlot(b,dpi):
+    return _MapFigure(b,'ToTMapX',b['Voltage_1']+'V_ToT_Map_XRay.png','ToT',dpi)
+
+# Raw Hit Map from XRay alone
+def HitsMapPlot(b,dpi):
+    return _MapFigure(b,'Data','chip_'+str(int(b['C_ID']))+'_XRay_Hits_Map.png','Hits',dpi,vmax=VMAX)
+
+# Raw Hit Map from XRay alone: This plot shows a zoomed-in view of the raw hits map from the X-ray scan.
+def HitsMapZoomPlot(b,dpi):
+    b=dict(b, Data=b['Data'][0:35,0:15])
+    return _MapFigure(b,'Data',b['Voltage_1']+'_XRay_Hits_Map_zoom.png','Hits',dpi,vmax=VMAX)
+
+#Histogram:
+def NoiseHistPlot(b,dpi):
+    plt = Pyplot(); c=_ElConv(b)
+    fig = plt.figure(figsize=(1050/96, 750/96), dpi=96)
+    ax = fig.add_subplot(111)
+    _Frame(ax)
+    h_S=plt.hist(b['NoiseMap'].flatten()*c['el_conv'],color='black',bins = np.arange(0,c['Noise_MAX'],c['step_noise']),label='Noise',histtype='step')
+    if FIT: GAUSS_FIT((h_S[1][:-1]+h_S[1][1:])/2,h_S[0],'red')
+    ax.set_ylim([0.1, 10000])
+    ax.set_yscale('log')
+    ax.set_xlabel('electrons')
+    ax.set_ylabel('entries')
+    ax.legend(prop={'size': 14}, loc='upper right')
+    return _Save(fig,b,b['Voltage_1']+'V_Noise_Hist.png',dpi)
+
+#Histogram: This plot shows the distribution of threshold levels across the sensor.
+def ThresholdHistPlot(b,dpi):
+    plt = Pyplot(); c=_ElConv(b)
+    fig = plt.figure(figsize=(1050/96, 750/96), dpi=96)
+    ax = fig.add_subplot(111)
+    _Frame(ax)
+    h_L=plt.hist(b['ThrMap'].flatten()*c['el_conv'],color='black',bins = np.arange(0,c['Thr_MAX'],c['step_thr']),label='Threshold',histtype='step')
+    if FIT: GAUSS_FIT((h_L[1][:-1]+h_L[1][1:])/2,h_L[0],'red')
+    ax.set_ylim([0.1, YMAX])
+    ax.set_xlim([0, c['Thr_MAX']])
+    ax.set_yscale('log')
+    ax.set_xlabel('electrons')
+    ax.set_ylabel('entries')
+    ax.legend(prop={'size': 14}, loc='upper left')
+    return _Save(fig,b,b['Voltage_1']+'V_Threshold_Hist.png',dpi)
+
+# HITS/PXL HISTOGRAM WITH X-RAYS: This plot shows the distribution of hits per pixel with X-rays.
+def HitsHistPlot(b,dpi):
+    plt = Pyplot(); Thr=b['Thr']; Thr_strange=b['Thr_strange']
+    fig = plt.figure(figsize=(1050/96, 750/96), dpi=96)
+    ax = fig.add_subplot(111)
+    _Frame(ax)
+    ax.set_yscale('log')
+    plt.hist(b['Data'].flatten(),color='black',bins = range(0,int(VMAX*3.0),step),label='Hits/pixel',histtype='step')
+    ax.plot([Thr,Thr],[0,2e3],'--r',linewidth=2)
+    ax.plot([Thr_strange,Thr_strange],[0,2e3],'--r',linewidth=2)
+    ax.set_xlabel('Number of total Hits/pixel')
+    ax.set_ylabel('entries')
+    ax.legend(prop={'size': 14}, loc='upper right')
+    return _Save(fig,b,b['Voltage_1']+'V_Hist_Thr_'+str(Thr)+'_'+str(Thr_strange)+'.png',dpi)
+
+# MISSING BUMPS FINAL MAPS
+def MissingBumpsPlot(b,dpi):
+    plt = Pyplot(); import matplotlib
+    Thr=b['Thr']; Thr_strange=b['Thr_strange']; C_ID=b['C_ID']
+    fig6, (ax1, ax2) = plt.subplots(1,2, figsize=(13, 7.5))
+    with plt.rc_context({'font.size': 16}):
+        fig6.suptitle("Sensor: "+b['Sensor']+" chip_"+str(int(C_ID))+" -- Masked pixels: "+str(b['Disabled'])+" -- Fit errors: "+str(b['FitErrors'])+"\nMissing bumps (<"+str(Thr)+" hits): "+str(b['Missing'])+" ("+str(b['Perc_missing'])+"%) -- Low Occ bumps (<"+str(Thr_strange)+" hits): "+str(b['Missing_strange'])+" ("+str(b['Perc_missing_strange'])+"%)")
+        imgplot = ax1.imshow(b['Data'], vmax=VMAX)
+        ax1.set_title("Hit Map (Z Lim: %s hits)" % str(VMAX))
+        ax1.set_aspect(1)
+        _Frame(ax1)
+        bar1=plt.colorbar(imgplot, orientation='horizontal',ax=ax1, extend='max', label='Hits', shrink=1)
+        bar1.cmap.set_over('yellow')
+        cmap = matplotlib.colors.ListedColormap(['orange','blue', 'red', 'white'])
+        bounds = [-1,0,0.9, 1.9, 2.9]
+        norm =matplotlib.colors.BoundaryNorm(bounds, cmap.N)
+        imgplot2 = ax2.imshow(b['Missing_mat'],cmap=cmap,norm=norm)
+        ax2.set_title("Missing Map")
+        ax2.set_aspect(1)
+        _Frame(ax2)
+        bar2=plt.colorbar(imgplot2, ticks=bounds, orientation='horizontal', label='Low Occ   Masked      Missing       Good      ',  spacing='proportional', shrink=1)
+        bar2.set_ticks([])
+        return _Save(fig6,b,'chip_'+str(int(C_ID))+'_Missing_Bumps_Thr_'+str(Thr)+'_'+str(Thr_strange)+'.png',dpi)
+
+# Figures: name -> (function, maps of the bundle it needs). Only the needed maps are sent to the workers.
+_SCALARS = ['Path','Sensor','Voltage_1','C_ID','Thr','Thr_strange','V_adc','Missing','Missing_strange','Perc_missing','Perc_missing_strange','Disabled','FitErrors']
+FIGURES = {
+    'noise_map':      (NoiseMapPlot,      ['NoiseMap']),
+    'noise_hist':     (NoiseHistPlot,     ['NoiseMap']),
+    'threshold_map':  (ThresholdMapPlot,  ['ThrMap']),
+    'tot_map':        (ToTMapPlot,        ['ToTMap']),
+    'tot_map_xray':   (ToTMapXRayPlot,    ['ToTMapX']),
+    'threshold_hist': (ThresholdHistPlot, ['ThrMap']),
+    'hits_hist':      (HitsHistPlot,      ['Data']),
+    'hits_map':       (HitsMapPlot,       ['Data']),
+    'hits_map_zoom':  (HitsMapZoomPlot,   ['Data']),
+    'missing_bumps':  (MissingBumpsPlot,  ['Data','Missing_mat']),
+}
+PLOTSETS = {'full': list(FIGURES), 'summary': ['missing_bumps'], 'none': []}
+
+def _RenderFigure(name,b,dpi):
+    with Stage('plot_'+name): return FIGURES[name][0](b,dpi)
+
+# Renders one figure in a pool worker, its stage records (instrument.py) are sent back with the png name
+def _RenderFigureRemote(name,b,dpi,context):
+    SetContext(*context)
+    file_name = _RenderFigure(name,b,dpi)
+    return file_name, TakeRecords()
+
+# Renders the figures of a plot set, serially (workers <= 1) or in a process pool. Returns the saved png files
+def RenderPlots(bundle,plotset='full',dpi=300,workers=1):
+    names = PLOTSETS[plotset] if isinstance(plotset,str) else list(plotset)
+    if not names: return []
+    if not os.path.exists(bundle['Path']+bundle['Sensor']): os.makedirs(bundle['Path']+bundle['Sensor'])
+    tasks = [(name, {key: bundle[key] for key in _SCALARS+FIGURES[name][1]}) for name in names]
+    if workers is None or workers <= 1:
+        return [_RenderFigure(name,b,dpi) for name,b in tasks]
+    with ProcessPoolExecutor(max_workers=min(workers,len(tasks))) as pool:
+        rendered = list(pool.map(_RenderFigureRemote,[name for name,_ in tasks],[b for _,b in tasks],[dpi]*len(tasks),[Context()]*len(tasks)))
+    for _,records in rendered: Merge(records)
+    return [file_name for file_name,_ in rendered]
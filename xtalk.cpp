@@ -30,12 +30,13 @@ void xtalk(){
     string baseDir = "Detector/Board_0/OpticalGroup_0/Hybrid_0/Chip_";
     string shortBaseDir = "D_B(0)_O(0)_H(0)_";
 
-    for (int ch = 12; ch >= 12; ch--){
+    for (int ch = 15; ch >= 12; ch--){
 
     string chip = to_string(ch);
     string plotDir = "plots/";
     
     TCanvas *c0_pixelalive1 = (TCanvas*) f_injtype1->Get((baseDir+chip+"/"+shortBaseDir+"PixelAlive_Chip("+chip+")").c_str());
+    if (!c0_pixelalive1) continue; // chip not present in this module (e.g. duals only have 12 and 13)
     TH2F *h_pixelalive1 = (TH2F*)c0_pixelalive1->GetPrimitive((shortBaseDir+"PixelAlive_Chip("+chip+")").c_str());
     TCanvas *c0_pixelalive5 = (TCanvas*) f_injtype5->Get((baseDir+chip+"/"+shortBaseDir+"PixelAlive_Chip("+chip+")").c_str());
     TH2F *h_pixelalive5 = (TH2F*)c0_pixelalive5->GetPrimitive((shortBaseDir+"PixelAlive_Chip("+chip+")").c_str());
@@ -0,0 +1,95 @@
+##############################################################################
+# Crosstalk analysis to find the disconnected bumps (python port of xtalk.cpp)
+# Input: 3 PixelAlive root files of the same module taken with injection type 1, 5 and 6
+# Usage: python3 xtalk.py -module <Module ID> -injtype1 <Run #> -injtype5 <Run #> -injtype6 <Run #> [-chip <chip#>]
+# Output: root file with h_confirmed2D per chip (output/xtalk_m-<module>_c-<chip>.root), summary per chip
+# A pixel is a confirmed disconnected bump if it is alive with injection type 1 (> alive_eff) but below
+# coupled_eff with injection type 5 and below uncoupled_eff with injection type 6. The first row (even columns)
+# and the last row (odd columns) have no coupled neighbour and are not detectable.
+# All the chips in the files are analysed in one process, each file is opened once.
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+##############################################################################
+import os
+import argparse
+import numpy as np
+from rootextract import RunFile
+from resultstore import SaveResult, RunName
+
+# Codes of the xtalk status map (1 = MISSING as in classify.py)
+NOT_DETECTABLE = 0; CONFIRMED = 1; DEAD = 2; GOOD = 3
+
+# Analysis of one chip: pa1, pa5, pa6 are the PixelAlive efficiency maps (rows, cols) of injection types 1, 5, 6.
+# Returns the int8 status map (NOT_DETECTABLE, CONFIRMED, DEAD, GOOD)
+def XTalkAnalysis(pa1,pa5,pa6,alive_eff=0.9,coupled_eff=0.5,uncoupled_eff=0.3):
+    nRows, nColumns = pa1.shape
+    dead = pa1 < alive_eff
+    detectable = ~dead
+    columns = np.arange(nColumns)
+    detectable[0, columns%2 == 0] = False
+    detectable[nRows-1, columns%2 == 1] = False
+    confirmed = detectable & (pa1 > alive_eff) & (pa5 < coupled_eff) & (pa6 < uncoupled_eff)
+    status = np.full(pa1.shape, GOOD, dtype=np.int8)
+    status[~detectable] = NOT_DETECTABLE
+    status[dead] = DEAD
+    status[confirmed] = CONFIRMED
+    return status
+
+def XTalkCounts(status):
+    counts = np.bincount(status.ravel(), minlength=4)
+    return {'dead': int(counts[DEAD]), 'suspicious': 0, 'confirmed': int(counts[CONFIRMED])}
+
+# Extracts the PixelAlive maps of all the requested chips (each file opened once) and analyses every chip.
+# Returns {chipID: status map}
+def XTalkModule(injtype1_file,injtype5_file,injtype6_file,chips=None,alive_eff=0.9,coupled_eff=0.5,uncoupled_eff=0.3):
+    from rootextract import ExtractModuleMaps
+    scans = {'PixelAlive':'2D'}
+    pa1 = ExtractModuleMaps(injtype1_file,scans,chips)
+    pa5 = ExtractModuleMaps(injtype5_file,scans,list(pa1))
+    pa6 = ExtractModuleMaps(injtype6_file,scans,list(pa1))
+    return {chip: XTalkAnalysis(pa1[chip]['PixelAlive'],pa5[chip]['PixelAlive'],pa6[chip]['PixelAlive'],alive_eff,coupled_eff,uncoupled_eff)
+            for chip in pa1}
+
+def main():
+    parser = argparse.ArgumentParser(description='Do the crosstalk analysis')
+    parser.add_argument('-module','--module', help = 'The name of the module',                                       default = 'RH00026', type = str)
+    parser.add_argument('-injtype1','--injtype1', help = 'Run # of PixelAlive with injection type 1',                default = 'Run000059', type = str)
+    parser.add_argument('-injtype5','--injtype5', help = 'Run # of PixelAlive with injection type 5',                default = 'Run000060', type = str)
+    parser.add_argument('-injtype6','--injtype6', help = 'Run # of PixelAlive with injection type 6',                default = 'Run000061', type = str)
+    parser.add_argument('-input','--input', help = 'The folder with the root files',                                 default = 'input', type = str)
+    parser.add_argument('-chip','--chip', help = 'The ROC ID(s), comma separated (default: all chips in the files)', default = None, type = str)
+    parser.add_argument('-alive_eff','--alive_eff', help = 'Threshold (as a fraction) for a pixel to be considered alive',         default = 0.9, type = float)
+    parser.add_argument('-coupled_eff','--coupled_eff', help = 'Threshold (as a fraction) for a pixel to be considered coupled',   default = 0.5, type = float)
+    parser.add_argument('-uncoupled_eff','--uncoupled_eff', help = 'Threshold (as a fraction) for a pixel to be considered uncoupled', default = 0.3, type = float)
+    parser.add_argument('-outroot','--outroot', help = 'The folder of the output root files',                        default = 'output/', type = str)
+    parser.add_argument('-noroot','--noroot', help = 'Do not write the root files',                                  action = 'store_true')
+    parser.add_argument('-store','--store', help = 'The result store folder (no store if not given)',                default = None, type = str)
+    parser.add_argument('-verbose','--verbose', help = 'Print the clusters of the confirmed pixels',                  action = 'store_true')
+    args = parser.parse_args()
+
+    chips = None if args.chip is None else [int(chip) for chip in args.chip.split(',')]
+    results = XTalkModule(RunFile(args.injtype1,'PixelAlive',args.input),RunFile(args.injtype5,'PixelAlive',args.input),
+                          RunFile(args.injtype6,'PixelAlive',args.input),chips,
+                          args.alive_eff,args.coupled_eff,args.uncoupled_eff)
+
+    if not args.noroot and not os.path.exists(args.outroot): os.makedirs(args.outroot)
+    for chip,status in sorted(results.items(), reverse=True):
+        counts = XTalkCounts(status)
+        if args.verbose:
+            from clusters import ClusterReport, PrintClusterReport
+            PrintClusterReport(ClusterReport(status),title="Confirmed disconnected bumps of chip "+str(chip))
+        print("chip "+str(chip)+":")
+        print("    alive_eff, coupled_eff, uncoupled_eff: "+str(args.alive_eff)+", "+str(args.coupled_eff)+", "+str(args.uncoupled_eff))
+        print("    dead:        "+str(counts['dead']))
+        print("    suspicious:  "+str(counts['suspicious']))
+        print("    confirmed:   "+str(counts['confirmed']))
+        if not args.noroot:
+            from rootextract import WriteTH2s
+            WriteTH2s(os.path.join(args.outroot,"xtalk_m-"+args.module+"_c-"+str(chip)+".root"),
+                      {'h_confirmed2D': (status == CONFIRMED, "confirmed disconnected channels of chip "+str(chip))})
+        if args.store:
+            params = {'alive_eff': args.alive_eff, 'coupled_eff': args.coupled_eff, 'uncoupled_eff': args.uncoupled_eff}
+            SaveResult(args.store, args.module, chip, 'xtalk', RunName(args.injtype1), status, counts, params)
+
+if __name__ == "__main__":
+    main()